@@ -0,0 +1,163 @@
+"""
+Offline stand-ins for Groq, Tavily and the checkpointer, used by the load test.
+Every fake is deterministic for a given prompt, so runs on different commits see
+the same routing, drafts and judgements.
+"""
+import asyncio
+import hashlib
+import time
+
+from langchain_core.messages import AIMessage
+
+from workflow.schemas import Judger, RouterDecision
+
+
+def prompt_hash(messages) -> int:
+    text = "\n".join(m.content if isinstance(m.content, str) else str(m.content) for m in messages)
+    return int(hashlib.sha256(text.encode()).hexdigest()[:8], 16)
+
+
+def prompt_text(messages) -> str:
+    return "\n".join(m.content for m in messages if isinstance(m.content, str))
+
+
+class FakeChatModel:
+    """
+    Duck-typed ChatGroq for LLMClient: `latency` seconds of time to first token plus
+    `completion_tokens / tokens_per_second`, returning a fenced code answer with usage
+    metadata so token metrics and the sufficiency scorer behave as with a real model.
+    """
+
+    def __init__(self, latency: float = 0.3, tokens_per_second: float = 400, completion_tokens: int = 300,
+                 judge_pass_rate: float = 0.7):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.judge_pass_rate = judge_pass_rate
+
+    def _duration(self, tokens: int) -> float:
+        return self.latency + tokens / self.tokens_per_second
+
+    def _message(self, messages) -> AIMessage:
+        seed = prompt_hash(messages)
+        lines = max(3, self.completion_tokens // 10)
+        body = "\n".join(f"    value_{i} = compute(value_{i - 1}, {seed % (i + 7)})" for i in range(1, lines))
+        content = (
+            "Here is an implementation that handles the request:\n\n"
+            f"```python\ndef solution(value_0):\n{body}\n    return value_{lines - 1}\n```\n\n"
+            "It validates the input and returns the computed result."
+        )
+        prompt_tokens = len(prompt_text(messages)) // 4
+        return AIMessage(content=content, usage_metadata={
+            "input_tokens": prompt_tokens,
+            "output_tokens": self.completion_tokens,
+            "total_tokens": prompt_tokens + self.completion_tokens,
+        })
+
+    def invoke(self, messages, config=None):
+        time.sleep(self._duration(self.completion_tokens))
+        return self._message(messages)
+
+    async def ainvoke(self, messages, config=None):
+        await asyncio.sleep(self._duration(self.completion_tokens))
+        return self._message(messages)
+
+    def with_structured_output(self, schema):
+        return FakeStructuredModel(self, schema)
+
+
+class FakeStructuredModel:
+    """Router and judger decisions derived from the prompt, with a short completion"""
+
+    def __init__(self, model: FakeChatModel, schema):
+        self.model = model
+        self.schema = schema
+
+    def _value(self, messages):
+        text = prompt_text(messages).lower()
+        if self.schema is RouterDecision:
+            query = text.rsplit("current query:", 1)[-1]
+            if any(word in query for word in ("review", "debug", "fix", "bug")):
+                return RouterDecision(router="code_reviewer")
+            if any(word in query for word in ("hello", "thanks", "what is")):
+                return RouterDecision(router="end", reply="Hello!")
+            return RouterDecision(router="code_generation")
+        if self.schema is Judger:
+            return Judger(sufficient=prompt_hash(messages) % 100 < self.model.judge_pass_rate * 100)
+        raise ValueError(f"No fake output for {self.schema.__name__}")
+
+    def invoke(self, messages, config=None):
+        time.sleep(self.model._duration(20))
+        return self._value(messages)
+
+    async def ainvoke(self, messages, config=None):
+        await asyncio.sleep(self.model._duration(20))
+        return self._value(messages)
+
+
+class FakeSearchClient:
+    """Stands in for utils.search.SearchClient (same invoke/ainvoke/stats surface)"""
+
+    def __init__(self, latency: float = 0.4):
+        self.latency = latency
+        self.calls = 0
+
+    def _result(self, query) -> dict:
+        self.calls += 1
+        return {"query": query, "results": [
+            {"url": "https://docs.example.com/guide", "title": "Guide", "content": f"Documentation about {query}. " * 20}
+        ]}
+
+    def search(self, query: str) -> dict:
+        time.sleep(self.latency)
+        return self._result(query)
+
+    async def asearch(self, query: str) -> dict:
+        await asyncio.sleep(self.latency)
+        return self._result(query)
+
+    def invoke(self, input) -> dict:
+        return self.search(input["query"] if isinstance(input, dict) else input)
+
+    async def ainvoke(self, input) -> dict:
+        return await self.asearch(input["query"] if isinstance(input, dict) else input)
+
+    def stats(self) -> dict:
+        return {"fake": True, "outbound": self.calls}
+
+
+def install_fakes(model: FakeChatModel, search: FakeSearchClient, checkpointer: str = "mongo"):
+    """
+    Swap the Groq clients and the Tavily client for fakes, and with checkpointer="memory"
+    recompile the graphs on an in-memory saver so Mongo only serves users and threads.
+    Must run before the first request.
+    """
+    import utils.models as models
+    import utils.search as search_module
+
+    def build_fake_client(role: str):
+        return models.LLMClient(model, models.MODEL_ROLES[role], role=role)
+
+    with models._clients_lock:
+        models._clients.clear()
+        models.build_client = build_fake_client
+    search_module.get_search_client.override(search)
+
+    if checkpointer == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+        import routers.chat_routes as chat_routes
+        import utils.memory as memory
+        import workflow.graph as graph_module
+
+        saver = InMemorySaver()
+        memory.get_checkpointer.override(saver)
+        memory.get_async_checkpointer.override(saver)
+        memory.get_history_checkpointer.override(saver)
+        graph_module.get_graph.override(graph_module.build_workflow().compile(checkpointer=saver))
+        graph_module.get_async_graph.override(graph_module.build_workflow().compile(checkpointer=saver))
+
+        async def alatest_checkpoint_id(thread_id: str):
+            checkpoint = await saver.aget_tuple({"configurable": {"thread_id": thread_id}})
+            return checkpoint.config["configurable"]["checkpoint_id"] if checkpoint else None
+
+        chat_routes.alatest_checkpoint_id = alatest_checkpoint_id
@@ -0,0 +1,304 @@
+"""
+Offline load test of the FastAPI app: fake Groq models, fake Tavily search and a local
+Mongo (or an in-memory checkpointer), driven in-process through httpx's ASGI transport.
+Run from the Coder directory with a local mongod:
+
+    python -m benchmarks.load_test --scenario chat --concurrency 16 --requests 300
+    python -m benchmarks.load_test --scenario mixed --duration 30 --checkpointer memory
+    python -m benchmarks.load_test --scenario history --compare benchmarks/results/<sha>-history.json
+
+Results are written to benchmarks/results/<git sha>-<scenario>.json; --compare prints the
+change against an earlier result and exits with 1 if a latency or throughput metric
+regressed by more than --threshold.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).parent / "results"
+PROTECTED_DATABASES = {"AICoder", "checkpointing_db"}
+
+SCENARIOS = {
+    "chat": {"chat": 1},
+    "history": {"history": 1},
+    "login": {"login": 1},
+    "mixed": {"chat": 2, "history": 5, "threads": 2, "login": 1},
+}
+
+MESSAGES = [
+    "Write a python function that parses a CSV file into dicts",
+    "Can you review this code and fix the bug: def add(a, b): return a - b",
+    "Generate a FastAPI endpoint that returns paginated users",
+    "Hello, what is a binary search?",
+    "Debug this: for i in range(10) print(i)",
+    "Write a javascript debounce helper",
+]
+
+
+def configure_environment(args):
+    """Must run before the app is imported: every module reads its settings at import"""
+    os.environ["MONGO_URI"] = args.mongo_uri
+    os.environ["MONGO_DB_NAME"] = args.db_name
+    os.environ["MONGO_CHECKPOINT_DB_NAME"] = f"{args.db_name}_checkpoints"
+    os.environ["CHAT_JOB_WORKERS"] = "0"
+    os.environ["CHECKPOINT_COMPACTION_INTERVAL"] = "0"
+    os.environ["LLM_CACHE_MONGO"] = "false"
+    os.environ["SEARCH_CACHE_MONGO"] = "false"
+    # Every bench request comes from one client address
+    os.environ["AUTH_MAX_ATTEMPTS_PER_IP"] = "0"
+    os.environ.setdefault("GROQ_API_KEY", "offline")
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    if not args.keep_rate_limits:
+        # Fakes have no quota; keep the scheduler's concurrency cap but not Groq's RPM
+        os.environ["LLM_REQUESTS_PER_MINUTE"] = "0"
+        os.environ["LLM_TOKENS_PER_MINUTE"] = "0"
+
+
+def git_sha() -> str:
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+# =====================================================
+# Load generation
+# =====================================================
+class LoadTest:
+    def __init__(self, client, args):
+        self.client = client
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.users = []  # (email, auth headers, thread_id)
+        # A second message on a busy thread would supersede the first run, so chat
+        # requests check out an idle thread like a real user waiting for the reply
+        self.idle = asyncio.Queue()
+        self.samples = defaultdict(list)  # operation -> [(seconds, ok)]
+
+    async def setup(self):
+        for index in range(self.args.users):
+            email = f"bench-{index}@example.com"
+            await self.client.post("/auth/signup", json={"email": email, "name": "bench", "password": "bench-password"})
+            login = await self.client.post("/auth/login", json={"email": email, "password": "bench-password"})
+            login.raise_for_status()
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+            response = await self.client.post("/chat", headers=headers, json={"message": MESSAGES[index % len(MESSAGES)]})
+            response.raise_for_status()
+            self.users.append((email, headers, response.json()["thread_id"]))
+            self.idle.put_nowait(self.users[-1])
+
+    async def request(self, operation: str, email: str, headers: dict, thread_id: str):
+        if operation == "chat":
+            return await self.client.post("/chat", headers=headers, json={
+                "thread_id": thread_id, "message": self.rng.choice(MESSAGES)
+            })
+        if operation == "history":
+            return await self.client.get(f"/chat/history/{thread_id}", headers=headers, params={"limit": 20})
+        if operation == "threads":
+            return await self.client.get("/chat/threads", headers=headers)
+        return await self.client.post("/auth/login", json={"email": email, "password": "bench-password"})
+
+    async def worker(self, operations: list, weights: list, budget: dict, deadline: float | None):
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            if deadline is None:
+                if budget["left"] <= 0:
+                    return
+                budget["left"] -= 1
+            operation = self.rng.choices(operations, weights)[0]
+            user = await self.idle.get() if operation == "chat" else self.rng.choice(self.users)
+            started = time.perf_counter()
+            try:
+                response = await self.request(operation, *user)
+                ok = response.status_code < 400
+            except Exception as e:
+                print(f"{operation} failed: {e}")
+                ok = False
+            finally:
+                if operation == "chat":
+                    self.idle.put_nowait(user)
+            self.samples[operation].append((time.perf_counter() - started, ok))
+
+    async def run(self) -> float:
+        mix = SCENARIOS[self.args.scenario]
+        operations, weights = list(mix), list(mix.values())
+        budget = {"left": self.args.requests}
+        deadline = time.monotonic() + self.args.duration if self.args.duration else None
+        started = time.perf_counter()
+        await asyncio.gather(*(self.worker(operations, weights, budget, deadline) for _ in range(self.args.concurrency)))
+        return time.perf_counter() - started
+
+
+def summarize(samples: dict, elapsed: float) -> dict:
+    results = {}
+    everything = []
+    for operation, values in sorted(samples.items()):
+        everything.extend(values)
+        results[operation] = summarize_values(values, elapsed)
+    results["all"] = summarize_values(everything, elapsed)
+    return results
+
+
+def summarize_values(values: list, elapsed: float) -> dict:
+    latencies = [seconds for seconds, _ in values]
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "errors": sum(1 for _, ok in values if not ok),
+        "rps": round(len(values) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+def node_report() -> dict:
+    from utils.metrics import node_seconds, llm_seconds
+    nodes = defaultdict(lambda: {"count": 0, "total_s": 0.0})
+    for (node, _outcome), (count, total) in node_seconds.snapshot().items():
+        nodes[node]["count"] += count
+        nodes[node]["total_s"] += total
+    llm = defaultdict(lambda: {"count": 0, "total_s": 0.0})
+    for (role, _model, _outcome), (count, total) in llm_seconds.snapshot().items():
+        llm[role]["count"] += count
+        llm[role]["total_s"] += total
+    return {
+        "nodes": {name: {**v, "mean_ms": round(v["total_s"] / v["count"] * 1000, 1)} for name, v in nodes.items() if v["count"]},
+        "llm_roles": {name: {**v, "mean_ms": round(v["total_s"] / v["count"] * 1000, 1)} for name, v in llm.items() if v["count"]},
+    }
+
+
+# =====================================================
+# Output
+# =====================================================
+def print_report(report: dict):
+    print(f"\n{report['scenario']} @ {report['git_sha']}  concurrency={report['config']['concurrency']}  "
+          f"elapsed={report['elapsed_s']}s")
+    print(f"{'operation':<10}{'count':>8}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for operation, stats in report["results"].items():
+        if stats.get("count"):
+            print(f"{operation:<10}{stats['count']:>8}{stats['errors']:>8}{stats['rps']:>9}"
+                  f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    for section in ("nodes", "llm_roles"):
+        print(f"\n{section:<16}{'count':>8}{'mean ms':>10}{'total s':>10}")
+        for name, stats in sorted(report["timings"][section].items(), key=lambda item: -item[1]["total_s"]):
+            print(f"{name:<16}{stats['count']:>8}{stats['mean_ms']:>10}{stats['total_s']:>10.1f}")
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> bool:
+    """Print deltas against `baseline`; True if any metric regressed beyond threshold"""
+    regressed = False
+    print(f"\nvs {baseline['git_sha']} (threshold {threshold:.0%})")
+    for operation, stats in report["results"].items():
+        base = baseline["results"].get(operation)
+        if not stats.get("count") or not base or not base.get("count"):
+            continue
+        for metric, higher_is_worse in (("p50_ms", True), ("p95_ms", True), ("p99_ms", True), ("rps", False)):
+            old, new = base[metric], stats[metric]
+            change = (new - old) / old if old else 0.0
+            worse = change > threshold if higher_is_worse else change < -threshold
+            regressed |= worse
+            print(f"  {operation:<10}{metric:<8}{old:>10}{new:>10}{change:>+9.1%}{'  REGRESSION' if worse else ''}")
+    return regressed
+
+
+async def main_async(args) -> dict:
+    import httpx
+    from pymongo import AsyncMongoClient
+    from benchmarks.fakes import FakeChatModel, FakeSearchClient, install_fakes
+    from main import app
+
+    if not args.keep_data:
+        mongo = AsyncMongoClient(args.mongo_uri)
+        await mongo.drop_database(args.db_name)
+        await mongo.drop_database(f"{args.db_name}_checkpoints")
+        await mongo.close()
+
+    install_fakes(
+        FakeChatModel(latency=args.llm_latency, tokens_per_second=args.llm_tps, completion_tokens=args.llm_tokens),
+        FakeSearchClient(latency=args.search_latency),
+        checkpointer=args.checkpointer,
+    )
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            test = LoadTest(client, args)
+            await test.setup()
+            # Only the measured phase goes into the node timings
+            from utils.metrics import node_seconds, llm_seconds
+            node_seconds._values.clear()
+            llm_seconds._values.clear()
+            elapsed = await test.run()
+
+    return {
+        "git_sha": git_sha(),
+        "scenario": args.scenario,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("compare", "output", "mongo_uri")},
+        "elapsed_s": round(elapsed, 2),
+        "results": summarize(test.samples, elapsed),
+        "timings": node_report(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="total requests (ignored with --duration)")
+    parser.add_argument("--duration", type=float, help="run for this many seconds instead of a request count")
+    parser.add_argument("--users", type=int, default=20, help="bench users, each with one seeded thread")
+    parser.add_argument("--checkpointer", choices=["mongo", "memory"], default="mongo")
+    parser.add_argument("--mongo-uri", default=os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="coder_bench", help="dropped and recreated unless --keep-data")
+    parser.add_argument("--keep-data", action="store_true")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="apply LLM_REQUESTS/TOKENS_PER_MINUTE to the fakes")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="fake time to first token, seconds")
+    parser.add_argument("--llm-tps", type=float, default=400, help="fake completion tokens per second")
+    parser.add_argument("--llm-tokens", type=int, default=300, help="fake completion length")
+    parser.add_argument("--search-latency", type=float, default=0.4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="result file (default benchmarks/results/<sha>-<scenario>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    if args.db_name in PROTECTED_DATABASES:
+        raise SystemExit(f"Refusing to benchmark against the {args.db_name} database")
+
+    configure_environment(args)
+    report = asyncio.run(main_async(args))
+    print_report(report)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{report['git_sha']}-{args.scenario}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nSaved {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Time to assemble the node prompts (token counting, budgets, code-aware truncation)
+for threads of different lengths, with a cold and a warm token-count cache.
+Run from the Coder directory:
+
+    python -m benchmarks.prompt_bench
+    python -m benchmarks.prompt_bench --turns 4 40 200 --repeat 200
+"""
+import argparse
+import random
+import statistics
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from benchmarks.serializer_bench import fake_code
+from workflow.nodes import answer_messages, code_generation_messages, router_context
+from workflow.prompts import count_tokens, get_encoding
+
+
+def fake_state(turns: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    messages = []
+    for turn in range(turns):
+        messages.append(HumanMessage(content=f"Fix this function #{turn}:\n```python\n{fake_code(rng, rng.randint(5, 60))}```"))
+        messages.append(AIMessage(content=f"Here is the fix:\n\n```python\n{fake_code(rng, rng.randint(10, 80))}```\n\nIt now handles empty input."))
+    messages.append(HumanMessage(content="Now add type hints and tests:\n```python\n" + fake_code(rng, 120) + "```"))
+    return {
+        "messages": messages,
+        "code_generation": "```python\n" + fake_code(rng, 150) + "```",
+        "code_reviewer": "",
+        "web": str([{"url": "https://example.com", "content": "docs " * 400}]),
+        "summary": "The user is building an order processing service in Python. " * 5 if turns > 6 else "",
+        "summarized_count": max(0, turns * 2 - 6),
+    }
+
+
+def time_us(fn, repeat: int, cold: bool) -> float:
+    samples = []
+    for _ in range(repeat):
+        if cold:
+            count_tokens.cache_clear()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[2, 10, 50])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"tokenizer: {'tiktoken' if get_encoding() else 'estimate (len/4)'}")
+    print(f"{'turns':>6}{'prompt':>16}{'tokens':>8}{'cold us':>10}{'warm us':>10}")
+    for turns in args.turns:
+        state = fake_state(turns, seed=turns)
+        query = state["messages"][-1].content
+        builders = {
+            "router": lambda: router_context(state, query),
+            "code_generation": lambda: code_generation_messages(state, query),
+            "answer": lambda: answer_messages(state),
+        }
+        for name, build in builders.items():
+            result = build()
+            text = "\n".join(result.values()) if isinstance(result, dict) else "\n".join(m.content for m in result)
+            cold = time_us(build, args.repeat, cold=True)
+            warm = time_us(build, args.repeat, cold=False)
+            print(f"{turns:>6}{name:>16}{count_tokens(text):>8}{cold:>10.0f}{warm:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
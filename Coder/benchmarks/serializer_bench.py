@@ -0,0 +1,112 @@
+"""
+Size ratio and per-checkpoint encode/decode time of the zstd checkpoint serializer
+against LangGraph's default one. Run from the Coder directory:
+
+    python -m benchmarks.serializer_bench                       # synthetic threads
+    python -m benchmarks.serializer_bench --turns 5 20 80 --level 3
+    python -m benchmarks.serializer_bench --from-mongo 500      # real checkpoints
+    python -m benchmarks.serializer_bench --dict checkpoints.dict
+"""
+import argparse
+import random
+import statistics
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from utils.serializer import ZstdSerializer, load_dictionary
+
+WORDS = ["user", "order", "item", "total", "value", "result", "data", "config", "client", "cache", "node", "index"]
+LANGUAGES = ["python", "javascript", "sql"]
+
+
+def fake_code(rng: random.Random, lines: int) -> str:
+    body = []
+    for _ in range(lines):
+        a, b = rng.choice(WORDS), rng.choice(WORDS)
+        body.append(f"    {a}_{b} = compute_{a}({b}, limit={rng.randint(1, 100)})")
+    return f"def handle_{rng.choice(WORDS)}(request):\n" + "\n".join(body) + "\n    return result\n"
+
+
+def fake_thread(turns: int, seed: int = 0) -> dict:
+    """A checkpoint shaped like ours: a growing message list with code-heavy answers"""
+    rng = random.Random(seed)
+    messages = []
+    for turn in range(turns):
+        language = rng.choice(LANGUAGES)
+        messages.append(HumanMessage(content=f"Write a {language} function that handles {rng.choice(WORDS)} #{turn}"))
+        answer = (
+            f"Here is a {language} implementation:\n\n```{language}\n{fake_code(rng, rng.randint(10, 40))}```\n\n"
+            "It validates the input, computes each value and returns the result. "
+            f"Web context: {{'url': 'https://example.com/{rng.choice(WORDS)}', 'content': '{rng.choice(WORDS)} docs ...'}}"
+        )
+        messages.append(AIMessage(content=answer))
+    return {
+        "v": 4,
+        "id": f"checkpoint-{turns}",
+        "ts": "2025-01-01T00:00:00+00:00",
+        "channel_values": {"messages": messages, "router": "answer", "code_generation": "", "web": ""},
+        "channel_versions": {"messages": turns * 2, "router": turns},
+        "versions_seen": {"router": {"messages": turns * 2}},
+    }
+
+
+def mongo_checkpoints(limit: int) -> list:
+    from utils.memory import get_checkpointer
+    values = []
+    for checkpoint in get_checkpointer().list(None, limit=limit):
+        values.append(checkpoint.checkpoint)
+    return values
+
+
+def measure(serializer, values: list, repeat: int) -> dict:
+    sizes, encode, decode = [], [], []
+    for value in values:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            typed = serializer.dumps_typed(value)
+            encode.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            serializer.loads_typed(typed)
+            decode.append(time.perf_counter() - started)
+        sizes.append(len(typed[1]))
+    return {
+        "bytes": sum(sizes),
+        "encode_us": statistics.mean(encode) * 1e6,
+        "decode_us": statistics.mean(decode) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[2, 10, 40], help="synthetic thread lengths")
+    parser.add_argument("--from-mongo", type=int, metavar="N", help="benchmark the newest N stored checkpoints instead")
+    parser.add_argument("--level", type=int, default=3, help="zstd compression level")
+    parser.add_argument("--dict", help="zstd dictionary file")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    baseline = JsonPlusSerializer()
+    compressed = ZstdSerializer(level=args.level, dictionary=load_dictionary(args.dict) if args.dict else None)
+
+    if args.from_mongo:
+        datasets = [(f"mongo x{args.from_mongo}", mongo_checkpoints(args.from_mongo))]
+    else:
+        datasets = [(f"{turns} turns", [fake_thread(turns, seed=turns)]) for turns in args.turns]
+
+    print(f"{'dataset':<16}{'raw KiB':>10}{'zstd KiB':>10}{'ratio':>8}{'enc us':>10}{'zstd enc':>10}{'dec us':>10}{'zstd dec':>10}")
+    for name, values in datasets:
+        if not values:
+            print(f"{name:<16} no checkpoints")
+            continue
+        raw = measure(baseline, values, args.repeat)
+        zstd = measure(compressed, values, args.repeat)
+        print(
+            f"{name:<16}{raw['bytes'] / 1024:>10.1f}{zstd['bytes'] / 1024:>10.1f}{raw['bytes'] / zstd['bytes']:>8.2f}"
+            f"{raw['encode_us']:>10.0f}{zstd['encode_us']:>10.0f}{raw['decode_us']:>10.0f}{zstd['decode_us']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
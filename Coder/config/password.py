@@ -1,9 +1,131 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
 from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from utils.lazy import singleton
+from utils.metrics import password_seconds
+
+load_dotenv()
+
+# bcrypt cost factor; stored hashes with another cost are rehashed on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Processes doing bcrypt off the request path; 0 hashes on the request thread pool
+# instead (serverless hosts, where one request per instance makes a pool pointless)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "0" if os.getenv("VERCEL") else "2"))
+# Hash/verify calls allowed to wait for a worker before new ones are refused with 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(password: str, hashed_password: str) -> bool:
     return pwd_context.verify(password, hashed_password)
+
+def verify_and_update(password: str, hashed_password: str) -> tuple:
+    """(valid, new hash or None); a new hash when the stored one has a different cost"""
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+# =====================================================
+# Process pool
+# =====================================================
+class PasswordHasherBusy(Exception):
+    """Too many hash/verify calls are already waiting for a worker"""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in worker processes so it holds neither the GIL nor a request thread.
+    At most `workers` calls run at once (at least one without a pool); beyond
+    `max_pending` waiting calls, new ones fail fast with PasswordHasherBusy.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._slots = asyncio.Semaphore(max(1, workers))
+        self.waiting = 0
+        self.active = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking would copy the Mongo clients' sockets and background threads
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def _run(self, operation: str, fn, *args):
+        if self.waiting >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        started, outcome, queued = time.perf_counter(), "error", True
+        self.waiting += 1
+        try:
+            async with self._slots:
+                self.waiting -= 1
+                queued = False
+                self.active += 1
+                try:
+                    if self.workers > 0:
+                        result = await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+                    else:
+                        result = await run_in_threadpool(fn, *args)
+                    outcome = "ok"
+                    return result
+                except BrokenProcessPool:
+                    # A worker died (OOM kill, ...); start a fresh pool for the next call
+                    self._executor = None
+                    raise
+                finally:
+                    self.active -= 1
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            if queued:
+                # Cancelled while waiting for a slot
+                self.waiting -= 1
+            # Queue wait included: this is what the request experiences
+            password_seconds.observe(time.perf_counter() - started, operation=operation, outcome=outcome)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", hash_password, password)
+
+    async def verify(self, password: str, hashed_password: str) -> tuple:
+        """(valid, new hash or None), see verify_and_update"""
+        return await self._run("verify", verify_and_update, password, hashed_password)
+
+    async def warm_up(self):
+        """Start the worker processes now rather than on the first login"""
+        if self.workers > 0:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            await asyncio.gather(*(loop.run_in_executor(executor, os.getpid) for _ in range(self.workers)))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "rounds": BCRYPT_ROUNDS,
+            "queue_depth": self.waiting,
+            "active": self.active,
+            "rejected": self.rejected,
+        }
+
+
+@singleton
+def get_password_hasher() -> PasswordHasher:
+    return PasswordHasher()
@@ -1,11 +1,80 @@
-from fastapi import FastAPI
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
 
 # Import routers
 from routers import user  # Auth routes
 from routers import chat_routes  # Chat routes
+from utils.models import get_response_cache, model_latency_report
+from utils.search import get_search_client
+from utils.scheduler import get_scheduler
+from workflow.sufficiency import decision_stats
+from workflow.speculation import speculation_stats
+from utils.retention import CHECKPOINT_COMPACTION_INTERVAL, run_compaction_loop
+from utils.jobs import start_job_workers
+from utils.idempotency import idempotency_stats
+from utils.cancellation import cancellation_stats
+from utils.users import auth_stats, admin_user
+from utils.indexes import MONGO_INDEX_BOOTSTRAP, ensure_indexes, index_report
+from utils.memory import pool_monitor
+from utils.throttle import throttle_stats
+from config.password import get_password_hasher
+from utils.metrics import registry, http_request_seconds, CONTENT_TYPE
+from utils.tracing import trace_id_var, new_trace_id, log_event, TRACE_HEADER
 
-app = FastAPI()
+# Build clients, checkpointers and graphs at startup rather than on the first chat.
+# Off on Vercel, where a cold start should only pay for what its request needs.
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "false" if os.getenv("VERCEL") else "true").lower() == "true"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: make sure the indexes the request path relies on exist
+    if MONGO_INDEX_BOOTSTRAP:
+        try:
+            await ensure_indexes()
+        except Exception as e:
+            log_event("index_bootstrap_error", error=str(e))
+
+    # bcrypt worker processes, started before the first login instead of during it
+    password_hasher = get_password_hasher()
+    try:
+        await password_hasher.warm_up()
+    except Exception as e:
+        log_event("password_warm_up_error", error=str(e))
+
+    if WARM_UP_ON_STARTUP:
+        # Imported here so that importing the app does not load LangGraph and the workflow
+        from workflow.graph import warm_up
+
+        try:
+            await run_in_threadpool(warm_up)
+        except Exception as e:
+            log_event("warm_up_error", error=str(e))
+
+    # Background /chat/jobs runners (CHAT_JOB_WORKERS, 0 on serverless hosts)
+    job_workers = start_job_workers()
+
+    # Periodic checkpoint compaction on long-running hosts
+    compaction = None
+    if CHECKPOINT_COMPACTION_INTERVAL > 0:
+        compaction = asyncio.create_task(run_compaction_loop(CHECKPOINT_COMPACTION_INTERVAL))
+
+    yield
+
+    if compaction:
+        compaction.cancel()
+    if job_workers:
+        job_workers.stop()
+    password_hasher.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow frontend origin
 origins = [
@@ -19,12 +88,72 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],            
     allow_headers=["*"],            
+    expose_headers=[TRACE_HEADER],
 )
 
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Trace id per request (X-Request-ID in and out), latency histogram and one JSON log line"""
+    trace_id = new_trace_id(request.headers.get(TRACE_HEADER))
+    token = trace_id_var.set(trace_id)
+    started, status = time.perf_counter(), 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers[TRACE_HEADER] = trace_id
+        return response
+    finally:
+        # Streaming responses are measured up to their first byte
+        seconds = time.perf_counter() - started
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        http_request_seconds.observe(seconds, method=request.method, route=path, status=status)
+        log_event("http_request", method=request.method, route=path, status=status, duration_ms=round(seconds * 1000, 1))
+        trace_id_var.reset(token)
+
+
+# Point-in-time values, read when /metrics is scraped
+registry.gauge("coder_llm_queue_depth", "LLM calls waiting for the scheduler",
+               lambda: get_scheduler().stats()["queue_depth"])
+registry.gauge("coder_llm_active_calls", "LLM calls in flight", lambda: get_scheduler().stats()["active"])
+registry.gauge("coder_password_queue_depth", "bcrypt calls waiting for a password worker",
+               lambda: get_password_hasher().stats()["queue_depth"])
+registry.gauge("coder_password_active", "bcrypt calls running", lambda: get_password_hasher().stats()["active"])
+registry.gauge("coder_mongo_pool_open_connections", "Open pooled Mongo connections", lambda: pool_monitor.stats()["open"])
+registry.gauge("coder_mongo_pool_in_use_connections", "Checked-out Mongo connections", lambda: pool_monitor.stats()["in_use"])
+registry.gauge("coder_graph_runs_active", "Graph runs in flight in this process",
+               lambda: cancellation_stats()["active"])
+
 @app.get("/")
 def home():
     return {"message": "Welcome to FastAPI Backend!"}
 
+@app.get("/stats", dependencies=[Depends(admin_user)])
+def stats():
+    """Runtime counters for tuning (cache hit rates, ...); ADMIN_EMAILS users only"""
+    response_cache = get_response_cache()
+    return {
+        "llm_cache": response_cache.stats() if response_cache else None,
+        "sufficiency_decisions": decision_stats(),
+        "model_latency": model_latency_report(),
+        "speculative_search": speculation_stats(),
+        "web_search": get_search_client().stats(),
+        "llm_scheduler": get_scheduler().stats(),
+        "idempotency": idempotency_stats(),
+        "graph_runs": cancellation_stats(),
+        "auth_cache": auth_stats(),
+        "password_hashing": get_password_hasher().stats(),
+        "auth_throttle": throttle_stats(),
+        "mongo_pool": pool_monitor.stats(),
+        "indexes": index_report(),
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
 # Include routers
 app.include_router(user.router, prefix="/auth", tags=["Users"])
 app.include_router(chat_routes.router, prefix="", tags=["Chat"])
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional, Any
 from bson import ObjectId
+from datetime import datetime
 
 class User(BaseModel):
     id: Optional[str] = Field(alias="_id")  
@@ -34,7 +35,7 @@ class UserResponse(BaseModel):
 # ---------------- Request Schemas ----------------
 class ChatRequest(BaseModel):
     message: str
-    email: EmailStr
+    email: Optional[EmailStr] = None  # Deprecated: the caller comes from the bearer token
     thread_id: Optional[str] = None  # Optional: if not provided, backend generates a new one
 
 # ---------------- Response Schemas ----------------
@@ -42,9 +43,28 @@ class ChatResponse(BaseModel):
     thread_id: str
     response: str
 
+class ChatJobResponse(BaseModel):
+    job_id: str
+    thread_id: str
+    status: str  # queued | running | done | failed
+    response: Optional[str] = None  # set once status == "done"
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 class ChatHistoryResponse(BaseModel):
     thread_id: str
-    messages: List  
+    messages: List
+    total: int = 0  # number of pairs in the whole thread
+    next_before: Optional[int] = None  # pass back as ?before= for the previous page
+
+class ThreadSummary(BaseModel):
+    thread_id: str
+    title: str = ""
+    message_count: int = 0
+    updated_at: Optional[datetime] = None
 
 class UserThreadsResponse(BaseModel):
-    thread_ids: List
\ No newline at end of file
+    thread_ids: List  # ids of `threads`, kept for older clients
+    threads: List[ThreadSummary] = []
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page
\ No newline at end of file
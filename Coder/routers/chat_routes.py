@@ -1,86 +1,266 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Header, Request
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
 from typing import Optional, List
+import json
 import uuid
-from utils.memory import user_collection
-from workflow.graph import load_conversation , run_graph_with_message
-from model.users import ChatHistoryResponse, ChatRequest,ChatResponse, UserThreadsResponse
+from utils.memory import alatest_checkpoint_id
+from utils.threads import create_thread, touch_thread, list_threads
+from utils.users import current_user, user_owns_thread, remember_thread
+from utils.jobs import enqueue_job, get_job, wait_for_job
+from utils.idempotency import run_idempotent, request_fingerprint, IdempotencyConflict, IdempotencyInProgress
+from utils.cancellation import start_run, finish_run, run_cancellable, RunCancelled, SUPERSEDED
+from utils.tracing import log_event
+from model.users import ChatHistoryResponse, ChatRequest,ChatResponse, UserThreadsResponse, ChatJobResponse
 
 router = APIRouter()
 
 
+async def run_chat(user: dict, request: ChatRequest, is_disconnected=None) -> dict:
+    # Imported here so that importing the app does not load LangGraph and the workflow
+    from workflow.graph import arun_graph_with_message
+
+    if request.thread_id:
+        thread_id = request.thread_id
+    else:
+        # Generate new thread_id, but don't save yet
+        thread_id = str(uuid.uuid4())
+
+    # Only create the thread if user sends a message
+    if request.message.strip():
+        if not request.thread_id:
+            await create_thread(user["_id"], thread_id, request.message)
+            remember_thread(user, thread_id)
+        # Run AI workflow; a newer message on the thread or a client disconnect cancels it
+        handle = start_run(thread_id)
+        try:
+            response_text = await run_cancellable(
+                handle, lambda: arun_graph_with_message(thread_id, request.message), is_disconnected
+            )
+        finally:
+            finish_run(handle)
+        await touch_thread(thread_id)
+    else:
+        response_text = ""
+
+    return {"thread_id": thread_id, "response": response_text}
+
+
 @router.post("/chat", response_model=ChatResponse)
-def send_or_resume_chat(request: ChatRequest):
+async def send_or_resume_chat(
+    request: ChatRequest,
+    http_request: Request,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    user: dict = Depends(current_user),
+):
     """
     Send a message to AI workflow.
     - If thread_id exists, continue conversation.
     - If not, generate a new thread_id and only save it after a message is sent.
+    - Retries carrying the same Idempotency-Key get the original run's response
+      (and thread_id) instead of running the workflow again.
     """
     try:
-        user = user_collection.find_one({"email": request.email})
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        if request.thread_id:
-            # Resume existing chat
-            if request.thread_id not in user.get("thread_ids", []):
-                raise HTTPException(status_code=404, detail="Thread ID not found for this user")
-            thread_id = request.thread_id
-        else:
-            # Generate new thread_id, but don't save yet
-            thread_id = str(uuid.uuid4())
-        
-        # Only push thread_id to DB if user sends a message
-        if request.message.strip():
-            if not request.thread_id:
-                user_collection.update_one(
-                    {"_id": user["_id"]},
-                    {"$push": {"thread_ids": thread_id}}
-                )
-            # Run AI workflow
-            response_text = run_graph_with_message(thread_id, request.message)
+        # Resume existing chat
+        if request.thread_id and not await user_owns_thread(user, request.thread_id):
+            raise HTTPException(status_code=404, detail="Thread ID not found for this user")
+
+        if idempotency_key:
+            # A client sending a key retries after a dropped connection, so the run is only
+            # cancelled once no request (original or retry) has been attached for a grace period
+            fingerprint = request_fingerprint(str(user["_id"]), request.thread_id, request.message)
+            result = await run_idempotent(
+                user["_id"], idempotency_key, fingerprint,
+                lambda is_disconnected: run_chat(user, request, is_disconnected),
+                http_request.is_disconnected,
+            )
         else:
-            response_text = ""
-        
-        return ChatResponse(
-            thread_id=thread_id,
-            response=response_text
-        )
-    
+            result = await run_chat(user, request, http_request.is_disconnected)
+
+        return ChatResponse(**result)
+
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    except IdempotencyInProgress:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    except RunCancelled as e:
+        detail = "Superseded by a newer message on this thread" if e.reason == SUPERSEDED else "Client disconnected"
+        raise HTTPException(status_code=409, detail=detail)
     except HTTPException:
         # Re-raise HTTP exceptions as-is
         raise
     except Exception as e:
         # Handle unexpected errors
-        print(f"Unexpected error in send_or_resume_chat: {e}")
+        log_event("chat_error", route="/chat", error=str(e))
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+def job_response(job: dict) -> ChatJobResponse:
+    return ChatJobResponse(
+        job_id=job["_id"],
+        thread_id=job["thread_id"],
+        status=job["status"],
+        response=job.get("response"),
+        error=job.get("error"),
+        created_at=job.get("created_at"),
+        finished_at=job.get("finished_at")
+    )
+
+
+@router.post("/chat/jobs", response_model=ChatJobResponse, status_code=202)
+async def submit_chat_job(request: ChatRequest, user: dict = Depends(current_user)):
+    """
+    Same input as /chat, but only enqueues the workflow run and returns at once.
+    Poll GET /chat/jobs/{job_id} (optionally with ?wait=) for the response.
+    """
+    if request.thread_id:
+        if not await user_owns_thread(user, request.thread_id):
+            raise HTTPException(status_code=404, detail="Thread ID not found for this user")
+        thread_id = request.thread_id
+    else:
+        thread_id = str(uuid.uuid4())
+
+    if not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message must not be empty")
+
+    if not request.thread_id:
+        await create_thread(user["_id"], thread_id, request.message)
+        remember_thread(user, thread_id)
+
+    job = await enqueue_job(user["_id"], thread_id, request.message)
+    return job_response(job)
+
+
+@router.get("/chat/jobs/{job_id}", response_model=ChatJobResponse)
+async def get_chat_job(job_id: str, wait: float = Query(0, ge=0, le=30), user: dict = Depends(current_user)):
+    """
+    Status of a chat job, with its response once done.
+    - wait: long-poll for up to this many seconds until the job has finished.
+    """
+    if wait:
+        job = await wait_for_job(job_id, user["_id"], wait)
+    else:
+        job = await get_job(job_id, user["_id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found for this user")
+    return job_response(job)
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Encode one Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/chat/stream")
+async def stream_chat(request: ChatRequest, user: dict = Depends(current_user)):
+    """
+    Same contract as /chat, but streams the workflow as Server-Sent Events:
+    `start`, `node` transitions, `token` deltas of the final answer (`discard` drops the
+    tokens streamed so far for a rejected draft) and a terminal `done` event carrying the
+    thread_id (or `error` if the run fails, `cancelled` if a newer message superseded it).
+    A client disconnect stops the run, as the response task is cancelled with it.
+    """
+    if request.thread_id:
+        if not await user_owns_thread(user, request.thread_id):
+            raise HTTPException(status_code=404, detail="Thread ID not found for this user")
+        thread_id = request.thread_id
+    else:
+        thread_id = str(uuid.uuid4())
+
+    if not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message must not be empty")
+
+    if not request.thread_id:
+        await create_thread(user["_id"], thread_id, request.message)
+        remember_thread(user, thread_id)
+
+    from workflow.graph import astream_graph_with_message
+
+    async def event_stream():
+        # Flush something immediately so the client gets its first byte before any LLM call
+        yield format_sse("start", {"thread_id": thread_id})
+        handle = start_run(thread_id)
+        try:
+            async for event, data in astream_graph_with_message(thread_id, request.message, handle):
+                if event == "done":
+                    await touch_thread(thread_id)
+                yield format_sse(event, data)
+        except RunCancelled as e:
+            yield format_sse("cancelled", {"thread_id": thread_id, "reason": e.reason})
+        except Exception as e:
+            log_event("chat_error", route="/chat/stream", error=str(e))
+            yield format_sse("error", {"thread_id": thread_id, "detail": "Internal server error"})
+        finally:
+            finish_run(handle)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
 @router.get("/chat/history/{thread_id}", response_model=ChatHistoryResponse)
-def get_chat_history(thread_id: str, email: str ):
+async def get_chat_history(
+    thread_id: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    before: Optional[int] = Query(None, ge=0),
+    if_none_match: Optional[str] = Header(None),
+    user: dict = Depends(current_user),
+):
     """
-    Fetch full conversation history for a given thread_id
+    Fetch conversation history for a given thread_id from its latest checkpoint.
+    - limit/before page backwards through the pairs: the newest `limit` pairs with index < before.
+    - The ETag is the checkpoint id; a matching If-None-Match gets an empty 304.
     """
-    user = user_collection.find_one({"email": email})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    if thread_id not in user.get("thread_ids", []):
+    if not await user_owns_thread(user, thread_id):
         raise HTTPException(status_code=404, detail="Thread ID not found for this user")
 
-    messages = load_conversation(thread_id)
+    # Cheap projection query first so polling clients never pay for deserialization
+    checkpoint_id = await alatest_checkpoint_id(thread_id)
+    if checkpoint_id and etag_matches(if_none_match, f'"{checkpoint_id}"'):
+        return Response(status_code=304, headers={"ETag": f'"{checkpoint_id}"'})
+
+    from workflow.graph import aload_history
+
+    checkpoint_id, pairs = await aload_history(thread_id)
+    if checkpoint_id:
+        response.headers["ETag"] = f'"{checkpoint_id}"'
+
+    end = len(pairs) if before is None else min(before, len(pairs))
+    start = 0 if limit is None else max(0, end - limit)
     return ChatHistoryResponse(
         thread_id=thread_id,
-        messages=messages
+        messages=pairs[start:end],
+        total=len(pairs),
+        next_before=start if start > 0 else None
     )
 
 
-@router.get("/chat/threads")
-def get_user_threads(email: str):
-    user = user_collection.find_one({"email": email})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    thread_ids = user.get("thread_ids", [])
-    return UserThreadsResponse(thread_ids=thread_ids)
+@router.get("/chat/threads", response_model=UserThreadsResponse)
+async def get_user_threads(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    user: dict = Depends(current_user),
+):
+    """
+    List the user's threads, most recently active first, one page at a time.
+    """
+    try:
+        threads, next_cursor = await list_threads(user["_id"], limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
+    return UserThreadsResponse(
+        thread_ids=[thread["thread_id"] for thread in threads],
+        threads=threads,
+        next_cursor=next_cursor
+    )
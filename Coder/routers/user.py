@@ -1,7 +1,11 @@
-from fastapi import APIRouter, HTTPException
-from utils.memory import user_collection
+import math
+from fastapi import APIRouter, HTTPException, Request
+from pymongo.errors import DuplicateKeyError
+from utils.memory import get_async_user_collection
+from utils.metrics import auth_throttled
+from utils.throttle import account_failures, ip_attempts, client_ip
 from model.users import UserSignup, UserLogin, UserResponse
-from config.password import hash_password, verify_password
+from config.password import get_password_hasher, PasswordHasherBusy
 from config.auth import create_access_token, verify_access_token
 
 router = APIRouter(
@@ -10,32 +14,82 @@ router = APIRouter(
 )
 
 
+def too_many_attempts(scope: str, retry_after: float) -> HTTPException:
+    auth_throttled.inc(scope=scope)
+    return HTTPException(
+        status_code=429,
+        detail="Too many attempts, try again later",
+        headers={"Retry-After": str(math.ceil(retry_after))},
+    )
+
+
+def hasher_busy() -> HTTPException:
+    return HTTPException(status_code=503, detail="Server busy, try again shortly", headers={"Retry-After": "1"})
+
+
 @router.post("/signup", response_model=UserResponse)
-def signup(user: UserSignup):
-    existing_user = user_collection.find_one({"email": user.email})
+async def signup(user: UserSignup, request: Request):
+    # Throttle before any bcrypt work, the expensive part of this route
+    ip = client_ip(request)
+    retry_after = ip_attempts.retry_after(ip)
+    if retry_after:
+        raise too_many_attempts("ip", retry_after)
+    ip_attempts.record(ip)
+
+    existing_user = await get_async_user_collection().find_one({"email": user.email})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_pw = hash_password(user.password)
+    # bcrypt is CPU bound, it runs in the password worker processes
+    try:
+        hashed_pw = await get_password_hasher().hash(user.password)
+    except PasswordHasherBusy:
+        raise hasher_busy()
     user_dict = {"email": user.email,"name": user.name, "password": hashed_pw, "thread_ids": []}
-    result = user_collection.insert_one(user_dict)
-    new_user = user_collection.find_one({"_id": result.inserted_id})
+    try:
+        result = await get_async_user_collection().insert_one(user_dict)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent signup for the same email (unique index)
+        raise HTTPException(status_code=400, detail="Email already registered")
 
     return UserResponse(
-        id=str(new_user["_id"]),
-        email=new_user["email"],
-        thread_ids=new_user["thread_ids"]
+        id=str(result.inserted_id),
+        email=user_dict["email"],
+        thread_ids=user_dict["thread_ids"]
     )
 
 
 @router.post("/login")
-def login(user: UserLogin):
-    existing_user = user_collection.find_one({"email": user.email})
+async def login(user: UserLogin, request: Request):
+    # Throttle before any bcrypt work: per client IP, and per account after failed attempts
+    ip, account = client_ip(request), user.email.lower()
+    retry_after = ip_attempts.retry_after(ip)
+    if retry_after:
+        raise too_many_attempts("ip", retry_after)
+    retry_after = account_failures.retry_after(account)
+    if retry_after:
+        raise too_many_attempts("account", retry_after)
+    ip_attempts.record(ip)
+
+    existing_user = await get_async_user_collection().find_one({"email": user.email})
     if not existing_user:
+        account_failures.record(account)
         raise HTTPException(status_code=400, detail="Invalid email or password")
 
-    if not verify_password(user.password, existing_user["password"]):
+    try:
+        valid, new_hash = await get_password_hasher().verify(user.password, existing_user["password"])
+    except PasswordHasherBusy:
+        raise hasher_busy()
+    if not valid:
+        account_failures.record(account)
         raise HTTPException(status_code=400, detail="Invalid email or password")
+    account_failures.reset(account)
+
+    if new_hash:
+        # BCRYPT_ROUNDS changed since this hash was made; the password is at hand, so upgrade it
+        await get_async_user_collection().update_one(
+            {"_id": existing_user["_id"], "password": existing_user["password"]}, {"$set": {"password": new_hash}}
+        )
 
     # Generate JWT
     access_token = create_access_token({"sub": str(existing_user["_id"])})
@@ -0,0 +1,35 @@
+"""
+Standalone runner for /chat/jobs, for deployments where the API process does not run
+the jobs itself (CHAT_JOB_WORKERS=0, e.g. serverless). Run from the Coder directory:
+
+    python -m scripts.chat_worker --workers 4
+
+Any number of these can run side by side; each job is leased to one of them.
+"""
+import argparse
+import signal
+import threading
+
+from utils.jobs import CHAT_JOB_POLL_SECONDS, JobWorker
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2, help="graph runs executed concurrently")
+    parser.add_argument("--poll", type=float, default=CHAT_JOB_POLL_SECONDS, help="seconds between polls when idle")
+    args = parser.parse_args()
+
+    worker = JobWorker(args.workers, poll_seconds=args.poll)
+    stopped = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopped.set())
+
+    worker.start()
+    print(f"Chat job worker {worker.worker_id} running with {args.workers} workers")
+    stopped.wait()
+    print("Stopping, waiting for running jobs to finish")
+    worker.stop(wait=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Import-time report for the app entry point (what a serverless cold start pays before
+handling its first request), with a budget check for CI. Run from the Coder directory:
+
+    python -m scripts.check_import_time
+    python -m scripts.check_import_time --budget-ms 1200 --top 30
+    python -m scripts.check_import_time --json import_time.json
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter, a few times,
+and keeps the fastest run. Exits with 1 when importing takes longer than the budget or
+when a module that should load lazily (--forbid) was imported at startup.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+
+# Modules this app defers to first use; importing any of them at startup is a regression.
+# Only what the app itself imports lazily belongs here: zstandard, say, is out because
+# langsmith imports it anyway
+LAZY_MODULES = ["langgraph", "langchain_groq", "groq", "langgraph.checkpoint.mongodb"]
+
+
+def measure(module: str) -> list:
+    """[(module, self_us, cumulative_us, depth)] in import order"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def report(rows: list, module: str, top: int) -> dict:
+    total_us = next((cumulative for name, _, cumulative, depth in rows if name == module and depth <= 1), 0)
+    packages = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        packages[name.split(".")[0]] += self_us
+    return {
+        "module": module,
+        "total_ms": round(total_us / 1000, 1),
+        "modules_imported": len(rows),
+        "slowest_modules": [
+            {"module": name, "cumulative_ms": round(cumulative / 1000, 1), "self_ms": round(self_us / 1000, 1)}
+            for name, self_us, cumulative, _ in sorted(rows, key=lambda row: -row[2])[:top]
+        ],
+        "packages": [
+            {"package": name, "self_ms": round(us / 1000, 1)}
+            for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]
+        ],
+        "imported": sorted({name for name, _, _, _ in rows}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="module to import")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_TIME_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters to measure; the fastest counts")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--forbid", nargs="*", default=LAZY_MODULES, help="modules that must not load at import")
+    parser.add_argument("--json", help="also write the full report here")
+    args = parser.parse_args()
+
+    results = [report(measure(args.module), args.module, args.top) for _ in range(max(1, args.runs))]
+    result = min(results, key=lambda r: r["total_ms"])
+
+    print(f"import {args.module}: {result['total_ms']} ms, {result['modules_imported']} modules "
+          f"(budget {args.budget_ms:.0f} ms)")
+    print(f"\n{'cumulative ms':>14}{'self ms':>10}  module")
+    for row in result["slowest_modules"]:
+        print(f"{row['cumulative_ms']:>14}{row['self_ms']:>10}  {row['module']}")
+    print(f"\n{'self ms':>14}  package")
+    for row in result["packages"]:
+        print(f"{row['self_ms']:>14}  {row['package']}")
+
+    eager = [name for name in args.forbid if name in result["imported"]]
+    result["eagerly_imported"] = eager
+    result["budget_ms"] = args.budget_ms
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({key: value for key, value in result.items() if key != "imported"}, f, indent=2)
+
+    failed = False
+    if eager:
+        print(f"\nImported at startup but meant to load lazily: {', '.join(eager)}")
+        failed = True
+    if result["total_ms"] > args.budget_ms:
+        print(f"\nOver budget by {result['total_ms'] - args.budget_ms:.0f} ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Delete superseded LangGraph checkpoints (and their pending writes) and report the
+reclaimed bytes. Run from the Coder directory:
+
+    python -m scripts.compact_checkpoints --dry-run
+    python -m scripts.compact_checkpoints --keep-last 1 --per-turn
+    python -m scripts.compact_checkpoints --thread <thread_id>
+"""
+import argparse
+import json
+
+from utils.retention import (
+    CHECKPOINT_COMPACTION_BATCH, CHECKPOINT_KEEP_LAST, CHECKPOINT_KEEP_PER_TURN,
+    RetentionPolicy, compact_all, compact_thread,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keep-last", type=int, default=CHECKPOINT_KEEP_LAST, help="newest checkpoints to keep per thread")
+    parser.add_argument("--per-turn", action="store_true", default=CHECKPOINT_KEEP_PER_TURN, help="also keep the last checkpoint of every turn")
+    parser.add_argument("--batch-size", type=int, default=CHECKPOINT_COMPACTION_BATCH, help="checkpoints deleted per batch")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    parser.add_argument("--thread", help="only compact this thread")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be deleted without deleting")
+    args = parser.parse_args()
+
+    policy = RetentionPolicy(keep_last=args.keep_last, latest_per_turn=args.per_turn)
+    if args.thread:
+        report = compact_thread(args.thread, policy, batch_size=args.batch_size, dry_run=args.dry_run, pause=args.pause)
+    else:
+        report = compact_all(policy, batch_size=args.batch_size, dry_run=args.dry_run, pause=args.pause)
+
+    print(json.dumps(report.as_dict(), indent=2))
+    print(f"Reclaimed {report.bytes_reclaimed / 1024 / 1024:.2f} MiB{' (dry run)' if args.dry_run else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+Create missing MongoDB indexes and verify the existing ones (the same bootstrap the app
+runs at startup unless MONGO_INDEX_BOOTSTRAP=false). Run from the Coder directory:
+
+    python -m scripts.ensure_indexes
+
+Exits with 1 if any index could not be created.
+"""
+import asyncio
+import sys
+
+from utils.indexes import ensure_indexes
+
+
+def main():
+    report = asyncio.run(ensure_indexes())
+    for label, status in sorted(report.items()):
+        print(f"{status:<12} {label}")
+    if any(status.startswith("failed") for status in report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
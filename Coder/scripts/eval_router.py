@@ -0,0 +1,108 @@
+"""
+Offline evaluation of the local router classifier against logged LLM router decisions.
+
+Log decisions by setting ROUTER_DECISION_LOG=router_decisions.jsonl, then run from the
+Coder directory:
+
+    python -m scripts.eval_router router_decisions.jsonl
+    python -m scripts.eval_router router_decisions.jsonl --train router_model.json --holdout 0.2
+    python -m scripts.eval_router router_decisions.jsonl --calibrate --target 0.98
+
+and point ROUTER_CLASSIFIER_MODEL at the trained model file. --calibrate sweeps the
+fast-path threshold and suggests the lowest one whose decisions agree with the LLM
+router at least --target of the time (set it as ROUTER_FAST_PATH_THRESHOLD).
+"""
+import argparse
+import json
+import random
+import time
+from collections import Counter
+
+from workflow.classifier import LABELS, NaiveBayesModel, classify_request, fast_path_allowed
+
+
+def load_samples(path: str) -> list:
+    samples = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("label") in LABELS and record.get("query"):
+                samples.append((record["query"], record["label"]))
+    return samples
+
+
+def evaluate(samples: list, threshold: float, model: NaiveBayesModel | None) -> dict:
+    confusion = Counter()
+    agree = fast = fast_agree = 0
+    started = time.perf_counter()
+    for query, expected in samples:
+        result = classify_request(query, model=model)
+        confusion[(expected, result.label)] += 1
+        agree += result.label == expected
+        if fast_path_allowed(result, threshold):
+            fast += 1
+            fast_agree += result.label == expected
+    elapsed = time.perf_counter() - started
+    n = len(samples) or 1
+    return {
+        "samples": len(samples),
+        "agreement": agree / n,
+        "fast_path_coverage": fast / n,
+        "fast_path_agreement": fast_agree / fast if fast else None,
+        "mean_classify_us": elapsed / n * 1e6,
+        "confusion": {f"{expected}->{predicted}": count for (expected, predicted), count in sorted(confusion.items())},
+    }
+
+
+def calibrate(samples: list, model: NaiveBayesModel | None, target: float) -> dict:
+    """Fast-path coverage/agreement per threshold, and the lowest threshold meeting `target`"""
+    results = [(classify_request(query, model=model), expected) for query, expected in samples]
+    sweep = []
+    for step in range(50, 100):
+        threshold = step / 100
+        fast = [(result.label, expected) for result, expected in results if fast_path_allowed(result, threshold)]
+        agreement = sum(label == expected for label, expected in fast) / len(fast) if fast else None
+        sweep.append({"threshold": threshold, "coverage": len(fast) / (len(results) or 1), "agreement": agreement})
+    suggested = next((row["threshold"] for row in sweep if row["agreement"] is not None and row["agreement"] >= target), None)
+    return {"target": target, "suggested_threshold": suggested, "sweep": sweep}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log", help="JSONL file of {query, label} LLM router decisions")
+    parser.add_argument("--threshold", type=float, default=0.85, help="fast-path confidence threshold to evaluate")
+    parser.add_argument("--train", metavar="PATH", help="train a bag-of-words model and save it to PATH")
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction of samples held out for evaluation when training")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--calibrate", action="store_true", help="sweep fast-path thresholds")
+    parser.add_argument("--target", type=float, default=0.98, help="fast-path agreement to calibrate for")
+    args = parser.parse_args()
+
+    samples = load_samples(args.log)
+    print(f"Loaded {len(samples)} decisions: {dict(Counter(label for _, label in samples))}")
+
+    print("\nRules only:")
+    print(json.dumps(evaluate(samples, args.threshold, model=None), indent=2))
+
+    if args.calibrate:
+        print("\nThreshold calibration (rules only):")
+        print(json.dumps(calibrate(samples, None, args.target), indent=2))
+
+    if args.train:
+        random.Random(args.seed).shuffle(samples)
+        split = int(len(samples) * (1 - args.holdout))
+        train, test = samples[:split], samples[split:] or samples
+        model = NaiveBayesModel.train(train)
+        print(f"\nRules + bag-of-words (trained on {len(train)}, evaluated on {len(test)}):")
+        print(json.dumps(evaluate(test, args.threshold, model=model), indent=2))
+
+        # Ship a model trained on everything
+        NaiveBayesModel.train(samples).save(args.train)
+        print(f"\nSaved model to {args.train}")
+
+
+if __name__ == "__main__":
+    main()
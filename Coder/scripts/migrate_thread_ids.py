@@ -0,0 +1,79 @@
+"""
+Move thread ownership from the `thread_ids` array on each user document into the
+`threads` collection. Safe to re-run: existing thread documents are left untouched.
+
+Run from the Coder directory:
+
+    python -m scripts.migrate_thread_ids              # copy arrays into `threads`
+    python -m scripts.migrate_thread_ids --titles     # also derive titles from checkpoints
+    python -m scripts.migrate_thread_ids --unset      # then empty the arrays on users
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from utils.memory import get_db, get_checkpointer
+from utils.threads import make_title
+from langchain_core.messages import HumanMessage
+
+
+def thread_details(thread_id: str) -> tuple:
+    """(title, message_count) from the latest checkpoint of a thread"""
+    checkpoint = get_checkpointer().get_tuple({"configurable": {"thread_id": thread_id}})
+    if checkpoint is None:
+        return "", 0
+    messages = checkpoint.checkpoint["channel_values"].get("messages", [])
+    first_human = next((m.content for m in messages if isinstance(m, HumanMessage)), "")
+    return make_title(first_human), len(messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--titles", action="store_true", help="read each thread's latest checkpoint for title and message count")
+    parser.add_argument("--unset", action="store_true", help="empty the thread_ids arrays after migrating")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    db = get_db()
+    threads = db["threads"]
+    threads.create_index([("thread_id", ASCENDING)], unique=True)
+    threads.create_index([("owner_id", ASCENDING), ("updated_at", DESCENDING), ("thread_id", DESCENDING)])
+
+    users = db["users"].find({"thread_ids.0": {"$exists": True}}, projection={"thread_ids": 1})
+    migrated_users = migrated_threads = 0
+    now = datetime.now(timezone.utc)
+
+    for user in users:
+        thread_ids = user["thread_ids"]
+        operations = []
+        for position, thread_id in enumerate(thread_ids):
+            title, message_count = thread_details(thread_id) if args.titles else ("", 0)
+            # Arrays are in creation order; spread timestamps so listing keeps that order
+            stamp = now - timedelta(milliseconds=len(thread_ids) - position)
+            operations.append(UpdateOne(
+                {"thread_id": thread_id},
+                {"$setOnInsert": {
+                    "thread_id": thread_id,
+                    "owner_id": user["_id"],
+                    "title": title,
+                    "message_count": message_count,
+                    "created_at": stamp,
+                    "updated_at": stamp,
+                }},
+                upsert=True,
+            ))
+            if len(operations) >= args.batch_size:
+                migrated_threads += threads.bulk_write(operations, ordered=False).upserted_count
+                operations = []
+        if operations:
+            migrated_threads += threads.bulk_write(operations, ordered=False).upserted_count
+
+        if args.unset:
+            db["users"].update_one({"_id": user["_id"]}, {"$set": {"thread_ids": []}})
+        migrated_users += 1
+
+    print(f"Migrated {migrated_threads} threads from {migrated_users} users")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Train a zstd dictionary on our own checkpoints, for CHECKPOINT_ZSTD_DICT.
+Run from the Coder directory:
+
+    python -m scripts.train_zstd_dict checkpoints.dict --samples 2000 --size 112640
+
+Every process that reads checkpoints must load the same dictionary, so roll it out
+to all readers before any writer starts using it.
+"""
+import argparse
+
+import zstandard
+
+from utils.memory import get_client, CHECKPOINT_DB, CHECKPOINT_COLLECTION, WRITES_COLLECTION
+from utils.serializer import ZSTD_PREFIX, CHECKPOINT_ZSTD_DICT, load_dictionary
+
+
+def raw_payloads(collection, field: str, limit: int, decompressor):
+    """Uncompressed serializer output of the newest `limit` documents"""
+    for doc in collection.find({}, projection={"type": 1, field: 1}, sort=[("_id", -1)], limit=limit):
+        payload = doc.get(field)
+        if not payload:
+            continue
+        if doc.get("type", "").startswith(ZSTD_PREFIX):
+            payload = decompressor.decompress(payload)
+        yield bytes(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", help="path of the dictionary file to write")
+    parser.add_argument("--samples", type=int, default=2000, help="checkpoints (and as many writes) to sample")
+    parser.add_argument("--size", type=int, default=112640, help="dictionary size in bytes")
+    args = parser.parse_args()
+
+    existing = load_dictionary(CHECKPOINT_ZSTD_DICT)
+    decompressor = zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(existing) if existing else None)
+    db = get_client()[CHECKPOINT_DB]
+    samples = list(raw_payloads(db[CHECKPOINT_COLLECTION], "checkpoint", args.samples, decompressor))
+    samples += list(raw_payloads(db[WRITES_COLLECTION], "value", args.samples, decompressor))
+    if not samples:
+        raise SystemExit("No checkpoints found to train on")
+
+    dictionary = zstandard.train_dictionary(args.size, samples)
+    with open(args.output, "wb") as f:
+        f.write(dictionary.as_bytes())
+    print(f"Trained {len(dictionary.as_bytes())} byte dictionary (id {dictionary.dict_id()}) on {len(samples)} samples -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING
+
+from utils.indexes import IndexSpec, ensure_index, ensure_index_sync
+from utils.tracing import log_event
+
+# A failed TTL index setup is retried after this long instead of on every cache call
+INDEX_RETRY_SECONDS = 60
+
+
+# =====================================================
+# Cache keys
+# =====================================================
+def make_cache_key(*parts) -> str:
+    """Stable sha256 key for any JSON-serializable parts"""
+    raw = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# =====================================================
+# In-process tier: LRU with TTL
+# =====================================================
+class LRUCache:
+    """Thread-safe LRU cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+# =====================================================
+# Shared tier: Mongo collection with a TTL index
+# =====================================================
+class MongoCacheTier:
+    """
+    Cache entries shared by all workers, stored as {_id: key, value, created_at}.
+    Mongo's TTL monitor only runs every ~60s, so expiry is also checked on read.
+    """
+
+    def __init__(self, collection, async_collection=None, ttl: float = 3600):
+        self.collection = collection
+        self.async_collection = async_collection
+        self.ttl = ttl
+        self._indexed = False
+        self._index_retry_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _cutoff(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+
+    def _index_spec(self) -> IndexSpec:
+        return IndexSpec(lambda: self.async_collection, (("created_at", ASCENDING),), ttl=int(self.ttl))
+
+    def _index_due(self) -> bool:
+        return not self._indexed and time.monotonic() >= self._index_retry_at
+
+    def _index_failed(self, e: Exception):
+        # Reads and writes work without the index (expiry is checked on read), so they go on
+        self._index_retry_at = time.monotonic() + INDEX_RETRY_SECONDS
+        log_event("cache_index_error", collection=self.collection.name, error=str(e))
+
+    def ensure_index(self):
+        """TTL index on created_at; an existing one with another expiry is updated with collMod"""
+        if self._index_due():
+            try:
+                ensure_index_sync(self._index_spec(), self.collection)
+                self._indexed = True
+            except Exception as e:
+                self._index_failed(e)
+
+    async def aensure_index(self):
+        if self._index_due():
+            try:
+                await ensure_index(self._index_spec())
+                self._indexed = True
+            except Exception as e:
+                self._index_failed(e)
+
+    def get(self, key):
+        self.ensure_index()
+        doc = self.collection.find_one({"_id": key, "created_at": {"$gt": self._cutoff()}})
+        self._count(doc is not None)
+        return doc["value"] if doc else None
+
+    def set(self, key, value):
+        self.ensure_index()
+        self.collection.replace_one(
+            {"_id": key},
+            {"value": value, "created_at": datetime.now(timezone.utc)},
+            upsert=True,
+        )
+
+    async def aget(self, key):
+        await self.aensure_index()
+        doc = await self.async_collection.find_one({"_id": key, "created_at": {"$gt": self._cutoff()}})
+        self._count(doc is not None)
+        return doc["value"] if doc else None
+
+    async def aset(self, key, value):
+        await self.aensure_index()
+        await self.async_collection.replace_one(
+            {"_id": key},
+            {"value": value, "created_at": datetime.now(timezone.utc)},
+            upsert=True,
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+# =====================================================
+# Two-tier cache: memory first, then Mongo
+# =====================================================
+class TieredCache:
+    """
+    Looks up the in-process LRU first and falls back to the optional Mongo tier.
+    Values must be BSON-serializable when a Mongo tier is configured.
+    A failing Mongo tier degrades to a miss, never to a failed request.
+    """
+
+    def __init__(self, memory: LRUCache, shared: MongoCacheTier | None = None):
+        self.memory = memory
+        self.shared = shared
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception as e:
+                log_event("cache_error", op="read", error=str(e))
+                value = None
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value)
+            except Exception as e:
+                log_event("cache_error", op="write", error=str(e))
+
+    async def aget(self, key):
+        value = self.memory.get(key)
+        if value is None and self.shared is not None:
+            try:
+                value = await self.shared.aget(key)
+            except Exception as e:
+                log_event("cache_error", op="read", error=str(e))
+                value = None
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    async def aset(self, key, value):
+        self.memory.set(key, value)
+        if self.shared is not None:
+            try:
+                await self.shared.aset(key, value)
+            except Exception as e:
+                log_event("cache_error", op="write", error=str(e))
+
+    def stats(self) -> dict:
+        stats = {"memory": self.memory.stats()}
+        if self.shared is not None:
+            stats["mongo"] = self.shared.stats()
+        return stats
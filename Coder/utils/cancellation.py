@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import uuid
+from collections import Counter
+
+# Seconds between client-disconnect checks while a /chat run is in flight
+DISCONNECT_POLL_SECONDS = 0.5
+
+SUPERSEDED, DISCONNECTED = "superseded", "disconnected"
+
+
+class RunCancelled(Exception):
+    """A graph run was stopped before finishing; `reason` is SUPERSEDED or DISCONNECTED"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Graph run cancelled: {reason}")
+        self.reason = reason
+
+
+class RunHandle:
+    """
+    Cancellation token of one graph run. Async runs are stopped by cancelling their task,
+    which also aborts the Groq/Tavily request in flight; sync runs poll `event` between
+    graph steps and stop at the next node boundary.
+    """
+
+    def __init__(self, thread_id: str):
+        self.thread_id = thread_id
+        self.run_id = str(uuid.uuid4())
+        self.event = threading.Event()
+        self.reason = None
+        self.task = None
+        self.loop = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def attach(self, task: asyncio.Task):
+        self.task = task
+        self.loop = task.get_loop()
+        if self.cancelled:
+            task.cancel()
+
+    def cancel(self, reason: str):
+        if self.cancelled:
+            return
+        self.reason = reason
+        self.event.set()
+        counts[reason] += 1
+        if self.task is not None:
+            # May be called from another thread (a job worker superseding an async run)
+            self.loop.call_soon_threadsafe(self.task.cancel)
+
+    def check(self):
+        if self.cancelled:
+            raise RunCancelled(self.reason)
+
+
+# =====================================================
+# Current run per thread
+# (process-local: a newer message only supersedes a run of the same worker process;
+# with several uvicorn workers or instances, runs of one thread started elsewhere
+# keep going and their checkpoint writes interleave)
+# =====================================================
+_runs = {}
+_runs_lock = threading.Lock()
+counts = Counter()
+
+
+def start_run(thread_id: str) -> RunHandle:
+    """
+    Register a new run for the thread; a newer message supersedes (cancels) the older run
+    if that run belongs to this process
+    """
+    handle = RunHandle(thread_id)
+    with _runs_lock:
+        previous = _runs.get(thread_id)
+        _runs[thread_id] = handle
+        counts["started"] += 1
+    if previous is not None:
+        previous.cancel(SUPERSEDED)
+    return handle
+
+
+def finish_run(handle: RunHandle):
+    with _runs_lock:
+        if _runs.get(handle.thread_id) is handle:
+            del _runs[handle.thread_id]
+
+
+async def run_cancellable(handle: RunHandle, run, is_disconnected=None):
+    """
+    Await `run()` as a task that is cancelled when the handle is (superseded) or when
+    `is_disconnected()` (Starlette's Request.is_disconnected) turns true.
+    Raises RunCancelled in both cases.
+    """
+    task = asyncio.create_task(run())
+    handle.attach(task)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                break
+            if is_disconnected is not None and await is_disconnected():
+                handle.cancel(DISCONNECTED)
+        if task.cancelled():
+            raise RunCancelled(handle.reason or DISCONNECTED)
+        return task.result()
+    except asyncio.CancelledError:
+        # The request itself was cancelled (server shutdown): take the run down with it
+        task.cancel()
+        raise
+
+
+def cancellation_stats() -> dict:
+    with _runs_lock:
+        active = len(_runs)
+    return {**counts, "active": active}
@@ -0,0 +1,199 @@
+import asyncio
+import os
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from utils.cache import make_cache_key
+from utils.memory import get_async_db
+from utils.indexes import IndexSpec
+
+load_dotenv()
+
+# How long a finished response is replayed for retries carrying the same key
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# How long a retry waits for a run of the same key in another process before giving up (409)
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60"))
+# A claim older than this without a result belongs to a crashed run and may be taken over
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "300"))
+# A run whose clients have all disconnected is cancelled after this long unless a retry attaches
+IDEMPOTENCY_DISCONNECT_GRACE_SECONDS = float(os.getenv("IDEMPOTENCY_DISCONNECT_GRACE_SECONDS", "10"))
+
+# {_id: "<owner_id>:<key>", fingerprint, status: "in_progress" | "done", response, created_at}
+def idempotency_collection():
+    return get_async_db()["idempotency_keys"]
+
+
+IN_PROGRESS, DONE = "in_progress", "done"
+
+# Runs of this process by key, so duplicates arriving meanwhile attach to the same task
+_inflight = {}
+counts = Counter()
+
+
+def _never_disconnected():
+    async def is_disconnected():
+        return False
+    return is_disconnected
+
+
+class _Inflight:
+    """A run of this process and the requests waiting on it (the original one included)"""
+
+    def __init__(self, fingerprint: str):
+        self.task = None
+        self.fingerprint = fingerprint
+        self.clients = []  # is_disconnected callables of the attached requests
+        self.orphaned_at = None
+
+    def attach(self, is_disconnected):
+        client = is_disconnected or _never_disconnected()
+        self.clients.append(client)
+        self.orphaned_at = None
+        return client
+
+    def detach(self, client):
+        """A request stopped waiting (done or cancelled); it no longer keeps the run alive"""
+        if client in self.clients:
+            self.clients.remove(client)
+
+    async def abandoned(self) -> bool:
+        """
+        Disconnect check handed to the run: true once every attached request has gone
+        away and no retry attached within IDEMPOTENCY_DISCONNECT_GRACE_SECONDS
+        """
+        gone = [client for client in list(self.clients) if await client()]
+        if gone:
+            self.clients = [client for client in self.clients if client not in gone]
+        if self.clients:
+            self.orphaned_at = None
+            return False
+        if self.orphaned_at is None:
+            self.orphaned_at = time.monotonic()
+        return time.monotonic() - self.orphaned_at >= IDEMPOTENCY_DISCONNECT_GRACE_SECONDS
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request"""
+
+
+class IdempotencyInProgress(Exception):
+    """The original request is still running elsewhere and did not finish in time"""
+
+
+INDEXES = [
+    IndexSpec(idempotency_collection, (("created_at", ASCENDING),), ttl=IDEMPOTENCY_TTL_SECONDS),
+]
+
+
+def request_fingerprint(*parts) -> str:
+    return make_cache_key(*parts)
+
+
+async def _claim(doc_id: str, fingerprint: str) -> dict | None:
+    """Insert the in-progress marker; returns the existing record if the key was claimed before"""
+    now = datetime.now(timezone.utc)
+    try:
+        await idempotency_collection().insert_one(
+            {"_id": doc_id, "fingerprint": fingerprint, "status": IN_PROGRESS, "created_at": now}
+        )
+        return None
+    except DuplicateKeyError:
+        pass
+    existing = await idempotency_collection().find_one({"_id": doc_id})
+    if existing is None:
+        # Expired between the insert and the read
+        return await _claim(doc_id, fingerprint)
+    return existing
+
+
+async def _wait_for_result(doc_id: str, fingerprint: str) -> dict | None:
+    """Poll a run owned by another process; None if it went stale and this call took the key over"""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.5)
+        existing = await idempotency_collection().find_one({"_id": doc_id})
+        if existing is None:
+            return await _claim(doc_id, fingerprint)
+        if existing["status"] == DONE:
+            return existing
+        age = (datetime.now(timezone.utc) - existing["created_at"].replace(tzinfo=timezone.utc)).total_seconds()
+        if age > IDEMPOTENCY_LOCK_SECONDS:
+            taken = await idempotency_collection().update_one(
+                {"_id": doc_id, "status": IN_PROGRESS, "created_at": existing["created_at"]},
+                {"$set": {"created_at": datetime.now(timezone.utc)}},
+            )
+            if taken.modified_count:
+                return None
+    raise IdempotencyInProgress()
+
+
+async def _execute(doc_id: str, fingerprint: str, run, inflight: _Inflight) -> dict:
+    """Claim the key, then replay, wait for or perform the run; the task duplicates share"""
+    try:
+        existing = await _claim(doc_id, fingerprint)
+        if existing is not None:
+            if existing["fingerprint"] != fingerprint:
+                raise IdempotencyConflict()
+            if existing["status"] == IN_PROGRESS:
+                existing = await _wait_for_result(doc_id, fingerprint)
+        if existing is not None:
+            counts["replayed"] += 1
+            return existing["response"]
+        counts["executed"] += 1
+        try:
+            result = await run(inflight.abandoned)
+        except BaseException:
+            await idempotency_collection().delete_one({"_id": doc_id, "status": IN_PROGRESS})
+            raise
+        await idempotency_collection().update_one(
+            {"_id": doc_id},
+            {"$set": {"status": DONE, "response": result, "created_at": datetime.now(timezone.utc)}},
+        )
+        return result
+    finally:
+        _inflight.pop(doc_id, None)
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # Every waiter may be gone by the time the run fails; keeps asyncio from logging it
+    if not task.cancelled():
+        task.exception()
+
+
+async def run_idempotent(owner_id, key: str, fingerprint: str, run, is_disconnected=None) -> dict:
+    """
+    Run `run(is_disconnected)` (a coroutine function returning a JSON-serializable dict)
+    at most once per (owner, Idempotency-Key). A duplicate that arrives while the first
+    run is in flight awaits that run; one that arrives after it finished gets the stored
+    result. A failed run releases the key so the client can retry it.
+    The run is its own task, so cancelling the request that started it does not cancel it
+    for the duplicates. The `is_disconnected` passed to `run` turns true only when the
+    original request and every duplicate attached to it have gone for the grace period,
+    so a client retrying after a dropped connection keeps its run alive.
+    """
+    doc_id = f"{owner_id}:{key}"
+
+    inflight = _inflight.get(doc_id)
+    if inflight is not None:
+        if inflight.fingerprint != fingerprint:
+            raise IdempotencyConflict()
+        counts["attached"] += 1
+    else:
+        inflight = _inflight[doc_id] = _Inflight(fingerprint)
+        inflight.task = asyncio.create_task(_execute(doc_id, fingerprint, run, inflight))
+        inflight.task.add_done_callback(_retrieve_exception)
+
+    client = inflight.attach(is_disconnected)
+    try:
+        # shield: a request going away must not cancel the run the others wait on
+        return await asyncio.shield(inflight.task)
+    finally:
+        inflight.detach(client)
+
+
+def idempotency_stats() -> dict:
+    return {**counts, "inflight": len(_inflight)}
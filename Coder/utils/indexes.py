@@ -0,0 +1,134 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Callable
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING
+
+from utils.tracing import log_event
+
+load_dotenv()
+
+# Create/verify indexes in the lifespan; with false, run scripts/ensure_indexes.py on deploy
+MONGO_INDEX_BOOTSTRAP = os.getenv("MONGO_INDEX_BOOTSTRAP", "true").lower() == "true"
+
+CREATED, EXISTS, TTL_UPDATED = "created", "exists", "ttl_updated"
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """One index the request path relies on; `collection` returns the async collection"""
+    collection: Callable
+    keys: tuple
+    unique: bool = False
+    ttl: int | None = None  # expireAfterSeconds
+
+    def label(self) -> str:
+        collection = self.collection()
+        fields = ",".join(f"{field}:{direction}" for field, direction in self.keys)
+        return f"{collection.database.name}.{collection.name}({fields})"
+
+
+def normalize_keys(keys) -> tuple:
+    return tuple((field, int(direction) if isinstance(direction, (int, float)) else direction) for field, direction in keys)
+
+
+def plan_index(spec: IndexSpec, existing: dict) -> tuple:
+    """
+    (CREATED | EXISTS | TTL_UPDATED, name of the matching index) given the collection's
+    index_information(). An index with the same key pattern counts whatever its name,
+    so indexes made by hand or by the checkpointer are reused.
+    """
+    keys = normalize_keys(spec.keys)
+    for name, info in existing.items():
+        if normalize_keys(info["key"]) != keys:
+            continue
+        if spec.unique and not info.get("unique"):
+            raise ValueError(f"index {name} exists but is not unique")
+        if spec.ttl is not None and info.get("expireAfterSeconds") != spec.ttl:
+            return TTL_UPDATED, name
+        return EXISTS, name
+    return CREATED, None
+
+
+def create_options(spec: IndexSpec) -> dict:
+    options = {"unique": True} if spec.unique else {}
+    if spec.ttl is not None:
+        options["expireAfterSeconds"] = spec.ttl
+    return options
+
+
+async def ensure_index(spec: IndexSpec) -> str:
+    """
+    Create the index unless one with the same key pattern exists; an existing TTL
+    index whose expiry differs is changed in place with collMod.
+    """
+    collection = spec.collection()
+    action, name = plan_index(spec, await collection.index_information())
+    if action == TTL_UPDATED:
+        await collection.database.command("collMod", collection.name, index={"name": name, "expireAfterSeconds": spec.ttl})
+    elif action == CREATED:
+        await collection.create_index(list(normalize_keys(spec.keys)), **create_options(spec))
+    return action
+
+
+def ensure_index_sync(spec: IndexSpec, collection) -> str:
+    """ensure_index for a sync collection (`spec.collection` is not used)"""
+    action, name = plan_index(spec, collection.index_information())
+    if action == TTL_UPDATED:
+        collection.database.command("collMod", collection.name, index={"name": name, "expireAfterSeconds": spec.ttl})
+    elif action == CREATED:
+        collection.create_index(list(normalize_keys(spec.keys)), **create_options(spec))
+    return action
+
+
+def all_indexes() -> list:
+    """Every declared index: the owning modules' lists plus the checkpoint collections"""
+    from utils.memory import get_async_client, CHECKPOINT_DB, CHECKPOINT_COLLECTION, WRITES_COLLECTION
+    from utils.threads import INDEXES as thread_indexes
+    from utils.jobs import INDEXES as job_indexes
+    from utils.idempotency import INDEXES as idempotency_indexes
+    from utils.users import INDEXES as user_indexes
+
+    checkpoint_indexes = [
+        # Latest checkpoint of a thread (history, ETag, every graph run)
+        IndexSpec(lambda: get_async_client()[CHECKPOINT_DB][CHECKPOINT_COLLECTION],
+                  (("thread_id", ASCENDING), ("checkpoint_ns", ASCENDING), ("checkpoint_id", DESCENDING))),
+        # Pending writes of that checkpoint
+        IndexSpec(lambda: get_async_client()[CHECKPOINT_DB][WRITES_COLLECTION],
+                  (("thread_id", ASCENDING), ("checkpoint_ns", ASCENDING), ("checkpoint_id", DESCENDING),
+                   ("task_id", ASCENDING), ("idx", ASCENDING))),
+    ]
+    return user_indexes + thread_indexes + job_indexes + idempotency_indexes + checkpoint_indexes
+
+
+_report = {}
+
+
+async def ensure_indexes() -> dict:
+    """
+    Idempotent bootstrap: create what is missing and verify the rest, all concurrently.
+    A failing index (duplicate emails under a unique one, ...) is reported, not raised,
+    so it does not keep the others from being built. Returns {index: status}.
+    """
+    specs = all_indexes()
+    results = await asyncio.gather(*(ensure_index(spec) for spec in specs), return_exceptions=True)
+    report = {}
+    for spec, result in zip(specs, results):
+        report[spec.label()] = f"failed: {result}" if isinstance(result, Exception) else result
+    _report.clear()
+    _report.update(report)
+
+    failed = {label: status for label, status in report.items() if status.startswith("failed")}
+    log_event(
+        "index_bootstrap",
+        created=sum(1 for status in report.values() if status == CREATED),
+        ttl_updated=sum(1 for status in report.values() if status == TTL_UPDATED),
+        failed=failed or None,
+    )
+    return report
+
+
+def index_report() -> dict:
+    """Outcome of the last bootstrap in this process"""
+    return dict(_report)
@@ -0,0 +1,252 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from pymongo import ASCENDING, ReturnDocument
+
+from utils.memory import get_db, get_async_db
+from utils.indexes import IndexSpec
+from utils.threads import touch_thread_sync
+from utils.cancellation import start_run, finish_run, RunCancelled
+from utils.tracing import log_event
+
+load_dotenv()
+
+# Graph runs executed by this process; 0 leaves the queue to scripts/chat_worker.py
+# (serverless hosts freeze background threads between requests, so use 0 there)
+CHAT_JOB_WORKERS = int(os.getenv("CHAT_JOB_WORKERS", "0" if os.getenv("VERCEL") else "2"))
+# A running job whose lease expires (worker crashed) is picked up again; the worker
+# renews the lease every CHAT_JOB_HEARTBEAT_SECONDS while the run is alive
+CHAT_JOB_LEASE_SECONDS = int(os.getenv("CHAT_JOB_LEASE_SECONDS", "300"))
+CHAT_JOB_HEARTBEAT_SECONDS = float(os.getenv("CHAT_JOB_HEARTBEAT_SECONDS", str(CHAT_JOB_LEASE_SECONDS / 3)))
+CHAT_JOB_MAX_ATTEMPTS = int(os.getenv("CHAT_JOB_MAX_ATTEMPTS", "2"))
+CHAT_JOB_POLL_SECONDS = float(os.getenv("CHAT_JOB_POLL_SECONDS", "1"))
+# Finished jobs are kept this long for clients to fetch their result
+CHAT_JOB_TTL_SECONDS = int(os.getenv("CHAT_JOB_TTL_SECONDS", "86400"))
+
+# One document per submitted message:
+# {_id: job_id, thread_id, owner_id, message, status, response, error, attempts,
+#  created_at, started_at, finished_at, lease_until, lease_id, worker}
+def jobs_collection():
+    return get_async_db()["chat_jobs"]
+
+
+def sync_jobs_collection():
+    return get_db()["chat_jobs"]
+
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+
+
+INDEXES = [
+    # Claiming: oldest queued job first, or a running one whose lease ran out
+    IndexSpec(jobs_collection, (("status", ASCENDING), ("created_at", ASCENDING))),
+    IndexSpec(jobs_collection, (("status", ASCENDING), ("lease_until", ASCENDING))),
+    # Only finished jobs carry finished_at, so queued/running ones never expire
+    IndexSpec(jobs_collection, (("finished_at", ASCENDING),), ttl=CHAT_JOB_TTL_SECONDS),
+]
+
+
+# =====================================================
+# Request side
+# =====================================================
+async def enqueue_job(owner_id, thread_id: str, message: str) -> dict:
+    job = {
+        "_id": str(uuid.uuid4()),
+        "thread_id": thread_id,
+        "owner_id": owner_id,
+        "message": message,
+        "status": QUEUED,
+        "attempts": 0,
+        "created_at": datetime.now(timezone.utc),
+    }
+    await jobs_collection().insert_one(job)
+    if _worker is not None:
+        _worker.wake()
+    return job
+
+
+async def get_job(job_id: str, owner_id) -> dict | None:
+    return await jobs_collection().find_one({"_id": job_id, "owner_id": owner_id})
+
+
+async def wait_for_job(job_id: str, owner_id, timeout: float) -> dict | None:
+    """Long-poll: the job once it has finished, or as it is when `timeout` runs out"""
+    deadline = time.monotonic() + timeout
+    delay = 0.25
+    while True:
+        job = await get_job(job_id, owner_id)
+        if job is None or job["status"] in FINISHED or time.monotonic() >= deadline:
+            return job
+        await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, 2.0)
+
+
+# =====================================================
+# Worker side
+# =====================================================
+def claim_job(worker_id: str) -> dict | None:
+    """Atomically take the oldest queued job (or one whose lease expired) and lease it"""
+    now = datetime.now(timezone.utc)
+    return sync_jobs_collection().find_one_and_update(
+        {"$or": [
+            {"status": QUEUED},
+            {"status": RUNNING, "lease_until": {"$lt": now}, "attempts": {"$lt": CHAT_JOB_MAX_ATTEMPTS}},
+        ]},
+        {
+            "$set": {
+                "status": RUNNING,
+                "started_at": now,
+                "lease_until": now + timedelta(seconds=CHAT_JOB_LEASE_SECONDS),
+                # Identifies this claim, so a run that outlived its lease cannot overwrite a retry
+                "lease_id": str(uuid.uuid4()),
+                "worker": worker_id,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def fail_exhausted_jobs() -> int:
+    """Fail running jobs whose lease expired on their last attempt (the worker crashed)"""
+    now = datetime.now(timezone.utc)
+    result = sync_jobs_collection().update_many(
+        {"status": RUNNING, "lease_until": {"$lt": now}, "attempts": {"$gte": CHAT_JOB_MAX_ATTEMPTS}},
+        {"$set": {"status": FAILED, "error": "Internal server error", "finished_at": now}, "$unset": {"lease_until": ""}},
+    )
+    if result.modified_count:
+        log_event("chat_jobs_expired", failed=result.modified_count)
+    return result.modified_count
+
+
+def keep_lease(owned: dict, stop: threading.Event):
+    """Push the lease forward until `stop` is set, so a long run is not claimed a second time"""
+    while not stop.wait(CHAT_JOB_HEARTBEAT_SECONDS):
+        try:
+            renewed = sync_jobs_collection().update_one(owned, {
+                "$set": {"lease_until": datetime.now(timezone.utc) + timedelta(seconds=CHAT_JOB_LEASE_SECONDS)},
+            })
+        except Exception as e:
+            log_event("chat_job_heartbeat_error", job_id=owned["_id"], error=str(e))
+            continue
+        if not renewed.matched_count:
+            # Lease lost (taken over after a stall); the final update will not match either
+            return
+
+
+def run_job(job: dict):
+    # Imported here so that importing utils.jobs does not build the graph
+    from workflow.graph import run_graph_with_message, load_reply
+
+    owned = {"_id": job["_id"], "lease_id": job["lease_id"], "status": RUNNING}
+    # A retry of a run that got as far as checkpointing its answer (then lost the
+    # worker before recording it) only records that answer
+    response = load_reply(job["thread_id"], job["_id"]) if job["attempts"] > 1 else None
+    if response is not None:
+        log_event("chat_job_recovered", job_id=job["_id"], attempt=job["attempts"])
+        sync_jobs_collection().update_one(owned, {
+            "$set": {"status": DONE, "response": response, "finished_at": datetime.now(timezone.utc)},
+            "$unset": {"lease_until": ""},
+        })
+        return
+
+    stop_heartbeat = threading.Event()
+    threading.Thread(target=keep_lease, args=(owned, stop_heartbeat), daemon=True, name="chat-job-lease").start()
+    handle = start_run(job["thread_id"])
+    try:
+        # The job id doubles as the message id, so a retry replaces rather than repeats it
+        response = run_graph_with_message(job["thread_id"], job["message"], handle, message_id=job["_id"])
+    except RunCancelled as e:
+        # A newer message on the thread took over; retrying this one would be pointless
+        sync_jobs_collection().update_one(owned, {
+            "$set": {"status": FAILED, "error": f"Cancelled: {e.reason}", "finished_at": datetime.now(timezone.utc)},
+            "$unset": {"lease_until": ""},
+        })
+        return
+    except Exception as e:
+        log_event("chat_job_error", job_id=job["_id"], attempt=job["attempts"], error=str(e))
+        if job["attempts"] >= CHAT_JOB_MAX_ATTEMPTS:
+            update = {"status": FAILED, "error": "Internal server error", "finished_at": datetime.now(timezone.utc)}
+        else:
+            update = {"status": QUEUED}
+        sync_jobs_collection().update_one(owned, {"$set": update, "$unset": {"lease_until": ""}})
+        return
+    finally:
+        stop_heartbeat.set()
+        finish_run(handle)
+
+    touch_thread_sync(job["thread_id"])
+    sync_jobs_collection().update_one(owned, {
+        "$set": {"status": DONE, "response": response, "finished_at": datetime.now(timezone.utc)},
+        "$unset": {"lease_until": ""},
+    })
+
+
+class JobWorker:
+    """
+    `workers` threads that claim chat jobs from Mongo and run the graph for them.
+    Any number of processes can run workers against the same collection; the
+    find_one_and_update claim makes sure each job is leased to one of them.
+    """
+
+    def __init__(self, workers: int, poll_seconds: float = CHAT_JOB_POLL_SECONDS):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._pool = None
+
+    def wake(self):
+        """Called on enqueue so an idle worker of this process starts without waiting for the poll"""
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                fail_exhausted_jobs()
+                job = claim_job(self.worker_id)
+            except Exception as e:
+                log_event("chat_job_claim_error", error=str(e))
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+                continue
+            try:
+                run_job(job)
+            except Exception as e:
+                # Bookkeeping failed; the lease expiring hands the job to another attempt
+                log_event("chat_job_bookkeeping_error", job_id=job["_id"], error=str(e))
+
+    def start(self):
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="chat-job")
+        for _ in range(self.workers):
+            self._pool.submit(self._loop)
+
+    def stop(self, wait: bool = False):
+        """Stop claiming new jobs; a job already running finishes (or its lease expires)"""
+        self._stop.set()
+        self._wake.set()
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+
+
+_worker = None
+
+
+def start_job_workers(workers: int = CHAT_JOB_WORKERS) -> JobWorker | None:
+    global _worker
+    if workers <= 0:
+        return None
+    _worker = JobWorker(workers)
+    _worker.start()
+    return _worker
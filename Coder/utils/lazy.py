@@ -0,0 +1,30 @@
+import functools
+import threading
+
+
+def singleton(factory):
+    """
+    Turn a zero-argument factory into a thread-safe getter that builds its object on the
+    first call and returns the same one afterwards, so importing a module never opens
+    connections or compiles graphs by itself.
+    - getter.loaded(): whether the object exists yet
+    - getter.override(obj): replace it (benchmarks swap in fakes)
+    """
+    lock = threading.Lock()
+    box = []
+
+    @functools.wraps(factory)
+    def get():
+        if not box:
+            with lock:
+                if not box:
+                    box.append(factory())
+        return box[0]
+
+    def override(obj):
+        with lock:
+            box[:] = [obj]
+
+    get.loaded = lambda: bool(box)
+    get.override = override
+    return get
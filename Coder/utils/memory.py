@@ -1,15 +1,193 @@
-from langgraph.checkpoint.mongodb import MongoDBSaver
-from pymongo import MongoClient
+from pymongo import MongoClient, AsyncMongoClient
+from pymongo.read_preferences import ReadPreference, SecondaryPreferred, Secondary, Nearest, PrimaryPreferred
+import importlib.util
 import os
 from dotenv import load_dotenv
+from utils.lazy import singleton
+from utils.metrics import MongoCommandTimer, MongoPoolMonitor
 
 load_dotenv()
 
 # Get MONGO_URI from environment
 mongo_uri = os.getenv("MONGO_URI")
 
-client = MongoClient(mongo_uri)
-checkpointer = MongoDBSaver(client)
+# Database names can be overridden to point a benchmark or staging run at its own data
+APP_DB = os.getenv("MONGO_DB_NAME", "AICoder")
 
-db = client["AICoder"]
-user_collection = db["users"]
+# Both savers must read and write the same collections so a thread can be
+# resumed from either the sync or the async execution path
+CHECKPOINT_DB = os.getenv("MONGO_CHECKPOINT_DB_NAME", "checkpointing_db")
+CHECKPOINT_COLLECTION = "checkpoints"
+WRITES_COLLECTION = "checkpoint_writes"
+
+# Connection pool, per client (sync and async) and per server. Serverless instances
+# serve one request at a time, so a small pool there avoids exhausting Atlas connections
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "10" if os.getenv("VERCEL") else "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0" if os.getenv("VERCEL") else "5"))
+# Idle connections are closed after this long (0 keeps them); keeps churn down without leaking sockets
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+# Fail fast instead of pymongo's 30 s defaults when the cluster is unreachable or the pool is exhausted
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+# Wire compression in order of preference; ones whose Python package is missing are skipped
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib")
+# Read preference of history/ETag reads (e.g. secondaryPreferred to move them off the
+# primary). Secondaries may lag, so a just-finished reply can show up a moment later.
+MONGO_HISTORY_READ_PREFERENCE = os.getenv("MONGO_HISTORY_READ_PREFERENCE", "primary")
+# Bound on that lag for non-primary reads, seconds (>= 90 per the driver spec; -1 = none)
+MONGO_HISTORY_MAX_STALENESS_SECONDS = int(os.getenv("MONGO_HISTORY_MAX_STALENESS_SECONDS", "-1"))
+
+# Every command is timed into coder_mongo_command_duration_seconds; pool events feed pool_monitor
+pool_monitor = MongoPoolMonitor(MONGO_MAX_POOL_SIZE)
+mongo_listeners = [MongoCommandTimer(), pool_monitor]
+
+COMPRESSOR_PACKAGES = {"zstd": "zstandard", "snappy": "snappy", "zlib": None}
+
+
+def available_compressors() -> list:
+    names = [name.strip() for name in MONGO_COMPRESSORS.split(",") if name.strip()]
+    return [
+        name for name in names
+        if name in COMPRESSOR_PACKAGES
+        and (COMPRESSOR_PACKAGES[name] is None or importlib.util.find_spec(COMPRESSOR_PACKAGES[name]) is not None)
+    ]
+
+
+def client_options() -> dict:
+    """Keyword arguments shared by the sync and async clients"""
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "event_listeners": mongo_listeners,
+    }
+    if MONGO_MAX_IDLE_TIME_MS:
+        options["maxIdleTimeMS"] = MONGO_MAX_IDLE_TIME_MS
+    compressors = available_compressors()
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+
+def history_read_preference():
+    max_staleness = MONGO_HISTORY_MAX_STALENESS_SECONDS
+    modes = {
+        "primarypreferred": lambda: PrimaryPreferred(max_staleness=max_staleness),
+        "secondary": lambda: Secondary(max_staleness=max_staleness),
+        "secondarypreferred": lambda: SecondaryPreferred(max_staleness=max_staleness),
+        "nearest": lambda: Nearest(max_staleness=max_staleness),
+    }
+    mode = modes.get(MONGO_HISTORY_READ_PREFERENCE.lower())
+    return mode() if mode else ReadPreference.PRIMARY
+
+
+# =====================================================
+# Clients and checkpointers, created on first use
+# (a mongodb+srv URI costs DNS lookups in the constructor, and the savers pull in
+# langgraph's Mongo package; neither should be paid by a cold start serving GET /)
+# =====================================================
+@singleton
+def get_client() -> MongoClient:
+    return MongoClient(mongo_uri, **client_options())
+
+
+@singleton
+def get_async_client() -> AsyncMongoClient:
+    """Async client used by the request path (async routes + graph.ainvoke)"""
+    return AsyncMongoClient(mongo_uri, **client_options())
+
+
+def get_db():
+    return get_client()[APP_DB]
+
+
+def get_async_db():
+    return get_async_client()[APP_DB]
+
+
+def get_user_collection():
+    return get_db()["users"]
+
+
+def get_async_user_collection():
+    return get_async_db()["users"]
+
+
+@singleton
+def get_checkpoint_serializer():
+    """
+    zstd-aware serializer shared by every saver: it reads both plain and compressed
+    checkpoints, and compresses new ones only with CHECKPOINT_COMPRESSION
+    """
+    from utils.serializer import build_checkpoint_serializer
+    return build_checkpoint_serializer()
+
+
+@singleton
+def get_checkpointer():
+    from langgraph.checkpoint.mongodb import MongoDBSaver
+    checkpointer = MongoDBSaver(
+        get_client(),
+        db_name=CHECKPOINT_DB,
+        checkpoint_collection_name=CHECKPOINT_COLLECTION,
+        writes_collection_name=WRITES_COLLECTION,
+    )
+    checkpointer.serde = get_checkpoint_serializer()
+    return checkpointer
+
+
+@singleton
+def get_async_checkpointer():
+    from langgraph.checkpoint.mongodb.aio import AsyncMongoDBSaver
+    checkpointer = AsyncMongoDBSaver(
+        get_async_client(),
+        db_name=CHECKPOINT_DB,
+        checkpoint_collection_name=CHECKPOINT_COLLECTION,
+        writes_collection_name=WRITES_COLLECTION,
+    )
+    checkpointer.serde = get_checkpoint_serializer()
+    return checkpointer
+
+
+@singleton
+def get_history_checkpointer():
+    """
+    Async saver for the read-only history view, reading with MONGO_HISTORY_READ_PREFERENCE.
+    Shares the async client's pool; only its collection handles carry the read preference.
+    """
+    read_preference = history_read_preference()
+    if read_preference == ReadPreference.PRIMARY:
+        return get_async_checkpointer()
+    from langgraph.checkpoint.mongodb.aio import AsyncMongoDBSaver
+    checkpointer = AsyncMongoDBSaver(
+        get_async_client(),
+        db_name=CHECKPOINT_DB,
+        checkpoint_collection_name=CHECKPOINT_COLLECTION,
+        writes_collection_name=WRITES_COLLECTION,
+    )
+    checkpointer.checkpoint_collection = checkpointer.checkpoint_collection.with_options(read_preference=read_preference)
+    checkpointer.writes_collection = checkpointer.writes_collection.with_options(read_preference=read_preference)
+    checkpointer.serde = get_checkpoint_serializer()
+    return checkpointer
+
+
+async def alatest_checkpoint_id(thread_id: str) -> str | None:
+    """
+    Id of a thread's latest checkpoint without loading or deserializing it;
+    checkpoint ids are time-ordered, which is also how the saver finds the latest one.
+    """
+    # Same read preference as the history read, so the ETag matches the data it tags
+    collection = get_async_client()[CHECKPOINT_DB].get_collection(
+        CHECKPOINT_COLLECTION, read_preference=history_read_preference()
+    )
+    doc = await collection.find_one(
+        {"thread_id": thread_id, "checkpoint_ns": ""},
+        projection={"_id": 0, "checkpoint_id": 1},
+        sort=[("checkpoint_id", -1)],
+    )
+    return doc["checkpoint_id"] if doc else None
@@ -0,0 +1,285 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from pymongo import monitoring
+
+# Prometheus text exposition (format 0.0.4) without a client library: counters,
+# histograms and callback gauges, each with an optional fixed label set.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [
+            f"{self.name}{format_labels(self.labels, key)} {format_value(value)}" for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> dict:
+        """{label values: (count, sum)}, for in-process reports such as the benchmarks"""
+        with self._lock:
+            return {key: (count, total) for key, (_, total, count) in self._values.items()}
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list:
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        lines = self.header()
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % format_value(bound)
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{format_labels(self.labels, key, le)} {count}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class CallbackGauge(Metric):
+    """Gauge read at scrape time: `fn()` returns a number, or {label values tuple: number}"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def render(self) -> list:
+        try:
+            value = self.fn()
+        except Exception as e:
+            print(f"Metric {self.name} unavailable: {e}")
+            return []
+        values = value if isinstance(value, dict) else {(): value}
+        return self.header() + [
+            f"{self.name}{format_labels(self.labels, key)} {format_value(v)}" for key, v in sorted(values.items())
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            # Re-registering (module reload) returns the existing series
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, fn, labels: tuple = ()) -> CallbackGauge:
+        return self.register(CallbackGauge(name, help, fn, labels))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# =====================================================
+# Metrics shared across modules
+# =====================================================
+http_request_seconds = registry.histogram(
+    "coder_http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+node_seconds = registry.histogram(
+    "coder_graph_node_duration_seconds", "Wall time of one graph node execution", ("node", "outcome"))
+llm_seconds = registry.histogram(
+    "coder_llm_request_duration_seconds", "Latency of uncached LLM calls", ("role", "model", "outcome"))
+llm_tokens = registry.counter(
+    "coder_llm_tokens_total", "LLM tokens by direction (plain chat responses only)", ("role", "model", "direction"))
+router_decisions = registry.counter(
+    "coder_router_decisions_total", "Router labels and how they were decided", ("label", "source"))
+sufficiency_decisions = registry.counter(
+    "coder_sufficiency_decisions_total", "Draft judgements by deciding path", ("kind", "path", "verdict"))
+search_seconds = registry.histogram(
+    "coder_search_duration_seconds", "Latency of outbound Tavily searches", ("outcome",))
+mongo_seconds = registry.histogram(
+    "coder_mongo_command_duration_seconds", "Mongo command latency", ("database", "command", "outcome"))
+mongo_pool_checkout_seconds = registry.histogram(
+    "coder_mongo_pool_checkout_duration_seconds", "Wait for a pooled Mongo connection", ("outcome",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0))
+mongo_pool_events = registry.counter(
+    "coder_mongo_pool_events_total", "Mongo connections created/closed, pools cleared, failed checkouts", ("event",))
+password_seconds = registry.histogram(
+    "coder_password_hash_duration_seconds", "bcrypt hash/verify time including the wait for a worker",
+    ("operation", "outcome"))
+auth_throttled = registry.counter(
+    "coder_auth_throttled_total", "Signup/login attempts rejected before hashing", ("scope",))
+
+
+# =====================================================
+# Mongo command timings (checkpoint reads/writes, users, threads, ...)
+# =====================================================
+class MongoCommandTimer(monitoring.CommandListener):
+    """Passed as an event listener to the Mongo clients; times every command"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_seconds.observe(event.duration_micros / 1e6, database=event.database_name,
+                              command=event.command_name, outcome="ok")
+
+    def failed(self, event):
+        mongo_seconds.observe(event.duration_micros / 1e6, database=event.database_name,
+                              command=event.command_name, outcome="error")
+
+
+# =====================================================
+# Mongo connection pools (sync and async clients combined)
+# =====================================================
+class MongoPoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Open and checked-out connections across the clients it is registered with, plus
+    churn counters; `max_pool_size` is per client and server, for a utilization figure.
+    """
+
+    def __init__(self, max_pool_size: int):
+        self.max_pool_size = max_pool_size
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.pools = 0
+
+    def _count(self, field: str, delta: int):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + delta)
+
+    def pool_created(self, event):
+        self._count("pools", 1)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        mongo_pool_events.inc(event="pool_cleared")
+
+    def pool_closed(self, event):
+        self._count("pools", -1)
+
+    def connection_created(self, event):
+        self._count("open", 1)
+        mongo_pool_events.inc(event="created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count("open", -1)
+        mongo_pool_events.inc(event=f"closed_{event.reason}")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        mongo_pool_events.inc(event=f"checkout_failed_{event.reason}")
+        if getattr(event, "duration", None) is not None:
+            mongo_pool_checkout_seconds.observe(event.duration, outcome="error")
+
+    def connection_checked_out(self, event):
+        self._count("in_use", 1)
+        if getattr(event, "duration", None) is not None:
+            mongo_pool_checkout_seconds.observe(event.duration, outcome="ok")
+
+    def connection_checked_in(self, event):
+        self._count("in_use", -1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            capacity = self.max_pool_size * max(1, self.pools)
+            return {
+                "pools": self.pools,
+                "open": self.open,
+                "in_use": self.in_use,
+                "max_pool_size": self.max_pool_size,
+                "utilization": round(self.in_use / capacity, 3) if self.max_pool_size else None,
+            }
@@ -1,18 +1,273 @@
-from langchain_groq import ChatGroq
+from langchain_core.messages import AIMessage
 from dotenv import load_dotenv
+import os
+import threading
+import time
+from collections import deque
 
-from langchain_tavily import TavilySearch
+from utils.search import get_search_client
+from utils.cache import LRUCache, MongoCacheTier, TieredCache, make_cache_key
+from utils.lazy import singleton
+from utils.scheduler import get_scheduler, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from utils.metrics import llm_seconds, llm_tokens
 
 load_dotenv()
 
+# Response cache settings (opt-in per call, see LLMClient.invoke)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_SIZE = int(os.getenv("LLM_CACHE_MAX_SIZE", "1024"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+LLM_CACHE_MONGO = os.getenv("LLM_CACHE_MONGO", "false").lower() == "true"
+
 def web_search():
-    return TavilySearch(max_results=3, topic="general")
+    """Shared, pooled and cached Tavily client (see utils/search.py)"""
+    return get_search_client()
+
+
+# =====================================================
+# LLM response cache
+# =====================================================
+@singleton
+def get_response_cache() -> TieredCache | None:
+    """Process-wide LLM response cache, built on first use (None when disabled)"""
+    if not LLM_CACHE_ENABLED:
+        return None
+    shared = None
+    if LLM_CACHE_MONGO:
+        from utils.memory import get_db, get_async_db
+        shared = MongoCacheTier(get_db()["llm_cache"], get_async_db()["llm_cache"], ttl=LLM_CACHE_TTL_SECONDS)
+    return TieredCache(LRUCache(LLM_CACHE_MAX_SIZE, LLM_CACHE_TTL_SECONDS), shared)
+
+
+def normalize_messages(messages) -> list:
+    """Role + whitespace-collapsed content, so cosmetic prompt differences share a key"""
+    normalized = []
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        normalized.append([message.type, " ".join(content.split())])
+    return normalized
+
+
+# =====================================================
+# Per-role latency
+# =====================================================
+LATENCY_SAMPLES = 1000
+_latencies = {}
+_latency_lock = threading.Lock()
+
+
+def record_latency(role: str, seconds: float):
+    with _latency_lock:
+        _latencies.setdefault(role, deque(maxlen=LATENCY_SAMPLES)).append(seconds)
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def model_latency_report() -> dict:
+    """count / mean / p50 / p95 (ms) over the last LATENCY_SAMPLES uncached calls per role"""
+    report = {}
+    with _latency_lock:
+        snapshot = {role: sorted(samples) for role, samples in _latencies.items()}
+    for role, samples in snapshot.items():
+        if not samples:
+            continue
+        report[role] = {
+            "model": MODEL_ROLES[role]["model"] if role in MODEL_ROLES else None,
+            "count": len(samples),
+            "mean_ms": round(sum(samples) / len(samples) * 1000, 1),
+            "p50_ms": round(percentile(samples, 0.5) * 1000, 1),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 1),
+        }
+    return report
+
+
+def used_tokens(value) -> int | None:
+    """Actual total tokens of a plain chat response (structured output carries no usage)"""
+    usage = getattr(value, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+class LLMClient:
+    """
+    Thin wrapper around a chat model (or its structured-output runnable) for one role.
+    Calls go straight through unless the caller opts in with `cache=True`, which
+    should only be done where the output is deterministic enough to reuse.
+    """
+
+    def __init__(self, runnable, params: dict, schema=None, role: str = "generator"):
+        self.runnable = runnable
+        self.params = params
+        self.schema = schema
+        self.role = role
+
+    def with_structured_output(self, schema) -> "LLMClient":
+        return LLMClient(
+            self.runnable.with_structured_output(schema),
+            {**self.params, "schema": schema.__name__},
+            schema=schema,
+            role=self.role,
+        )
+
+    def _key(self, messages) -> str:
+        return make_cache_key(self.params, normalize_messages(messages))
+
+    def _encode(self, value) -> dict:
+        if self.schema is not None:
+            return value.model_dump()
+        return {"content": value.content}
+
+    def _decode(self, data: dict):
+        if self.schema is not None:
+            return self.schema.model_validate(data)
+        return AIMessage(content=data["content"])
+
+    def _estimate_tokens(self, messages) -> int:
+        """Rate-limit budget reserved before the call: prompt (~4 chars/token) + max completion"""
+        prompt = sum(len(m.content) if isinstance(m.content, str) else len(str(m.content)) for m in messages)
+        return prompt // 4 + self.params.get("max_tokens", 0)
+
+    def _observe(self, seconds: float, value):
+        """Latency (None value = failed call) and, for plain chat responses, token usage"""
+        model = self.params["model"]
+        llm_seconds.observe(seconds, role=self.role, model=model, outcome="ok" if value is not None else "error")
+        if value is None:
+            return
+        record_latency(self.role, seconds)
+        usage = getattr(value, "usage_metadata", None)
+        if usage:
+            llm_tokens.inc(usage.get("input_tokens", 0), role=self.role, model=model, direction="prompt")
+            llm_tokens.inc(usage.get("output_tokens", 0), role=self.role, model=model, direction="completion")
+
+    def _call(self, messages, config=None):
+        scheduler = get_scheduler()
+        ticket = scheduler.acquire(self.params["model"], ROLE_PRIORITIES.get(self.role, PRIORITY_NORMAL),
+                                   self._estimate_tokens(messages))
+        value = None
+        started = time.perf_counter()
+        try:
+            value = self.runnable.invoke(messages, config=config)
+            return value
+        finally:
+            self._observe(time.perf_counter() - started, value)
+            scheduler.release(ticket, used_tokens(value))
+
+    async def _acall(self, messages, config=None):
+        scheduler = get_scheduler()
+        ticket = await scheduler.aacquire(self.params["model"], ROLE_PRIORITIES.get(self.role, PRIORITY_NORMAL),
+                                          self._estimate_tokens(messages))
+        value = None
+        started = time.perf_counter()
+        try:
+            value = await self.runnable.ainvoke(messages, config=config)
+            return value
+        finally:
+            self._observe(time.perf_counter() - started, value)
+            scheduler.release(ticket, used_tokens(value))
+
+    def invoke(self, messages, cache: bool = False, config=None):
+        """`config` is passed to the runnable (e.g. tags the token stream filters on)"""
+        response_cache = get_response_cache() if cache else None
+        if response_cache is None:
+            return self._call(messages, config)
+
+        key = self._key(messages)
+        cached = response_cache.get(key)
+        if cached is not None:
+            return self._decode(cached)
+
+        value = self._call(messages, config)
+        response_cache.set(key, self._encode(value))
+        return value
+
+    async def ainvoke(self, messages, cache: bool = False, config=None):
+        response_cache = get_response_cache() if cache else None
+        if response_cache is None:
+            return await self._acall(messages, config)
+
+        key = self._key(messages)
+        cached = await response_cache.aget(key)
+        if cached is not None:
+            return self._decode(cached)
+
+        value = await self._acall(messages, config)
+        await response_cache.aset(key, self._encode(value))
+        return value
+
+
+# =====================================================
+# Model registry: one model configuration per role
+# =====================================================
+LARGE_MODEL = "meta-llama/llama-4-maverick-17b-128e-instruct"
+SMALL_MODEL = "llama-3.1-8b-instant"
+
+# Classification and judging only emit a label, so they default to a small, fast model.
+# Override any field with GROQ_MODEL_<ROLE>, GROQ_TEMPERATURE_<ROLE>, GROQ_MAX_TOKENS_<ROLE>.
+DEFAULT_ROLES = {
+    "router": {"model": SMALL_MODEL, "temperature": 0.0, "max_tokens": 256},
+    "judger": {"model": SMALL_MODEL, "temperature": 0.0, "max_tokens": 256},
+    "generator": {"model": LARGE_MODEL, "temperature": 0.2, "max_tokens": 1000},
+    "reviewer": {"model": LARGE_MODEL, "temperature": 0.2, "max_tokens": 1000},
+    "answer": {"model": LARGE_MODEL, "temperature": 0.2, "max_tokens": 1000},
+    "summarizer": {"model": SMALL_MODEL, "temperature": 0.0, "max_tokens": 512},
+}
+
+# Scheduler queue order: short calls on the request's critical path go first
+ROLE_PRIORITIES = {
+    "router": PRIORITY_HIGH,
+    "judger": PRIORITY_HIGH,
+    "summarizer": PRIORITY_HIGH,
+    "answer": PRIORITY_NORMAL,
+    "generator": PRIORITY_LOW,
+    "reviewer": PRIORITY_LOW,
+}
+
+
+def role_config(role: str) -> dict:
+    defaults = DEFAULT_ROLES[role]
+    suffix = role.upper()
+    return {
+        "model": os.getenv(f"GROQ_MODEL_{suffix}", defaults["model"]),
+        "temperature": float(os.getenv(f"GROQ_TEMPERATURE_{suffix}", defaults["temperature"])),
+        "max_tokens": int(os.getenv(f"GROQ_MAX_TOKENS_{suffix}", defaults["max_tokens"])),
+    }
+
+
+MODEL_ROLES = {role: role_config(role) for role in DEFAULT_ROLES}
+
+_clients = {}
+_chat_models = {}
+_clients_lock = threading.Lock()
+
+
+def build_client(role: str) -> LLMClient:
+    # Roles configured with identical settings share one ChatGroq
+    params = MODEL_ROLES[role]
+    settings = (params["model"], params["temperature"], params["max_tokens"])
+    if settings not in _chat_models:
+        # Imported here: langchain_groq and the groq SDK are a large share of import time
+        from langchain_groq import ChatGroq
+        # The scheduler's HTTP clients feed it Groq's rate-limit headers
+        http_client, http_async_client = get_scheduler().http_clients(params["model"])
+        _chat_models[settings] = ChatGroq(**params, http_client=http_client, http_async_client=http_async_client)
+    return LLMClient(_chat_models[settings], params, role=role)
+
 
-def get_groq_model():
-    return ChatGroq(
-        model="meta-llama/llama-4-maverick-17b-128e-instruct",
-        temperature=0.2,
-        max_tokens=1000
-    )
+def get_model(role: str, schema=None) -> LLMClient:
+    """Client for `role` (optionally with structured output), built on first use and shared afterwards"""
+    key = (role, schema)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        if (role, None) not in _clients:
+            _clients[(role, None)] = build_client(role)
+        if key not in _clients:
+            _clients[key] = _clients[(role, None)].with_structured_output(schema)
+        return _clients[key]
 
 
+def get_groq_model(role: str = "generator") -> LLMClient:
+    return get_model(role)
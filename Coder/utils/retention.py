@@ -0,0 +1,191 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+from dataclasses import dataclass, asdict
+from dotenv import load_dotenv
+
+from utils.memory import get_client, CHECKPOINT_DB, CHECKPOINT_COLLECTION, WRITES_COLLECTION
+from utils.threads import sync_threads_collection
+from utils.tracing import log_event
+
+load_dotenv()
+
+# Retention policy applied by the background job and the CLI defaults
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "2"))
+CHECKPOINT_KEEP_PER_TURN = os.getenv("CHECKPOINT_KEEP_PER_TURN", "false").lower() == "true"
+CHECKPOINT_COMPACTION_BATCH = int(os.getenv("CHECKPOINT_COMPACTION_BATCH", "500"))
+# Seconds between background compaction runs; 0 disables the background job
+CHECKPOINT_COMPACTION_INTERVAL = float(os.getenv("CHECKPOINT_COMPACTION_INTERVAL", "0"))
+
+def checkpoint_collection():
+    return get_client()[CHECKPOINT_DB][CHECKPOINT_COLLECTION]
+
+
+def writes_collection():
+    return get_client()[CHECKPOINT_DB][WRITES_COLLECTION]
+
+
+@dataclass
+class RetentionPolicy:
+    """
+    keep_last: newest checkpoints always kept per thread (at least 1, the current state).
+    latest_per_turn: also keep the final checkpoint of every turn, so each past
+    question/answer state stays addressable while intermediate node steps go.
+    """
+    keep_last: int = CHECKPOINT_KEEP_LAST
+    latest_per_turn: bool = CHECKPOINT_KEEP_PER_TURN
+
+
+@dataclass
+class CompactionReport:
+    threads_scanned: int = 0
+    threads_compacted: int = 0
+    checkpoints_deleted: int = 0
+    writes_deleted: int = 0
+    bytes_reclaimed: int = 0
+    seconds: float = 0.0
+    dry_run: bool = False
+
+    def merge(self, other: "CompactionReport"):
+        self.threads_scanned += other.threads_scanned
+        self.threads_compacted += other.threads_compacted
+        self.checkpoints_deleted += other.checkpoints_deleted
+        self.writes_deleted += other.writes_deleted
+        self.bytes_reclaimed += other.bytes_reclaimed
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+# =====================================================
+# Selecting superseded checkpoints
+# =====================================================
+def checkpoint_source(doc: dict) -> str | None:
+    """metadata.source ("input", "loop", ...); the saver stores metadata values serialized"""
+    value = (doc.get("metadata") or {}).get("source")
+    if isinstance(value, bytes):
+        try:
+            value = json.loads(value.decode())
+        except (ValueError, UnicodeDecodeError):
+            value = value.decode(errors="ignore").strip('"')
+    return value
+
+
+def superseded_checkpoint_ids(docs: list, policy: RetentionPolicy) -> list:
+    """
+    docs: a thread's checkpoints sorted oldest first (checkpoint_id, metadata.source).
+    Returns the checkpoint ids the policy allows deleting.
+    """
+    ids = [doc["checkpoint_id"] for doc in docs]
+    keep = set(ids[-max(1, policy.keep_last):])
+
+    if policy.latest_per_turn:
+        # Each "input" checkpoint opens a turn, so the one before it closed the previous turn
+        for index, doc in enumerate(docs):
+            if index > 0 and checkpoint_source(doc) == "input":
+                keep.add(ids[index - 1])
+
+    return [checkpoint_id for checkpoint_id in ids if checkpoint_id not in keep]
+
+
+def collection_bytes(collection, query: dict) -> int:
+    result = list(collection.aggregate([
+        {"$match": query},
+        {"$group": {"_id": None, "bytes": {"$sum": {"$bsonSize": "$$ROOT"}}}},
+    ]))
+    return result[0]["bytes"] if result else 0
+
+
+# =====================================================
+# Compaction
+# =====================================================
+def compact_thread(thread_id: str, policy: RetentionPolicy, batch_size: int = CHECKPOINT_COMPACTION_BATCH,
+                   dry_run: bool = False, pause: float = 0.0) -> CompactionReport:
+    report = CompactionReport(threads_scanned=1, dry_run=dry_run)
+    docs = list(checkpoint_collection().find(
+        {"thread_id": thread_id, "checkpoint_ns": ""},
+        projection={"_id": 0, "checkpoint_id": 1, "metadata.source": 1},
+        sort=[("checkpoint_id", 1)],
+    ))
+    doomed = superseded_checkpoint_ids(docs, policy)
+    if not doomed:
+        return report
+    report.threads_compacted = 1
+
+    # Delete in bounded batches so a huge thread never becomes one long blocking operation
+    for start in range(0, len(doomed), batch_size):
+        batch = doomed[start:start + batch_size]
+        checkpoint_query = {"thread_id": thread_id, "checkpoint_ns": "", "checkpoint_id": {"$in": batch}}
+        writes_query = {"thread_id": thread_id, "checkpoint_ns": "", "checkpoint_id": {"$in": batch}}
+        report.bytes_reclaimed += collection_bytes(checkpoint_collection(), checkpoint_query)
+        report.bytes_reclaimed += collection_bytes(writes_collection(), writes_query)
+        if dry_run:
+            report.checkpoints_deleted += len(batch)
+            report.writes_deleted += writes_collection().count_documents(writes_query)
+        else:
+            report.checkpoints_deleted += checkpoint_collection().delete_many(checkpoint_query).deleted_count
+            report.writes_deleted += writes_collection().delete_many(writes_query).deleted_count
+        if pause:
+            time.sleep(pause)
+
+    return report
+
+
+def active_thread_ids(since: datetime):
+    """Ids of threads whose updated_at is at or after `since`"""
+    cursor = sync_threads_collection().find({"updated_at": {"$gte": since}}, projection={"_id": 0, "thread_id": 1})
+    for doc in cursor:
+        yield doc["thread_id"]
+
+
+def threads_over_limit(keep_last: int, since: datetime | None = None, batch_size: int = CHECKPOINT_COMPACTION_BATCH):
+    """
+    Thread ids with more checkpoints than keep_last, streamed from an aggregation.
+    With `since`, only threads written since then are counted, a batch of ids at a time,
+    instead of grouping the whole checkpoints collection.
+    """
+    pipeline = [
+        {"$group": {"_id": "$thread_id", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": max(1, keep_last)}}},
+    ]
+    if since is None:
+        matches = [{"checkpoint_ns": ""}]
+    else:
+        ids = list(active_thread_ids(since))
+        matches = [{"checkpoint_ns": "", "thread_id": {"$in": ids[start:start + batch_size]}}
+                   for start in range(0, len(ids), batch_size)]
+    for match in matches:
+        for doc in checkpoint_collection().aggregate([{"$match": match}, *pipeline], allowDiskUse=True):
+            yield doc["_id"]
+
+
+def compact_all(policy: RetentionPolicy | None = None, batch_size: int = CHECKPOINT_COMPACTION_BATCH,
+                dry_run: bool = False, pause: float = 0.0, since: datetime | None = None) -> CompactionReport:
+    """`since` limits the pass to threads written since then (see threads_over_limit)"""
+    policy = policy or RetentionPolicy()
+    started = time.perf_counter()
+    report = CompactionReport(dry_run=dry_run)
+    for thread_id in threads_over_limit(policy.keep_last, since=since, batch_size=batch_size):
+        report.merge(compact_thread(thread_id, policy, batch_size=batch_size, dry_run=dry_run, pause=pause))
+    report.seconds = round(time.perf_counter() - started, 3)
+    return report
+
+
+async def run_compaction_loop(interval: float = CHECKPOINT_COMPACTION_INTERVAL):
+    """
+    Background job started from the app lifespan; runs compact_all every `interval` seconds.
+    The first pass covers every thread, later ones only threads written since the previous
+    pass started (a thread touched during a pass is picked up by the next one).
+    """
+    since = None
+    while True:
+        await asyncio.sleep(interval)
+        started = datetime.now(timezone.utc)
+        try:
+            report = await asyncio.to_thread(compact_all, since=since)
+            since = started
+            log_event("checkpoint_compaction", **report.as_dict())
+        except Exception as e:
+            log_event("checkpoint_compaction_error", error=str(e))
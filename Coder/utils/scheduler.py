@@ -0,0 +1,350 @@
+import asyncio
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Callable
+import httpx
+from dotenv import load_dotenv
+
+from utils.lazy import singleton
+
+load_dotenv()
+
+# Outbound Groq calls in flight per process, across all models
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Limits per model; 0 = unknown. The token limit is corrected from Groq's x-ratelimit-*-tokens
+# headers. Groq's request headers count per day, not per minute, so they only pause a model
+# whose daily requests ran out; set the per-minute request limit of your tier here
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+# Longest a call may wait in the queue before failing with SchedulerTimeout
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "30"))
+LLM_HTTP_TIMEOUT_SECONDS = float(os.getenv("LLM_HTTP_TIMEOUT_SECONDS", "60"))
+
+# Lower runs first: short classification calls should not queue behind long generations
+PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW = 0, 1, 2
+PRIORITY_NAMES = {PRIORITY_HIGH: "high", PRIORITY_NORMAL: "normal", PRIORITY_LOW: "low"}
+
+WAIT_SAMPLES = 1000
+
+
+class SchedulerTimeout(TimeoutError):
+    """A call waited longer than its deadline for a slot or for rate-limit budget"""
+
+
+def parse_duration(value: str | None) -> float | None:
+    """Groq reset headers: "7.66s", "2m59.56s", "1h2m", "120ms"; plain numbers are seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    seconds = 0.0
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        seconds += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds
+
+
+# =====================================================
+# Rate limits
+# =====================================================
+class TokenBucket:
+    """Refills `capacity` per minute; capacity 0 means no known limit"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        # A request larger than the whole bucket only waits for a full bucket
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / self.capacity
+
+    def take(self, amount: float, now: float):
+        if self.capacity:
+            self._refill(now)
+            self.level -= amount
+
+    def refund(self, amount: float):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + amount)
+
+    def sync(self, limit: float | None, remaining: float | None, now: float):
+        """Groq's view is authoritative: adopt its limit, never assume more than it says remains"""
+        self._refill(now)
+        if limit:
+            self.capacity = limit
+        if remaining is not None and self.capacity:
+            self.level = min(self.level, remaining)
+
+
+class RateLimiter:
+    """Request and token buckets of one Groq model, plus a hard stop after a 429"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.blocked_until = 0.0
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now), self.blocked_until - now)
+
+    def take(self, tokens: int, now: float):
+        self.requests.take(1, now)
+        self.tokens.take(tokens, now)
+
+    def observe(self, status: int, headers, now: float):
+        def number(name):
+            try:
+                return float(headers[name])
+            except (KeyError, TypeError, ValueError):
+                return None
+
+        # Groq: requests are limited per day, tokens per minute
+        self.tokens.sync(number("x-ratelimit-limit-tokens"), number("x-ratelimit-remaining-tokens"), now)
+        remaining_requests = number("x-ratelimit-remaining-requests")
+        if remaining_requests is not None and remaining_requests < 1:
+            reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+            self.blocked_until = max(self.blocked_until, now + (reset or 60))
+        if status == 429:
+            retry_after = parse_duration(headers.get("retry-after")) or parse_duration(headers.get("x-ratelimit-reset-tokens"))
+            self.blocked_until = max(self.blocked_until, now + (retry_after or 1))
+
+
+# =====================================================
+# Scheduler
+# =====================================================
+@dataclass(order=True)
+class Ticket:
+    priority: int
+    seq: int
+    model: str = field(compare=False)
+    tokens: int = field(compare=False)
+    deadline: float = field(compare=False)
+    enqueued: float = field(compare=False)
+    cancelled: bool = field(default=False, compare=False)
+    # Wakes the thread/coroutine waiting on this ticket; called under the scheduler lock
+    wake: Callable = field(default=None, compare=False, repr=False)
+
+
+class LLMScheduler:
+    """
+    Admission control for outbound LLM calls. Calls queue per model by (priority, arrival);
+    when a concurrency slot is free, the highest-priority queue head whose model's
+    request/token buckets allow it is admitted, so a rate-limited model does not hold up
+    calls to the others. The buckets follow Groq's rate-limit headers, and a 429 pauses
+    that model until its retry-after, so queued calls wait instead of piling more 429s
+    on top. Only the call admitted next is woken. Works for threads (`acquire`) and
+    coroutines (`aacquire`) sharing the same queues.
+    """
+
+    def __init__(self, max_concurrency: int = 8, requests_per_minute: int = 0, tokens_per_minute: int = 0,
+                 queue_timeout: float = 30.0):
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.queue_timeout = queue_timeout
+        self.limiters = {}
+        self.active = 0
+        self._queues = {}  # model -> heap of tickets
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.counts = Counter()
+        self._waits = {name: deque(maxlen=WAIT_SAMPLES) for name in PRIORITY_NAMES.values()}
+
+    def limiter(self, model: str) -> RateLimiter:
+        limiter = self.limiters.get(model)
+        if limiter is None:
+            limiter = self.limiters[model] = RateLimiter(self.requests_per_minute, self.tokens_per_minute)
+        return limiter
+
+    # ---------- queue ----------
+    def _enqueue(self, model: str, priority: int, tokens: int, timeout: float | None, wake: Callable) -> Ticket:
+        now = time.monotonic()
+        ticket = Ticket(priority, next(self._seq), model, tokens,
+                        now + (self.queue_timeout if timeout is None else timeout), now, wake=wake)
+        with self._lock:
+            self.limiter(model)
+            heapq.heappush(self._queues.setdefault(model, []), ticket)
+        return ticket
+
+    def _heads(self):
+        """Under the lock: the first live ticket of every model's queue"""
+        for queue in self._queues.values():
+            while queue and queue[0].cancelled:
+                heapq.heappop(queue)
+            if queue:
+                yield queue[0]
+
+    def _next(self, now: float) -> Ticket | None:
+        """Under the lock: the ticket to admit now, if a slot is free and some model has budget"""
+        if self.active >= self.max_concurrency:
+            return None
+        ready = [head for head in self._heads() if self.limiters[head.model].wait_time(head.tokens, now) <= 0]
+        return min(ready) if ready else None
+
+    def _try_admit(self, ticket: Ticket) -> float | None:
+        """Under the lock: 0 when admitted, seconds until its model's budget frees up, or None to wait to be woken"""
+        now = time.monotonic()
+        chosen = self._next(now)
+        if chosen is not ticket:
+            if chosen is not None:
+                chosen.wake()
+            queue = self._queues[ticket.model]
+            if queue and queue[0] is ticket:
+                wait = self.limiters[ticket.model].wait_time(ticket.tokens, now)
+                if wait > 0:
+                    return wait
+            return None
+        heapq.heappop(self._queues[ticket.model])
+        self.limiters[ticket.model].take(ticket.tokens, now)
+        self.active += 1
+        self.counts["admitted"] += 1
+        self._waits[PRIORITY_NAMES[ticket.priority]].append(now - ticket.enqueued)
+        # Another slot may be free for the next ticket
+        self._notify()
+        return 0
+
+    def _notify(self):
+        """Under the lock: wake the call that can be admitted next, if any"""
+        chosen = self._next(time.monotonic())
+        if chosen is not None:
+            chosen.wake()
+
+    def _abandon(self, ticket: Ticket, timed_out: bool):
+        ticket.cancelled = True
+        self.counts["timed_out" if timed_out else "cancelled"] += 1
+        # It may have been the head of its model's queue
+        self._notify()
+
+    def acquire(self, model: str, priority: int = PRIORITY_NORMAL, tokens: int = 0, timeout: float | None = None) -> Ticket:
+        cond = threading.Condition(self._lock)
+        ticket = self._enqueue(model, priority, tokens, timeout, cond.notify)
+        with self._lock:
+            while True:
+                wait = self._try_admit(ticket)
+                if wait == 0:
+                    return ticket
+                remaining = ticket.deadline - time.monotonic()
+                if remaining <= 0:
+                    self._abandon(ticket, timed_out=True)
+                    raise SchedulerTimeout(f"LLM call for {model} queued {time.monotonic() - ticket.enqueued:.1f}s without a slot")
+                cond.wait(min(remaining, wait) if wait else remaining)
+
+    async def aacquire(self, model: str, priority: int = PRIORITY_NORMAL, tokens: int = 0, timeout: float | None = None) -> Ticket:
+        loop, event = asyncio.get_running_loop(), asyncio.Event()
+        ticket = self._enqueue(model, priority, tokens, timeout, lambda: loop.call_soon_threadsafe(event.set))
+        try:
+            while True:
+                with self._lock:
+                    # Cleared under the lock, so a wake after this check still reaches us
+                    event.clear()
+                    wait = self._try_admit(ticket)
+                if wait == 0:
+                    return ticket
+                remaining = ticket.deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._lock:
+                        self._abandon(ticket, timed_out=True)
+                    raise SchedulerTimeout(f"LLM call for {model} queued {time.monotonic() - ticket.enqueued:.1f}s without a slot")
+                try:
+                    await asyncio.wait_for(event.wait(), min(remaining, wait) if wait else remaining)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            with self._lock:
+                if not ticket.cancelled and ticket in self._queues[model]:
+                    self._abandon(ticket, timed_out=False)
+            raise
+
+    def release(self, ticket: Ticket, used_tokens: int | None = None):
+        """Free the slot; `used_tokens` (from the response usage) corrects the estimate taken"""
+        with self._lock:
+            self.active -= 1
+            if used_tokens is not None and used_tokens < ticket.tokens:
+                self.limiters[ticket.model].tokens.refund(ticket.tokens - used_tokens)
+            self._notify()
+
+    # ---------- Groq responses ----------
+    def observe(self, model: str, response: httpx.Response):
+        with self._lock:
+            if response.status_code == 429:
+                self.counts["rate_limited"] += 1
+            self.limiter(model).observe(response.status_code, response.headers, time.monotonic())
+            self._notify()
+
+    def http_clients(self, model: str) -> tuple:
+        """(sync, async) httpx clients for ChatGroq that report every response's rate-limit headers"""
+        from groq import DefaultHttpxClient, DefaultAsyncHttpxClient
+
+        def on_response(response):
+            self.observe(model, response)
+
+        async def aon_response(response):
+            self.observe(model, response)
+
+        timeout = httpx.Timeout(LLM_HTTP_TIMEOUT_SECONDS, connect=5.0)
+        return (
+            DefaultHttpxClient(timeout=timeout, event_hooks={"response": [on_response]}),
+            DefaultAsyncHttpxClient(timeout=timeout, event_hooks={"response": [aon_response]}),
+        )
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            queued = Counter(PRIORITY_NAMES[t.priority] for queue in self._queues.values() for t in queue if not t.cancelled)
+            waits = {name: sorted(samples) for name, samples in self._waits.items() if samples}
+            limiters = {
+                model: {
+                    "tokens_available": round(limiter.tokens.level) if limiter.tokens.capacity else None,
+                    "tokens_per_minute": limiter.tokens.capacity or None,
+                    "blocked_for_s": round(max(0.0, limiter.blocked_until - now), 1),
+                }
+                for model, limiter in self.limiters.items()
+            }
+            stats = {
+                "active": self.active,
+                "max_concurrency": self.max_concurrency,
+                "queue_depth": sum(queued.values()),
+                "queued": dict(queued),
+                **self.counts,
+            }
+        stats["wait_ms"] = {
+            name: {
+                "p50": round(samples[len(samples) // 2] * 1000, 1),
+                "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+            }
+            for name, samples in waits.items()
+        }
+        stats["models"] = limiters
+        return stats
+
+
+# =====================================================
+# Process-wide scheduler
+# =====================================================
+@singleton
+def get_scheduler() -> LLMScheduler:
+    return LLMScheduler(
+        max_concurrency=LLM_MAX_CONCURRENCY,
+        requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+        queue_timeout=LLM_QUEUE_TIMEOUT_SECONDS,
+    )
@@ -0,0 +1,201 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import CancelledError, Future
+import httpx
+from dotenv import load_dotenv
+
+from utils.cache import LRUCache, MongoCacheTier, TieredCache, make_cache_key
+from utils.lazy import singleton
+from utils.metrics import search_seconds
+
+load_dotenv()
+
+TAVILY_API_URL = "https://api.tavily.com"
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "3"))
+SEARCH_TIMEOUT_SECONDS = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "15"))
+SEARCH_MAX_CONNECTIONS = int(os.getenv("SEARCH_MAX_CONNECTIONS", "20"))
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+SEARCH_CACHE_MAX_SIZE = int(os.getenv("SEARCH_CACHE_MAX_SIZE", "512"))
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", "21600"))
+SEARCH_CACHE_MONGO = os.getenv("SEARCH_CACHE_MONGO", "false").lower() == "true"
+
+
+def normalize_query(query: str) -> str:
+    """Case, whitespace and trailing punctuation do not change what Tavily returns"""
+    return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!. ")
+
+
+class SearchClient:
+    """
+    Long-lived Tavily client: one pooled HTTP connection set per process, a result cache
+    keyed on the normalized query, and coalescing of identical in-flight queries so
+    concurrent requests share one outbound call. `invoke`/`ainvoke` keep the TavilySearch
+    tool interface and return Tavily's raw response dict.
+    """
+
+    def __init__(self, api_key: str | None, max_results: int = 3, topic: str = "general",
+                 cache: TieredCache | None = None):
+        self.max_results = max_results
+        self.topic = topic
+        self.cache = cache
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._limits = httpx.Limits(max_connections=SEARCH_MAX_CONNECTIONS, max_keepalive_connections=SEARCH_MAX_CONNECTIONS)
+        self._client_args = {"base_url": TAVILY_API_URL, "headers": headers, "timeout": SEARCH_TIMEOUT_SECONDS, "limits": self._limits}
+        self._client = httpx.Client(**self._client_args)
+        self._async_client = None
+        self._inflight = {}
+        self._ainflight = {}
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def _payload(self, query: str) -> dict:
+        return {"query": query, "max_results": self.max_results, "topic": self.topic}
+
+    def _key(self, query: str) -> str:
+        return make_cache_key("tavily", self.topic, self.max_results, normalize_query(query))
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+
+    # -------------------- sync --------------------
+    def _fetch(self, query: str) -> dict:
+        self._count("outbound")
+        started, outcome = time.perf_counter(), "error"
+        try:
+            response = self._client.post("/search", json=self._payload(query))
+            response.raise_for_status()
+            outcome = "ok"
+            return response.json()
+        finally:
+            search_seconds.observe(time.perf_counter() - started, outcome=outcome)
+
+    def search(self, query: str) -> dict:
+        key = self._key(query)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._count("cache_hits")
+                return cached
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.counts["coalesced"] += 1
+        if not owner:
+            try:
+                return future.result()
+            except CancelledError:
+                # The owning call died without a result (BaseException), search on our own behalf
+                return self.search(query)
+
+        try:
+            result = self._fetch(query)
+            if self.cache is not None:
+                self.cache.set(key, result)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            # Never leave waiters blocked: resolve the future if nothing above did
+            if not future.done():
+                future.cancel()
+
+    def invoke(self, input) -> dict:
+        return self.search(input["query"] if isinstance(input, dict) else input)
+
+    # -------------------- async --------------------
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._client_args)
+        return self._async_client
+
+    async def _afetch(self, query: str) -> dict:
+        self._count("outbound")
+        started, outcome = time.perf_counter(), "error"
+        try:
+            response = await self._get_async_client().post("/search", json=self._payload(query))
+            response.raise_for_status()
+            outcome = "ok"
+            return response.json()
+        finally:
+            search_seconds.observe(time.perf_counter() - started, outcome=outcome)
+
+    async def asearch(self, query: str) -> dict:
+        key = self._key(query)
+        if self.cache is not None:
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                self._count("cache_hits")
+                return cached
+
+        # Only touched from the event loop thread, no lock needed
+        future = self._ainflight.get(key)
+        if future is not None:
+            self._count("coalesced")
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            # The request that owned the call was cancelled, search on our own behalf
+            return await self.asearch(query)
+        future = self._ainflight[key] = asyncio.get_running_loop().create_future()
+
+        try:
+            result = await self._afetch(query)
+            if self.cache is not None:
+                await self.cache.aset(key, result)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting on it
+            future.exception()
+            raise
+        finally:
+            self._ainflight.pop(key, None)
+
+    async def ainvoke(self, input) -> dict:
+        return await self.asearch(input["query"] if isinstance(input, dict) else input)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counts)
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+
+# =====================================================
+# Process-wide client
+# =====================================================
+@singleton
+def get_search_client() -> SearchClient:
+    cache = None
+    if SEARCH_CACHE_ENABLED:
+        shared = None
+        if SEARCH_CACHE_MONGO:
+            from utils.memory import get_db, get_async_db
+            shared = MongoCacheTier(get_db()["search_cache"], get_async_db()["search_cache"], ttl=SEARCH_CACHE_TTL_SECONDS)
+        cache = TieredCache(LRUCache(SEARCH_CACHE_MAX_SIZE, SEARCH_CACHE_TTL_SECONDS), shared)
+    return SearchClient(
+        os.getenv("TAVILY_API_KEY"),
+        max_results=SEARCH_MAX_RESULTS,
+        topic="general",
+        cache=cache,
+    )
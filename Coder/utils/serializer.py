@@ -0,0 +1,98 @@
+import os
+import threading
+from dotenv import load_dotenv
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+try:
+    import zstandard
+except ImportError:  # only needed to write compressed checkpoints or read ones written so
+    zstandard = None
+
+load_dotenv()
+
+# Opt-in: compress checkpoints and pending writes with zstd. Only writes depend on it;
+# compressed values are always readable, so switching it off again is a safe rollback
+CHECKPOINT_COMPRESSION = os.getenv("CHECKPOINT_COMPRESSION", "false").lower() == "true"
+CHECKPOINT_ZSTD_LEVEL = int(os.getenv("CHECKPOINT_ZSTD_LEVEL", "3"))
+# Optional dictionary trained with scripts/train_zstd_dict.py; every reader needs it too
+CHECKPOINT_ZSTD_DICT = os.getenv("CHECKPOINT_ZSTD_DICT", "")
+
+ZSTD_PREFIX = "zstd+"
+
+
+class ZstdSerializer:
+    """
+    Wraps LangGraph's serializer and zstd-compresses its output. The stored type becomes
+    "zstd+<inner type>", so values written before compression was enabled (plain
+    "msgpack"/"json" types) are still read as-is, and payloads below `min_size` are
+    left uncompressed because the frame overhead would outweigh the gain.
+    With `compress=False` it writes exactly what the inner serializer does and only
+    decompresses on read.
+    """
+
+    def __init__(self, inner=None, level: int = 3, dictionary: bytes | None = None, min_size: int = 256,
+                 compress: bool = True):
+        if compress and zstandard is None:
+            raise RuntimeError("CHECKPOINT_COMPRESSION requires the 'zstandard' package")
+        self.inner = inner or JsonPlusSerializer()
+        self.level = level
+        self.dictionary = dictionary
+        self.min_size = min_size
+        self.compress = compress
+        # zstd contexts are not thread safe; checkpoints are written from many threads
+        self._local = threading.local()
+
+    def _dict_data(self):
+        return zstandard.ZstdCompressionDict(self.dictionary) if self.dictionary else None
+
+    def _compressor(self):
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self._dict_data())
+        return compressor
+
+    def _decompressor(self):
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            if zstandard is None:
+                raise RuntimeError("Reading a compressed checkpoint requires the 'zstandard' package")
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor(dict_data=self._dict_data())
+        return decompressor
+
+    def dumps_typed(self, obj) -> tuple:
+        type_, data = self.inner.dumps_typed(obj)
+        if not self.compress or len(data) < self.min_size:
+            return type_, data
+        return ZSTD_PREFIX + type_, self._compressor().compress(data)
+
+    def loads_typed(self, data: tuple):
+        type_, payload = data
+        if type_.startswith(ZSTD_PREFIX):
+            return self.inner.loads_typed((type_[len(ZSTD_PREFIX):], self._decompressor().decompress(payload)))
+        return self.inner.loads_typed(data)
+
+    # Untyped methods of SerializerProtocol, used for metadata
+    def dumps(self, obj) -> bytes:
+        return self.inner.dumps(obj)
+
+    def loads(self, data: bytes):
+        return self.inner.loads(data)
+
+
+def load_dictionary(path: str) -> bytes | None:
+    if not path:
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def build_checkpoint_serializer() -> ZstdSerializer:
+    """
+    Serializer for the checkpointers. Always installed so compressed checkpoints stay
+    readable; CHECKPOINT_COMPRESSION only decides whether new writes are compressed
+    """
+    return ZstdSerializer(
+        level=CHECKPOINT_ZSTD_LEVEL,
+        dictionary=load_dictionary(CHECKPOINT_ZSTD_DICT),
+        compress=CHECKPOINT_COMPRESSION,
+    )
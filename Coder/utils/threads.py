@@ -0,0 +1,106 @@
+import base64
+import json
+from datetime import datetime, timezone
+from pymongo import ASCENDING, DESCENDING
+
+from utils.memory import get_db, get_async_db
+from utils.indexes import IndexSpec
+
+# One document per conversation:
+# {thread_id, owner_id, title, message_count, created_at, updated_at}
+def threads_collection():
+    return get_async_db()["threads"]
+
+
+def sync_threads_collection():
+    """Sync handle for code running outside the event loop (background job workers)"""
+    return get_db()["threads"]
+
+
+TITLE_LENGTH = 80
+
+
+INDEXES = [
+    # Ownership checks and lookups by id
+    IndexSpec(threads_collection, (("thread_id", ASCENDING),), unique=True),
+    # Sidebar listing: a user's threads, most recently active first
+    IndexSpec(threads_collection, (("owner_id", ASCENDING), ("updated_at", DESCENDING), ("thread_id", DESCENDING))),
+    # Background compaction: threads active since its previous pass
+    IndexSpec(threads_collection, (("updated_at", ASCENDING),)),
+]
+
+
+def make_title(message: str) -> str:
+    title = " ".join(message.split())
+    return title if len(title) <= TITLE_LENGTH else title[:TITLE_LENGTH - 1] + "…"
+
+
+async def create_thread(owner_id, thread_id: str, first_message: str):
+    now = datetime.now(timezone.utc)
+    await threads_collection().insert_one({
+        "thread_id": thread_id,
+        "owner_id": owner_id,
+        "title": make_title(first_message),
+        "message_count": 0,
+        "created_at": now,
+        "updated_at": now,
+    })
+
+
+async def owns_thread(owner_id, thread_id: str) -> bool:
+    """Single indexed lookup instead of scanning the user's thread list"""
+    doc = await threads_collection().find_one({"thread_id": thread_id, "owner_id": owner_id}, projection={"_id": 1})
+    return doc is not None
+
+
+def touch_update(new_messages: int) -> dict:
+    return {"$inc": {"message_count": new_messages}, "$set": {"updated_at": datetime.now(timezone.utc)}}
+
+
+async def touch_thread(thread_id: str, new_messages: int = 2):
+    """Record a completed exchange (user message + answer)"""
+    await threads_collection().update_one({"thread_id": thread_id}, touch_update(new_messages))
+
+
+def touch_thread_sync(thread_id: str, new_messages: int = 2):
+    sync_threads_collection().update_one({"thread_id": thread_id}, touch_update(new_messages))
+
+
+# =====================================================
+# Cursor pagination over (updated_at, thread_id)
+# =====================================================
+def encode_cursor(doc: dict) -> str:
+    raw = json.dumps([doc["updated_at"].isoformat(), doc["thread_id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(updated_at, thread_id) of a cursor; ValueError for anything encode_cursor did not produce"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:  # binascii.Error, JSONDecodeError, UnicodeDecodeError
+        raise ValueError(f"malformed cursor: {e}") from e
+    if not (isinstance(data, list) and len(data) == 2 and all(isinstance(part, str) for part in data)):
+        raise ValueError("malformed cursor")
+    return datetime.fromisoformat(data[0]), data[1]
+
+
+async def list_threads(owner_id, limit: int = 50, cursor: str | None = None) -> tuple:
+    """One page of the owner's threads (newest activity first) and the cursor of the next page"""
+    query = {"owner_id": owner_id}
+    if cursor:
+        updated_at, thread_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"updated_at": {"$lt": updated_at}},
+            {"updated_at": updated_at, "thread_id": {"$lt": thread_id}},
+        ]
+
+    docs = await threads_collection().find(
+        query,
+        projection={"_id": 0, "thread_id": 1, "title": 1, "message_count": 1, "updated_at": 1},
+        sort=[("updated_at", DESCENDING), ("thread_id", DESCENDING)],
+        limit=limit + 1,
+    ).to_list()
+
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Failed logins per account before it is locked out for the rest of the window
+LOGIN_MAX_FAILURES_PER_ACCOUNT = int(os.getenv("LOGIN_MAX_FAILURES_PER_ACCOUNT", "5"))
+LOGIN_ACCOUNT_WINDOW_SECONDS = float(os.getenv("LOGIN_ACCOUNT_WINDOW_SECONDS", "900"))
+# Signup + login attempts per client IP, successful or not
+AUTH_MAX_ATTEMPTS_PER_IP = int(os.getenv("AUTH_MAX_ATTEMPTS_PER_IP", "30"))
+AUTH_IP_WINDOW_SECONDS = float(os.getenv("AUTH_IP_WINDOW_SECONDS", "300"))
+# Take the client IP from X-Forwarded-For; only safe behind a proxy that sets it (Vercel does)
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS", "true" if os.getenv("VERCEL") else "false").lower() == "true"
+
+MAX_TRACKED_KEYS = 100_000
+
+
+class AttemptLimiter:
+    """
+    At most `limit` recorded attempts per key in any `window` seconds (sliding log).
+    Per process: with N workers an attacker gets up to N times the limit.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = MAX_TRACKED_KEYS):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._attempts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recent(self, key: str, now: float) -> deque:
+        attempts = self._attempts.get(key)
+        if attempts is None:
+            return deque()
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        if not attempts:
+            del self._attempts[key]
+        return attempts
+
+    def retry_after(self, key: str) -> float:
+        """Seconds until `key` may try again; 0 if it may now"""
+        if self.limit <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._recent(key, now)
+            if len(attempts) < self.limit:
+                return 0.0
+            return attempts[-self.limit] + self.window - now
+
+    def record(self, key: str):
+        if self.limit <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.setdefault(key, deque(maxlen=self.limit))
+            attempts.append(now)
+            self._attempts.move_to_end(key)
+            while len(self._attempts) > self.max_keys:
+                self._attempts.popitem(last=False)
+
+    def reset(self, key: str):
+        with self._lock:
+            self._attempts.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"tracked_keys": len(self._attempts)}
+
+
+account_failures = AttemptLimiter(LOGIN_MAX_FAILURES_PER_ACCOUNT, LOGIN_ACCOUNT_WINDOW_SECONDS)
+ip_attempts = AttemptLimiter(AUTH_MAX_ATTEMPTS_PER_IP, AUTH_IP_WINDOW_SECONDS)
+
+
+def client_ip(request) -> str:
+    if TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def throttle_stats() -> dict:
+    return {"accounts": account_failures.stats(), "ips": ip_attempts.stats()}
@@ -0,0 +1,28 @@
+import json
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+
+# Trace id of the request being handled; copied into graph tasks and LangChain's
+# executor threads along with the rest of the context
+trace_id_var = ContextVar("trace_id", default=None)
+
+TRACE_HEADER = "X-Request-ID"
+
+
+def new_trace_id(incoming: str | None = None) -> str:
+    """Reuse a sane client/proxy supplied id, otherwise make one"""
+    if incoming and len(incoming) <= 128 and incoming.isprintable():
+        return incoming
+    return uuid.uuid4().hex
+
+
+def current_trace_id() -> str | None:
+    return trace_id_var.get()
+
+
+def log_event(event: str, **fields):
+    """One JSON line on stdout, tagged with the current trace id"""
+    record = {"ts": round(time.time(), 3), "event": event, "trace_id": trace_id_var.get(), **fields}
+    print(json.dumps(record, default=str), file=sys.stdout, flush=True)
@@ -0,0 +1,126 @@
+import os
+import time
+from bson import ObjectId
+from bson.errors import InvalidId
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pymongo import ASCENDING
+
+from config.auth import verify_access_token
+from utils.cache import LRUCache
+from utils.memory import get_async_user_collection
+from utils.indexes import IndexSpec
+from utils.threads import owns_thread
+
+load_dotenv()
+
+# Decoded JWTs, keyed by signature, so a token is verified once rather than per request
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "4096"))
+TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL_SECONDS", "300"))
+# Users by id; short TTL since other processes can change the document
+USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "2048"))
+USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "60"))
+# Comma-separated emails allowed on operator endpoints such as /stats; empty means nobody
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
+_tokens = LRUCache(max_size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+_users = LRUCache(max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+USER_PROJECTION = {"_id": 1, "email": 1, "name": 1}
+
+
+INDEXES = [
+    # Login/signup lookups; also makes concurrent signups with one email fail cleanly
+    IndexSpec(get_async_user_collection, (("email", ASCENDING),), unique=True),
+]
+
+
+# =====================================================
+# Tokens
+# =====================================================
+def decode_token(token: str) -> dict | None:
+    """verify_access_token behind the signature cache; None if invalid or expired"""
+    signing_input, _, signature = token.rpartition(".")
+    if not signature:
+        return None
+    cached = _tokens.get(signature)
+    # The signature alone is not the token: a hit must also carry the same header and claims
+    if cached is not None and cached[0] == signing_input:
+        payload = cached[1]
+    else:
+        payload = verify_access_token(token)
+        if payload is None:
+            return None
+        _tokens.set(signature, (signing_input, payload))
+    # Cached entries can outlive the token itself
+    if payload.get("exp") is not None and payload["exp"] <= time.time():
+        _tokens.delete(signature)
+        return None
+    return payload
+
+
+# =====================================================
+# Users
+# =====================================================
+async def load_user(user_id: str) -> dict | None:
+    """
+    {_id, email, name, threads} for a user id, from the TTL cache when possible.
+    `threads` holds thread ids already known to belong to the user.
+    """
+    user = _users.get(user_id)
+    if user is not None:
+        return user
+    try:
+        oid = ObjectId(user_id)
+    except (InvalidId, TypeError):
+        return None
+    doc = await get_async_user_collection().find_one({"_id": oid}, projection=USER_PROJECTION)
+    if doc is None:
+        return None
+    user = {**doc, "threads": set()}
+    _users.set(user_id, user)
+    return user
+
+
+def invalidate_user(user_id) -> None:
+    _users.delete(str(user_id))
+
+
+def remember_thread(user: dict, thread_id: str) -> None:
+    """Record a thread the user just created, so its ownership check needs no query"""
+    user["threads"].add(thread_id)
+
+
+async def user_owns_thread(user: dict, thread_id: str) -> bool:
+    """Cached positive answers; ownership never changes, so only misses go to Mongo"""
+    if thread_id in user["threads"]:
+        return True
+    if await owns_thread(user["_id"], thread_id):
+        user["threads"].add(thread_id)
+        return True
+    return False
+
+
+async def current_user(credentials: HTTPAuthorizationCredentials | None = Depends(bearer_scheme)) -> dict:
+    """FastAPI dependency: the user behind the request's bearer token, or 401"""
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    payload = decode_token(credentials.credentials)
+    user = await load_user(payload.get("sub")) if payload else None
+    if user is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired token", headers={"WWW-Authenticate": "Bearer"})
+    return user
+
+
+async def admin_user(user: dict = Depends(current_user)) -> dict:
+    """FastAPI dependency: like current_user, but 403 unless the email is in ADMIN_EMAILS"""
+    if (user.get("email") or "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Not allowed")
+    return user
+
+
+def auth_stats() -> dict:
+    return {"tokens": _tokens.stats(), "users": _users.stats()}
@@ -0,0 +1,230 @@
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+from utils.tracing import log_event
+
+load_dotenv()
+
+LABELS = ("code_generation", "code_reviewer", "end")
+
+# Local decisions at or above this confidence skip the LLM router (set > 1 to disable);
+# calibrate it on logged decisions with scripts/eval_router.py --calibrate
+ROUTER_FAST_PATH_THRESHOLD = float(os.getenv("ROUTER_FAST_PATH_THRESHOLD", "0.85"))
+# A single keyword is weak evidence ("explain what a 404 error means" mentions an error):
+# the fast path also needs this many rule hits for the label, or one decisive rule
+ROUTER_FAST_PATH_MIN_HITS = int(os.getenv("ROUTER_FAST_PATH_MIN_HITS", "2"))
+# ... and a rule-score lead of at least this much over the runner-up label
+ROUTER_FAST_PATH_MARGIN = float(os.getenv("ROUTER_FAST_PATH_MARGIN", "2.0"))
+# Rules this heavy (greetings, "who are you") settle the label on their own
+DECISIVE_RULE_WEIGHT = 4.0
+# Fraction of fast-path decisions re-checked by the LLM router in the background; both
+# labels are logged, so the fast path's agreement can be measured in production
+ROUTER_SHADOW_SAMPLE_RATE = float(os.getenv("ROUTER_SHADOW_SAMPLE_RATE", "0.02"))
+# Optional bag-of-words model trained with scripts/eval_router.py --train
+ROUTER_CLASSIFIER_MODEL = os.getenv("ROUTER_CLASSIFIER_MODEL", "")
+# Optional JSONL file where LLM router decisions are appended (training/eval data)
+ROUTER_DECISION_LOG = os.getenv("ROUTER_DECISION_LOG", "")
+
+
+@dataclass
+class Classification:
+    label: str
+    confidence: float
+    hits: int = 0  # rules that matched for `label`
+    margin: float = 0.0  # rule score of `label` minus the best other label's
+    decisive: bool = False  # a DECISIVE_RULE_WEIGHT rule matched for `label`
+
+
+# =====================================================
+# Weighted keyword / regex rules
+# =====================================================
+RULES = [
+    # Generation: an action verb aimed at a code artifact
+    ("code_generation", re.compile(
+        r"\b(write|create|generate|build|implement|make|give me|show me)\b.{0,40}?"
+        r"\b(function|class|script|code|program|api|endpoint|app|component|query|regex|algorithm|snippet|module)\b"
+    ), 3.0),
+    ("code_generation", re.compile(r"\bhow (do|can|would) i (write|implement|create|build|code)\b"), 2.0),
+    ("code_generation", re.compile(r"\b(in|using) (python|javascript|typescript|java|c\+\+|c#|go|rust|sql|react|node)\b"), 1.0),
+    # Review / debugging: errors, fixes, or pasted code
+    ("code_reviewer", re.compile(
+        r"\b(review|debug|fix|bug|error|exception|traceback|stack trace|not working|doesn'?t work|"
+        r"fails?|failing|crash(es|ing)?|optimi[sz]e|refactor|improve (this|my))\b"
+    ), 3.0),
+    ("code_reviewer", re.compile(r"```|\btraceback \(most recent call last\)|^\s*(def|class|function|import|const|let) ", re.M), 2.0),
+    ("code_reviewer", re.compile(r"\b(what'?s wrong|why (does|is|doesn'?t)|what is wrong)\b"), 1.5),
+    # Chit-chat and simple questions
+    ("end", re.compile(r"^\s*(hi|hello|hey|yo|thanks|thank you|good (morning|afternoon|evening)|bye|ok(ay)?)\b[\s!.?]*$"), 5.0),
+    ("end", re.compile(r"^\s*(who are you|what is your name|how are you)\b"), 4.0),
+    ("end", re.compile(r"^\s*(what is|what are|what does|explain|difference between)\b"), 1.5),
+]
+
+TOKEN_PATTERN = re.compile(r"[a-z_][a-z0-9_+#']*")
+
+
+def tokenize(text: str) -> list:
+    """Unigrams plus bigrams of the lowercased text"""
+    words = TOKEN_PATTERN.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def softmax(scores: dict) -> dict:
+    peak = max(scores.values())
+    exps = {label: math.exp(score - peak) for label, score in scores.items()}
+    total = sum(exps.values())
+    return {label: value / total for label, value in exps.items()}
+
+
+def rule_scores(text: str) -> tuple:
+    """({label: summed weight}, {label: matching rules}, {label: max matching weight})"""
+    lowered = text.lower()
+    scores = {label: 0.0 for label in LABELS}
+    hits = {label: 0 for label in LABELS}
+    strongest = {label: 0.0 for label in LABELS}
+    for label, pattern, weight in RULES:
+        if pattern.search(lowered):
+            scores[label] += weight
+            hits[label] += 1
+            strongest[label] = max(strongest[label], weight)
+    return scores, hits, strongest
+
+
+def rule_probabilities(text: str) -> dict:
+    return softmax(rule_scores(text)[0])
+
+
+# =====================================================
+# Multinomial naive Bayes over logged RouterDecisions
+# =====================================================
+class NaiveBayesModel:
+    def __init__(self, priors: dict, counts: dict, totals: dict, vocab_size: int):
+        self.priors = priors
+        self.counts = counts
+        self.totals = totals
+        self.vocab_size = vocab_size
+
+    @classmethod
+    def train(cls, samples) -> "NaiveBayesModel":
+        """samples: iterable of (query, label)"""
+        label_docs = Counter()
+        counts = {label: Counter() for label in LABELS}
+        vocab = set()
+        for query, label in samples:
+            if label not in counts:
+                continue
+            label_docs[label] += 1
+            tokens = tokenize(query)
+            counts[label].update(tokens)
+            vocab.update(tokens)
+        n_docs = sum(label_docs.values()) or 1
+        priors = {label: math.log((label_docs[label] + 1) / (n_docs + len(LABELS))) for label in LABELS}
+        totals = {label: sum(counts[label].values()) for label in LABELS}
+        return cls(priors, {label: dict(c) for label, c in counts.items()}, totals, len(vocab))
+
+    def probabilities(self, text: str) -> dict:
+        scores = dict(self.priors)
+        for token in tokenize(text):
+            for label in LABELS:
+                count = self.counts[label].get(token, 0)
+                scores[label] += math.log((count + 1) / (self.totals[label] + self.vocab_size + 1))
+        return softmax(scores)
+
+    def to_dict(self) -> dict:
+        return {"priors": self.priors, "counts": self.counts, "totals": self.totals, "vocab_size": self.vocab_size}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "NaiveBayesModel":
+        return cls(data["priors"], data["counts"], data["totals"], data["vocab_size"])
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: str) -> "NaiveBayesModel":
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def load_default_model() -> NaiveBayesModel | None:
+    if ROUTER_CLASSIFIER_MODEL and os.path.exists(ROUTER_CLASSIFIER_MODEL):
+        try:
+            return NaiveBayesModel.load(ROUTER_CLASSIFIER_MODEL)
+        except Exception as e:
+            log_event("router_model_error", path=ROUTER_CLASSIFIER_MODEL, error=str(e))
+    return None
+
+
+bow_model = load_default_model()
+
+
+# =====================================================
+# Public API
+# =====================================================
+_default_model = object()
+
+
+def classify_request(text: str, model=_default_model) -> Classification:
+    """Label the request locally; rules alone, or rules averaged with the bag-of-words model"""
+    if model is _default_model:
+        model = bow_model
+    scores, hits, strongest = rule_scores(text)
+    probabilities = softmax(scores)
+    if model is not None:
+        learned = model.probabilities(text)
+        probabilities = {label: (probabilities[label] + learned[label]) / 2 for label in LABELS}
+    label = max(probabilities, key=probabilities.get)
+    margin = scores[label] - max(score for other, score in scores.items() if other != label)
+    return Classification(label, probabilities[label], hits[label], margin, strongest[label] >= DECISIVE_RULE_WEIGHT)
+
+
+def fast_path_allowed(result: Classification, threshold: float = ROUTER_FAST_PATH_THRESHOLD) -> bool:
+    """Confident, corroborated by several rules (or one decisive rule) and clear of the runner-up"""
+    return (
+        result.confidence >= threshold
+        and (result.hits >= ROUTER_FAST_PATH_MIN_HITS or result.decisive)
+        and result.margin >= ROUTER_FAST_PATH_MARGIN
+    )
+
+
+def fast_path_decision(text: str) -> str | None:
+    """Router label when the local classifier is confident enough, else None (ask the LLM)"""
+    result = classify_request(text)
+    if fast_path_allowed(result):
+        return result.label
+    return None
+
+
+def should_shadow() -> bool:
+    """Whether to re-check this fast-path decision with the LLM router"""
+    return ROUTER_SHADOW_SAMPLE_RATE > 0 and random.random() < ROUTER_SHADOW_SAMPLE_RATE
+
+
+_log_lock = threading.Lock()
+
+
+def log_router_decision(query: str, label: str, fast_path: str | None = None):
+    """
+    Append an LLM router decision to ROUTER_DECISION_LOG, if configured. Shadowed
+    fast-path decisions also carry the local label as `fast_path`.
+    """
+    if fast_path is not None:
+        log_event("router_shadow", llm=label, fast_path=fast_path, agree=label == fast_path)
+    if not ROUTER_DECISION_LOG:
+        return
+    record = {"query": query, "label": label, "ts": time.time()}
+    if fast_path is not None:
+        record["fast_path"] = fast_path
+    try:
+        with _log_lock, open(ROUTER_DECISION_LOG, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        log_event("router_log_error", error=str(e))
@@ -1,9 +1,27 @@
 from workflow.schemas import AgentState
-from workflow.nodes import router_node, code_generation_node, code_reviewer_node, web_node, answer_node
-from langchain_core.messages import HumanMessage
-from utils.memory import checkpointer
+from workflow.nodes import (
+    memory_node, router_node, code_generation_node, code_reviewer_node, web_node, answer_node,
+    amemory_node, arouter_node, acode_generation_node, acode_reviewer_node, aweb_node, aanswer_node,
+    STREAM_ANSWER_TAG,
+)
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
+from utils.memory import get_checkpointer, get_async_checkpointer, get_history_checkpointer
+from utils.lazy import singleton
+from utils.cancellation import RunHandle, RunCancelled
+from utils.metrics import node_seconds
 from langgraph.graph import END, StateGraph
-from langchain.schema import HumanMessage, AIMessage
+from dotenv import load_dotenv
+import asyncio
+import os
+import time
+
+load_dotenv()
+
+# When a generation/review is judged sufficient it is the final answer and the graph
+# ends there; answer_node then only runs to synthesize drafts with web results.
+# Set to "false" to always finish through answer_node (previous behaviour).
+SKIP_ANSWER_WHEN_SUFFICIENT = os.getenv("SKIP_ANSWER_WHEN_SUFFICIENT", "true").lower() == "true"
 
 
 # =====================================================
@@ -24,65 +42,291 @@ def filter_human_ai_pairs(messages):
 # =====================================================
 # Build the LangGraph
 # =====================================================
-workflow = StateGraph(AgentState)
+def timed_node(name: str, func, afunc) -> RunnableLambda:
+    """
+    Node runnable with its sync and async implementation (invoke/stream use the former,
+    ainvoke/astream the latter), recording wall time per node and outcome.
+    """
+    def outcome_of(error: BaseException | None) -> str:
+        if error is None:
+            return "ok"
+        return "cancelled" if isinstance(error, (asyncio.CancelledError, RunCancelled)) else "error"
+
+    def run(state):
+        started, error = time.perf_counter(), None
+        try:
+            return func(state)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            node_seconds.observe(time.perf_counter() - started, node=name, outcome=outcome_of(error))
+
+    async def arun(state):
+        started, error = time.perf_counter(), None
+        try:
+            return await afunc(state)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            node_seconds.observe(time.perf_counter() - started, node=name, outcome=outcome_of(error))
+
+    return RunnableLambda(run, afunc=arun)
+
 
-workflow.add_node("router", router_node)
-workflow.add_node("code_generation", code_generation_node)
-workflow.add_node("code_reviewer", code_reviewer_node)
-workflow.add_node("web", web_node)
-workflow.add_node("answer", answer_node)
+def build_workflow() -> StateGraph:
+    workflow = StateGraph(AgentState)
 
-workflow.set_entry_point("router")
+    workflow.add_node("memory", timed_node("memory", memory_node, amemory_node))
+    workflow.add_node("router", timed_node("router", router_node, arouter_node))
+    workflow.add_node("code_generation", timed_node("code_generation", code_generation_node, acode_generation_node))
+    workflow.add_node("code_reviewer", timed_node("code_reviewer", code_reviewer_node, acode_reviewer_node))
+    workflow.add_node("web", timed_node("web", web_node, aweb_node))
+    workflow.add_node("answer", timed_node("answer", answer_node, aanswer_node))
 
-workflow.add_conditional_edges("router", lambda x: x["router"], {
-    "code_generation": "code_generation",
-    "code_reviewer": "code_reviewer",
-    "end": END
-})
-workflow.add_conditional_edges("code_generation", lambda x: x["router"], {
-    "answer": "answer",
-    "web": "web"
-})
-workflow.add_conditional_edges("code_reviewer", lambda x: x["router"], {
-    "answer": "answer",
-    "web": "web"
-})
-workflow.add_edge("web", "answer")
+    # memory folds aged-out turns into the running summary before routing
+    workflow.set_entry_point("memory")
+    workflow.add_edge("memory", "router")
 
-graph = workflow.compile(checkpointer=checkpointer)
+    workflow.add_conditional_edges("router", lambda x: x["router"], {
+        "code_generation": "code_generation",
+        "code_reviewer": "code_reviewer",
+        "end": END
+    })
+    workflow.add_conditional_edges("code_generation", lambda x: x["router"], {
+        "answer": END if SKIP_ANSWER_WHEN_SUFFICIENT else "answer",
+        "web": "web"
+    })
+    workflow.add_conditional_edges("code_reviewer", lambda x: x["router"], {
+        "answer": END if SKIP_ANSWER_WHEN_SUFFICIENT else "answer",
+        "web": "web"
+    })
+    workflow.add_edge("web", "answer")
+
+    return workflow
+
+
+# Compiled on first use (or by warm_up on long-running hosts), not at import
+@singleton
+def get_graph():
+    return build_workflow().compile(checkpointer=get_checkpointer())
+
+
+@singleton
+def get_async_graph():
+    """Same graph bound to the async Mongo checkpointer, for the async request path"""
+    return build_workflow().compile(checkpointer=get_async_checkpointer())
+
+
+def warm_up():
+    """
+    Build everything the first chat request would otherwise build: Mongo clients,
+    checkpointers, both compiled graphs, every role's Groq client and the tokenizer.
+    """
+    from utils.models import MODEL_ROLES, get_model
+    from workflow.nodes import router_model, judger_model
+    from workflow.prompts import get_encoding
 
+    get_graph()
+    get_async_graph()
+    for role in MODEL_ROLES:
+        get_model(role)
+    router_model()
+    judger_model()
+    # May download the BPE file; better here than inside the first request
+    get_encoding()
 
 
 # =====================================================
 # Function to run the graph with just a thread_id and user message
 # =====================================================
-def run_graph_with_message(thread_id: str, user_input: str) -> str:
+def run_graph_with_message(thread_id: str, user_input: str, handle: RunHandle | None = None,
+                           message_id: str | None = None) -> str:
+    """
+    `handle` makes the run cancellable: it is checked after every node, and a cancelled
+    run stops there with RunCancelled instead of making the remaining LLM/search calls.
+    `message_id` becomes the HumanMessage's id, so rerunning the same message replaces
+    it in the checkpoint instead of appending it twice.
+    """
     config = {"configurable": {"thread_id": thread_id}}
-    
+
     # Only add the new user message, checkpointer handles the rest
-    result = graph.invoke({"messages": [HumanMessage(content=user_input)]}, config=config)
-    
+    result = None
+    message = HumanMessage(content=user_input, id=message_id)
+    for result in get_graph().stream({"messages": [message]}, config=config, stream_mode="values"):
+        if handle is not None:
+            handle.check()
+
     # Return the last AI message
     return result["messages"][-1].content
 
 
-def load_conversation(thread_id):
-    messages=graph.get_state_history(config={'configurable': {'thread_id': thread_id}})
-    first_snapshot = next(iter(messages))
-    print(first_snapshot)
-    # Assume `snapshot` is your StateSnapshot
-    messages = first_snapshot.values["messages"]
+async def arun_graph_with_message(thread_id: str, user_input: str) -> str:
+    """
+    Async counterpart of run_graph_with_message (never blocks the event loop).
+    Cancel it by cancelling its task (utils/cancellation.run_cancellable).
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+
+    result = await get_async_graph().ainvoke({"messages": [HumanMessage(content=user_input)]}, config=config)
+
+    return result["messages"][-1].content
+
+
+# =====================================================
+# Streaming variant: yields events while the graph runs
+# =====================================================
+# Nodes whose LLM tokens are the user-facing answer
+STREAM_TOKEN_NODES = {"router", "answer"}
+if SKIP_ANSWER_WHEN_SUFFICIENT:
+    # Drafts are streamed optimistically; a `discard` event follows if the judger rejects them
+    STREAM_TOKEN_NODES |= {"code_generation", "code_reviewer"}
+DRAFT_NODES = {"code_generation", "code_reviewer"}
+# Nodes that also make calls whose output is not the answer (the router's plain-text
+# classification fallback); only their calls tagged STREAM_ANSWER_TAG are streamed
+TAGGED_STREAM_NODES = {"router"}
 
-    # Prepare the result list
+
+def streams_tokens(node: str, metadata: dict) -> bool:
+    if node not in STREAM_TOKEN_NODES:
+        return False
+    return node not in TAGGED_STREAM_NODES or STREAM_ANSWER_TAG in metadata.get("tags", ())
+
+
+def update_events(node: str, update: dict | None):
+    """node / discard events for one node's state update"""
+    yield "node", {"node": node}
+    if node in DRAFT_NODES and node in STREAM_TOKEN_NODES and (update or {}).get("router") == "web":
+        yield "discard", {"node": node}
+
+
+def stream_graph_with_message(thread_id: str, user_input: str, handle: RunHandle | None = None):
+    """
+    Run the graph for one user message and yield (event, data) tuples as it progresses:
+    - ("node", {"node": name})          when a node finishes
+    - ("token", {"node": name, "content": delta}) for LLM tokens of the final node
+    - ("discard", {"node": name})       when streamed draft tokens were rejected by the judger
+    - ("done", {"thread_id": ..., "response": ...}) once the run has completed
+    Checkpoints are saved exactly as with run_graph_with_message.
+    A cancelled `handle` stops the run at the next event with RunCancelled.
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    final_response = ""
+
+    for mode, chunk in get_graph().stream(
+        {"messages": [HumanMessage(content=user_input)]},
+        config=config,
+        stream_mode=["updates", "messages"],
+    ):
+        if handle is not None:
+            handle.check()
+        if mode == "messages":
+            message, metadata = chunk
+            node = metadata.get("langgraph_node")
+            # Structured output calls (router/judger) stream tool-call chunks with empty content
+            if streams_tokens(node, metadata) and isinstance(message.content, str) and message.content:
+                yield "token", {"node": node, "content": message.content}
+        else:
+            for node, update in chunk.items():
+                for event in update_events(node, update):
+                    yield event
+                for message in (update or {}).get("messages", []):
+                    if isinstance(message, AIMessage):
+                        final_response = message.content
+
+    yield "done", {"thread_id": thread_id, "response": final_response}
+
+
+async def astream_graph_with_message(thread_id: str, user_input: str, handle: RunHandle | None = None):
+    """Async counterpart of stream_graph_with_message, yields the same events"""
+    config = {"configurable": {"thread_id": thread_id}}
+    final_response = ""
+
+    async for mode, chunk in get_async_graph().astream(
+        {"messages": [HumanMessage(content=user_input)]},
+        config=config,
+        stream_mode=["updates", "messages"],
+    ):
+        if handle is not None:
+            handle.check()
+        if mode == "messages":
+            message, metadata = chunk
+            node = metadata.get("langgraph_node")
+            if streams_tokens(node, metadata) and isinstance(message.content, str) and message.content:
+                yield "token", {"node": node, "content": message.content}
+        else:
+            for node, update in chunk.items():
+                for event in update_events(node, update):
+                    yield event
+                for message in (update or {}).get("messages", []):
+                    if isinstance(message, AIMessage):
+                        final_response = message.content
+
+    yield "done", {"thread_id": thread_id, "response": final_response}
+
+
+def pair_messages(messages):
+    """
+    Pair each HumanMessage with the answer to it, for the history view.
+    The answer is the last AIMessage before the next HumanMessage, so turns where
+    several nodes appended output still yield one pair; unanswered turns are skipped.
+    """
     paired_messages = []
+    human, assistant = None, None
+
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            if human is not None and assistant is not None:
+                paired_messages.append({"Human": human, "Assistant": assistant})
+            human, assistant = message.content, None
+        elif isinstance(message, AIMessage) and human is not None:
+            assistant = message.content
+
+    if human is not None and assistant is not None:
+        paired_messages.append({"Human": human, "Assistant": assistant})
+
+    return paired_messages
+
+
+def load_conversation(thread_id):
+    """Pairs from the latest checkpoint only (one indexed read, no history walk)"""
+    checkpoint = get_checkpointer().get_tuple({'configurable': {'thread_id': thread_id}})
+    if checkpoint is None:
+        return []
+    return pair_messages(checkpoint.checkpoint["channel_values"].get("messages", []))
+
+
+def load_reply(thread_id: str, message_id: str) -> str | None:
+    """
+    The answer already checkpointed for the HumanMessage with this id; None if the
+    message is not in the thread or the run stopped before answering it
+    """
+    checkpoint = get_checkpointer().get_tuple({'configurable': {'thread_id': thread_id}})
+    if checkpoint is None:
+        return None
+    messages = checkpoint.checkpoint["channel_values"].get("messages", [])
+    for index, message in enumerate(messages):
+        if isinstance(message, HumanMessage) and message.id == message_id:
+            answer = None
+            for later in messages[index + 1:]:
+                if isinstance(later, HumanMessage):
+                    break
+                if isinstance(later, AIMessage):
+                    answer = later.content
+            return answer
+    return None
+
 
-    # Iterate in pairs: HumanMessage followed by AIMessage
-    for i in range(0, len(messages) - 1, 2):
-        if isinstance(messages[i], HumanMessage) and isinstance(messages[i+1], AIMessage):
-            pair = {
-                "Human": messages[i].content,
-                "Assistant": messages[i+1].content
-            }
-            paired_messages.append(pair)
+async def aload_history(thread_id) -> tuple:
+    """(checkpoint_id, pairs) of the latest checkpoint; checkpoint_id is None for an empty thread"""
+    checkpoint = await get_history_checkpointer().aget_tuple({'configurable': {'thread_id': thread_id}})
+    if checkpoint is None:
+        return None, []
+    messages = checkpoint.checkpoint["channel_values"].get("messages", [])
+    return checkpoint.config["configurable"]["checkpoint_id"], pair_messages(messages)
 
-    return paired_messages
\ No newline at end of file
+
+async def aload_conversation(thread_id):
+    _, pairs = await aload_history(thread_id)
+    return pairs
@@ -1,46 +1,91 @@
-from utils.models import get_groq_model, web_search
+from utils.models import get_model
 from workflow.schemas import RouterDecision , AgentState , Judger
+from workflow.classifier import fast_path_decision, log_router_decision, should_shadow
+from workflow.sufficiency import score_sufficiency, record_decision
+from workflow.speculation import SPECULATIVE_WEB_SEARCH, start_search, discard_search, search_result, asearch_result
+from workflow.summary import should_summarize, pending_messages, summary_messages, recent_messages
+from workflow.prompts import Section, assemble, fit_history
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from langchain_core.messages import HumanMessage , AIMessage , SystemMessage , BaseMessage
+from utils.metrics import router_decisions
+from utils.tracing import log_event
 from typing_extensions import List
 
-model = get_groq_model()
-router_model = model.with_structured_output(RouterDecision)
-judger_model = model.with_structured_output(Judger)
+# Each call site names its role; clients are built lazily from the registry in utils/models.py
+def router_model():
+    return get_model("router", RouterDecision)
+
+# Tags the router's direct answer, the only router call whose tokens are streamed to the client
+STREAM_ANSWER_TAG = "stream_answer"
+STREAM_ANSWER_CONFIG = {"tags": [STREAM_ANSWER_TAG]}
+
+def judger_model():
+    return get_model("judger", Judger)
 
 
 
 # =====================================================
 # Helper Functions
 # =====================================================
-def get_conversation_summary(messages: List[BaseMessage], max_messages: int = 6) -> str:
-    """Get a summary of recent conversation for context"""
-    recent_messages = messages[-max_messages:] if len(messages) > max_messages else messages
-    context = ""
-    for msg in recent_messages:
-        role = "User" if isinstance(msg, HumanMessage) else "Assistant"
-        context += f"{role}: {msg.content[:200]}...\n"  # Limit length
-    return context
+def history_section(state: AgentState, max_messages: int, budget: int, priority: int) -> Section:
+    """
+    Conversation context as a prompt section: the running summary of older turns
+    (memory_node) plus the newest messages that fit the budget. The current query
+    has its own section, so it is left out here.
+    """
+    messages = state.get("messages", [])
+    recent = recent_messages(messages, state.get("summarized_count", 0), max_messages)
+    if recent and isinstance(recent[-1], HumanMessage):
+        recent = recent[:-1]
+    lines = [f"{'User' if isinstance(msg, HumanMessage) else 'Assistant'}: {msg.content}" for msg in recent]
+    header = f"Summary of earlier conversation: {state['summary']}\n\n" if state.get("summary") else ""
+    return Section("history", lines, budget, priority, fit=partial(fit_history, header=header))
+
+
+def router_context(state: AgentState, current_query: str) -> dict:
+    """Budgeted history/query for the router and its direct answers"""
+    return assemble([
+        Section("query", current_query, budget=1000, priority=0),
+        history_section(state, max_messages=4, budget=1000, priority=1),
+    ], total_budget=2000)
+
+
+def get_current_query(messages: List[BaseMessage]) -> str:
+    """Get the latest user message"""
+    return next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+
+
+def empty_outputs(router: str) -> dict:
+    """State update that resets the per-turn node outputs"""
+    return {
+        "router": router,
+        "code_generation": "",
+        "code_debugger": "",
+        "code_reviewer": "",
+        "web": "",
+        "web_ticket": ""
+    }
+
+
+def routed_update(decision: str, current_query: str) -> AgentState:
+    """Router update for code_generation / code_reviewer, prefetching web results if enabled"""
+    update = empty_outputs(decision)
+    if SPECULATIVE_WEB_SEARCH and decision in ("code_generation", "code_reviewer"):
+        update["web_ticket"] = start_search(current_query)
+    return update
+
 
 # =====================================================
-# Nodes - FIXED FOR STRUCTURED OUTPUT
+# Prompt builders - shared by the sync and async nodes
 # =====================================================
+capability_keywords = [
+    "what can you help", "what can you do", "what are you capable",
+    "help me with", "what services", "what tasks", "capabilities",
+    "what can coder do", "what is your purpose", "how can you assist"
+]
 
-
-def router_node(state: AgentState) -> AgentState:
-    messages = state.get("messages", [])
-    
-    # Get the latest user message
-    current_query = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
-    
-    # Check if user is asking about capabilities
-    capability_keywords = [
-        "what can you help", "what can you do", "what are you capable", 
-        "help me with", "what services", "what tasks", "capabilities",
-        "what can coder do", "what is your purpose", "how can you assist"
-    ]
-    
-    if any(keyword in current_query.lower() for keyword in capability_keywords):
-        coder_capabilities = """
+coder_capabilities = """
         Hi! I'm Coder, your specialized coding assistant. Here's what I can help you with:
 
         🔧 **Code Generation**:
@@ -71,19 +116,17 @@ def router_node(state: AgentState) -> AgentState:
 
         Just tell me what coding task you need help with - whether it's generating new code, reviewing existing code, or debugging an issue!
         """
-        
-        return {
-            "messages": [AIMessage(content=coder_capabilities)],
-            "router": "end",
-            "code_generation": "",
-            "code_debugger": "",
-            "code_reviewer": "",
-            "web": ""
-        }
-    
-    # Get conversation context (but keep it concise for structured output)
-    conversation_context = get_conversation_summary(messages, max_messages=4)
 
+
+def capability_answer(current_query: str) -> AgentState | None:
+    """Answer capability questions directly, without any LLM call"""
+    if any(keyword in current_query.lower() for keyword in capability_keywords):
+        router_decisions.inc(label="end", source="capability")
+        return {"messages": [AIMessage(content=coder_capabilities)], **empty_outputs("end")}
+    return None
+
+
+def classification_messages(conversation_context: str, current_query: str) -> List[BaseMessage]:
     # Create a focused prompt for classification - NO full message history for structured output
     classification_prompt = f"""
     Based on this conversation context and current query, classify the request:
@@ -95,93 +138,62 @@ def router_node(state: AgentState) -> AgentState:
 
     Classify into:
     - "code_generation": User asks to generate/write code
-    - "code_reviewer": User asks to review/debug existing code  
+    - "code_reviewer": User asks to review/debug existing code
     - "end": Simple questions, greetings, or general chat that can be answered directly
     """
+    return [
+        SystemMessage(content="You are a request classifier. Classify the user's request into one of the specified categories."),
+        HumanMessage(content=classification_prompt)
+    ]
 
-    try:
-        # Use structured output with a clean, focused prompt
-        response = router_model.invoke([
-            SystemMessage(content="You are a request classifier. Classify the user's request into one of the specified categories."),
-            HumanMessage(content=classification_prompt)
-        ])
-
-        if response.router == "end":
-            # For direct answers, use the regular model with full context
-            answer_prompt = f"""
-            You are Coder, a specialized coding assistant.
-            
-            Conversation history:
-            {conversation_context}
-            
-            Current question: {current_query}
-            
-            Please provide a helpful response as Coder, focusing on coding-related assistance.
-            """
-            
-            direct_response = model.invoke([
-                SystemMessage(content="You are Coder, a helpful coding assistant. Answer based on the conversation history with focus on coding topics."),
-                HumanMessage(content=answer_prompt)
-            ])
-            
-            return {
-                "messages": [AIMessage(content=direct_response.content)],
-                "router": response.router,
-                "code_generation": "",
-                "code_debugger": "",
-                "code_reviewer": "",
-                "web": ""
-            }
-        else:
-            return {
-                "router": response.router,
-                "code_generation": "",
-                "code_debugger": "",
-                "code_reviewer": "",
-                "web": ""
-            }
-    except Exception as e:
-        print(f"Router error: {e}")
-        # Fallback to simple text classification
-        fallback_prompt = f"Is this a request for: 1) code generation, 2) code review, or 3) general chat? Query: {current_query}"
-        fallback_response = model.invoke([HumanMessage(content=fallback_prompt)])
-        
-        # Simple keyword-based fallback
-        response_text = fallback_response.content.lower()
-        if "generation" in response_text or "generate" in response_text or "write code" in current_query.lower():
-            router_decision = "code_generation"
-        elif "review" in response_text or "debug" in response_text or "fix" in current_query.lower():
-            router_decision = "code_reviewer"
-        else:
-            router_decision = "end"
-            return {
-                "messages": [AIMessage(content=fallback_response.content)],
-                "router": router_decision,
-                "code_generation": "",
-                "code_debugger": "",
-                "code_reviewer": "",
-                "web": ""
-            }
-        
-        return {
-            "router": router_decision,
-            "code_generation": "",
-            "code_debugger": "",
-            "code_reviewer": "",
-            "web": ""
-        }
 
+def direct_answer_messages(conversation_context: str, current_query: str) -> List[BaseMessage]:
+    # For direct answers, use the regular model with full context
+    answer_prompt = f"""
+    You are Coder, a specialized coding assistant.
+
+    Conversation history:
+    {conversation_context}
+
+    Current question: {current_query}
+
+    Please provide a helpful response as Coder, focusing on coding-related assistance.
+    """
+    return [
+        SystemMessage(content="You are Coder, a helpful coding assistant. Answer based on the conversation history with focus on coding topics."),
+        HumanMessage(content=answer_prompt)
+    ]
+
+
+def fallback_messages(current_query: str) -> List[BaseMessage]:
+    fallback_prompt = f"Is this a request for: 1) code generation, 2) code review, or 3) general chat? Query: {current_query}"
+    return [HumanMessage(content=fallback_prompt)]
+
+
+def fallback_update(current_query: str, fallback_text: str) -> AgentState:
+    """Simple keyword-based fallback when structured classification fails"""
+    response_text = fallback_text.lower()
+    if "generation" in response_text or "generate" in response_text or "write code" in current_query.lower():
+        update = routed_update("code_generation", current_query)
+    elif "review" in response_text or "debug" in response_text or "fix" in current_query.lower():
+        update = routed_update("code_reviewer", current_query)
+    else:
+        update = {"messages": [AIMessage(content=fallback_text)], **empty_outputs("end")}
+    router_decisions.inc(label=update["router"], source="fallback")
+    return update
+
+
+def code_generation_messages(state: AgentState, current_query: str) -> List[BaseMessage]:
+    # The request may carry pasted code, so it outranks the history
+    context = assemble([
+        Section("query", current_query, budget=3000, priority=0),
+        history_section(state, max_messages=8, budget=3000, priority=1),
+    ])
+    conversation_context, current_query = context["history"], context["query"]
 
-def code_generation_node(state: AgentState) -> AgentState:
-    messages = state.get("messages", [])
-    
-    # Get conversation context
-    conversation_context = get_conversation_summary(messages, max_messages=8)
-    current_query = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
-    
     # Create comprehensive prompt with context
     prompt = f"""
-    You are an expert code generator. 
+    You are an expert code generator.
 
     Conversation History:
     {conversation_context}
@@ -190,37 +202,19 @@ def code_generation_node(state: AgentState) -> AgentState:
 
     Generate code based on the user's request, taking into account the conversation history and any previous context.
     """
-    
-    response = model.invoke([
+    return [
         SystemMessage(content="You are an expert code generator."),
         HumanMessage(content=prompt)
-    ])
-    result = response.content
+    ]
 
-    # Simple sufficiency check without structured output issues
-    try:
-        evaluation = judger_model.invoke([
-            SystemMessage(content="Judge if the code generation is sufficient for the request."),
-            HumanMessage(content=f"Request: {current_query}\n\nGenerated: {result[:500]}...")
-        ])
-        is_sufficient = evaluation.sufficient
-    except:
-        # Fallback: assume it's sufficient unless it's very short
-        is_sufficient = len(result) > 50
 
-    return {
-        "messages": [AIMessage(content=result)],
-        "code_generation": result,
-        "router": "answer" if is_sufficient else "web"
-    }
+def code_reviewer_messages(state: AgentState, current_query: str) -> List[BaseMessage]:
+    context = assemble([
+        Section("query", current_query, budget=3000, priority=0),
+        history_section(state, max_messages=8, budget=3000, priority=1),
+    ])
+    conversation_context, current_query = context["history"], context["query"]
 
-def code_reviewer_node(state: AgentState) -> AgentState:
-    messages = state.get("messages", [])
-    
-    # Get conversation context
-    conversation_context = get_conversation_summary(messages, max_messages=8)
-    current_query = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
-    
     prompt = f"""
     You are an expert code reviewer and debugger.
 
@@ -231,61 +225,45 @@ def code_reviewer_node(state: AgentState) -> AgentState:
 
     Please review the code or help debug the issue based on the conversation context.
     """
-    
-    response = model.invoke([
+    return [
         SystemMessage(content="You are an expert code reviewer and debugger."),
         HumanMessage(content=prompt)
-    ])
-    result = response.content
+    ]
 
-    # Simple sufficiency check
-    try:
-        evaluation = judger_model.invoke([
-            SystemMessage(content="Judge if the code review is sufficient."),
-            HumanMessage(content=f"Request: {current_query}\n\nReview: {result[:500]}...")
-        ])
-        is_sufficient = evaluation.sufficient
-    except:
-        is_sufficient = len(result) > 50
 
-    return {
-        "messages": [AIMessage(content=result)],
-        "code_reviewer": result,
-        "router": "answer" if is_sufficient else "web"
-    }
-
-def web_node(state: AgentState) -> AgentState:
-    messages = state.get("messages", [])
-    current_query = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
-    
-    try:
-        search_tool = web_search()
-        snippets = search_tool.invoke({"query": current_query})
-        result = f"Found relevant information: {snippets}"
-    except Exception as e:
-        result = f"Web search unavailable: {str(e)}"
+def judge_messages(instruction: str, label: str, current_query: str, result: str) -> List[BaseMessage]:
+    context = assemble([
+        Section("query", current_query, budget=500, priority=0),
+        Section("result", result, budget=1500, priority=1),
+    ], total_budget=2000)
+    return [
+        SystemMessage(content=instruction),
+        HumanMessage(content=f"Request: {context['query']}\n\n{label}: {context['result']}")
+    ]
 
-    return {
-        "messages": [AIMessage(content=result)],
-        "web": str(snippets) if 'snippets' in locals() else "",
-        "router": "answer"
-    }
 
-def answer_node(state: AgentState) -> AgentState:
+def answer_messages(state: AgentState) -> List[BaseMessage]:
     messages = state.get("messages", [])
-    current_query = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
-    
-    # Get conversation context
-    conversation_context = get_conversation_summary(messages, max_messages=10)
-    
+    current_query = get_current_query(messages)
+
+    # Query first, then the drafts being synthesized, then web results, then history
+    context = assemble([
+        Section("query", current_query, budget=1500, priority=0),
+        Section("code_generation", state.get("code_generation", ""), budget=2500, priority=1),
+        Section("code_reviewer", state.get("code_reviewer", ""), budget=2500, priority=1),
+        Section("web", str(state.get("web") or ""), budget=1500, priority=2),
+        history_section(state, max_messages=10, budget=2000, priority=3),
+    ])
+    conversation_context, current_query = context["history"], context["query"]
+
     # Prepare additional context from other nodes
     additional_context = []
-    if state.get("code_generation"):
-        additional_context.append(f"Code Generated: {state['code_generation'][:500]}...")
-    if state.get("code_reviewer"):
-        additional_context.append(f"Code Review: {state['code_reviewer'][:500]}...")
-    if state.get("web"):
-        additional_context.append(f"Web Results: {str(state['web'])[:500]}...")
+    if context["code_generation"]:
+        additional_context.append(f"Code Generated: {context['code_generation']}")
+    if context["code_reviewer"]:
+        additional_context.append(f"Code Review: {context['code_reviewer']}")
+    if context["web"]:
+        additional_context.append(f"Web Results: {context['web']}")
 
     # Create comprehensive final prompt
     prompt = f"""
@@ -294,17 +272,303 @@ def answer_node(state: AgentState) -> AgentState:
 
     Current Question: {current_query}
     """
-    
+
     if additional_context:
         prompt += f"\n\nAdditional Context:\n" + "\n".join(additional_context)
-    
+
     prompt += "\n\nProvide a helpful, accurate response based on all available information."
 
-    response = model.invoke([
+    return [
         SystemMessage(content="You are a helpful assistant providing final answers based on conversation history and context."),
         HumanMessage(content=prompt)
-    ])
+    ]
+
+
+def is_sufficient_fallback(result: str) -> bool:
+    # Fallback: assume it's sufficient unless it's very short
+    return len(result) > 50
+
+
+def finish_reason(response) -> str | None:
+    return getattr(response, "response_metadata", {}).get("finish_reason")
+
+
+def judge_draft(kind: str, instruction: str, label: str, current_query: str, response) -> bool:
+    """Decide clear-cut drafts locally; only the ambiguous band pays for a judger call"""
+    result = response.content
+    check = score_sufficiency(kind, current_query, result, finish_reason(response))
+    if check.verdict is not None:
+        record_decision(kind, "local", check.verdict, check)
+        return check.verdict
+
+    # Simple sufficiency check without structured output issues
+    try:
+        evaluation = judger_model().invoke(judge_messages(instruction, label, current_query, result), cache=True)
+        is_sufficient, path = evaluation.sufficient, "judger"
+    except Exception:
+        is_sufficient, path = is_sufficient_fallback(result), "fallback"
+    record_decision(kind, path, is_sufficient, check)
+    return is_sufficient
+
+
+async def ajudge_draft(kind: str, instruction: str, label: str, current_query: str, response) -> bool:
+    result = response.content
+    check = score_sufficiency(kind, current_query, result, finish_reason(response))
+    if check.verdict is not None:
+        record_decision(kind, "local", check.verdict, check)
+        return check.verdict
+
+    try:
+        evaluation = await judger_model().ainvoke(judge_messages(instruction, label, current_query, result), cache=True)
+        is_sufficient, path = evaluation.sufficient, "judger"
+    except Exception:
+        is_sufficient, path = is_sufficient_fallback(result), "fallback"
+    record_decision(kind, path, is_sufficient, check)
+    return is_sufficient
+
+
+def draft_update(state: AgentState, field: str, result: str, is_sufficient: bool) -> AgentState:
+    """
+    A sufficient draft is the turn's answer and goes into the history; an insufficient one
+    is only kept in `field` for answer_node to synthesize from after the web search, so each
+    turn appends exactly one AIMessage.
+    """
+    update = {
+        field: result,
+        "router": "answer" if is_sufficient else "web"
+    }
+    if is_sufficient:
+        update["messages"] = [AIMessage(content=result)]
+        # web_node will not run, drop any speculative search for this turn
+        discard_search(state.get("web_ticket", ""))
+    return update
+
+
+# =====================================================
+# Nodes - FIXED FOR STRUCTURED OUTPUT
+# =====================================================
+# Every node has a sync and an async variant built from the same helpers;
+# graph.invoke runs the former, graph.ainvoke the latter.
+# cache=True is only passed for calls whose output only depends on the prompt
+# (classification, judging, direct answers); generations are never cached.
+
+
+def memory_node(state: AgentState) -> AgentState:
+    messages = state.get("messages", [])
+    summarized_count = state.get("summarized_count", 0)
+    if not should_summarize(messages, summarized_count):
+        return {}
+
+    pending = pending_messages(messages, summarized_count)
+    try:
+        response = get_model("summarizer").invoke(summary_messages(state.get("summary", ""), pending))
+    except Exception as e:
+        # Keep the old summary; the pending messages are retried on the next turn
+        log_event("summary_error", error=str(e))
+        return {}
+    return {"summary": response.content, "summarized_count": summarized_count + len(pending)}
+
+
+async def amemory_node(state: AgentState) -> AgentState:
+    messages = state.get("messages", [])
+    summarized_count = state.get("summarized_count", 0)
+    if not should_summarize(messages, summarized_count):
+        return {}
+
+    pending = pending_messages(messages, summarized_count)
+    try:
+        response = await get_model("summarizer").ainvoke(summary_messages(state.get("summary", ""), pending))
+    except Exception as e:
+        log_event("summary_error", error=str(e))
+        return {}
+    return {"summary": response.content, "summarized_count": summarized_count + len(pending)}
+
+
+# Shadow checks of fast-path decisions run here, off the request path
+_shadow_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="router-shadow")
+
+
+def shadow_route(conversation_context: str, query: str, current_query: str, fast_label: str):
+    """Ask the LLM router about a sampled fast-path decision in the background and log both labels"""
+    def run():
+        try:
+            response = router_model().invoke(classification_messages(conversation_context, query), cache=True)
+        except Exception as e:
+            log_event("router_shadow_error", error=str(e))
+            return
+        log_router_decision(current_query, response.router, fast_path=fast_label)
+
+    _shadow_executor.submit(run)
+
+
+def router_node(state: AgentState) -> AgentState:
+    messages = state.get("messages", [])
+    current_query = get_current_query(messages)
+
+    # Check if user is asking about capabilities
+    capabilities = capability_answer(current_query)
+    if capabilities:
+        return capabilities
+
+    # Get conversation context (but keep it concise for structured output)
+    context = router_context(state, current_query)
+    conversation_context = context["history"]
+
+    # Confident local classification skips the LLM router round trip
+    decision = fast_path_decision(current_query)
+    source = "fast_path" if decision is not None else "llm"
+
+    try:
+        if decision is None:
+            # Use structured output with a clean, focused prompt
+            response = router_model().invoke(classification_messages(conversation_context, context["query"]), cache=True)
+            decision = response.router
+            log_router_decision(current_query, decision)
+        elif should_shadow():
+            shadow_route(conversation_context, context["query"], current_query, decision)
+        router_decisions.inc(label=decision, source=source)
+
+        if decision == "end":
+            direct_response = get_model("answer").invoke(
+                direct_answer_messages(conversation_context, context["query"]), cache=True, config=STREAM_ANSWER_CONFIG
+            )
+            return {"messages": [AIMessage(content=direct_response.content)], **empty_outputs(decision)}
+        return routed_update(decision, current_query)
+    except Exception as e:
+        log_event("router_error", error=str(e))
+        # Fallback to simple text classification
+        fallback_response = get_model("answer").invoke(fallback_messages(context["query"]))
+        return fallback_update(current_query, fallback_response.content)
+
+
+async def arouter_node(state: AgentState) -> AgentState:
+    messages = state.get("messages", [])
+    current_query = get_current_query(messages)
+
+    capabilities = capability_answer(current_query)
+    if capabilities:
+        return capabilities
+
+    context = router_context(state, current_query)
+    conversation_context = context["history"]
+
+    decision = fast_path_decision(current_query)
+    source = "fast_path" if decision is not None else "llm"
+
+    try:
+        if decision is None:
+            response = await router_model().ainvoke(classification_messages(conversation_context, context["query"]), cache=True)
+            decision = response.router
+            log_router_decision(current_query, decision)
+        elif should_shadow():
+            shadow_route(conversation_context, context["query"], current_query, decision)
+        router_decisions.inc(label=decision, source=source)
+
+        if decision == "end":
+            direct_response = await get_model("answer").ainvoke(
+                direct_answer_messages(conversation_context, context["query"]), cache=True, config=STREAM_ANSWER_CONFIG
+            )
+            return {"messages": [AIMessage(content=direct_response.content)], **empty_outputs(decision)}
+        return routed_update(decision, current_query)
+    except Exception as e:
+        log_event("router_error", error=str(e))
+        fallback_response = await get_model("answer").ainvoke(fallback_messages(context["query"]))
+        return fallback_update(current_query, fallback_response.content)
+
+
+def code_generation_node(state: AgentState) -> AgentState:
+    messages = state.get("messages", [])
+    current_query = get_current_query(messages)
+
+    response = get_model("generator").invoke(code_generation_messages(state, current_query))
+    is_sufficient = judge_draft(
+        "code_generation", "Judge if the code generation is sufficient for the request.", "Generated", current_query, response
+    )
+
+    return draft_update(state, "code_generation", response.content, is_sufficient)
+
+
+async def acode_generation_node(state: AgentState) -> AgentState:
+    messages = state.get("messages", [])
+    current_query = get_current_query(messages)
+
+    response = await get_model("generator").ainvoke(code_generation_messages(state, current_query))
+    is_sufficient = await ajudge_draft(
+        "code_generation", "Judge if the code generation is sufficient for the request.", "Generated", current_query, response
+    )
+
+    return draft_update(state, "code_generation", response.content, is_sufficient)
+
+
+def code_reviewer_node(state: AgentState) -> AgentState:
+    messages = state.get("messages", [])
+    current_query = get_current_query(messages)
+
+    response = get_model("reviewer").invoke(code_reviewer_messages(state, current_query))
+    is_sufficient = judge_draft(
+        "code_reviewer", "Judge if the code review is sufficient.", "Review", current_query, response
+    )
+
+    return draft_update(state, "code_reviewer", response.content, is_sufficient)
+
+
+async def acode_reviewer_node(state: AgentState) -> AgentState:
+    messages = state.get("messages", [])
+    current_query = get_current_query(messages)
+
+    response = await get_model("reviewer").ainvoke(code_reviewer_messages(state, current_query))
+    is_sufficient = await ajudge_draft(
+        "code_reviewer", "Judge if the code review is sufficient.", "Review", current_query, response
+    )
+
+    return draft_update(state, "code_reviewer", response.content, is_sufficient)
+
+
+def web_node(state: AgentState) -> AgentState:
+    messages = state.get("messages", [])
+    current_query = get_current_query(messages)
+
+    # Search results only feed answer_node, they are not part of the visible history
+    snippets = None
+    try:
+        snippets = search_result(state.get("web_ticket", ""), current_query)
+    except Exception as e:
+        log_event("web_search_error", error=str(e))
+
+    return {
+        "web": str(snippets) if snippets is not None else "",
+        "router": "answer"
+    }
+
+
+async def aweb_node(state: AgentState) -> AgentState:
+    messages = state.get("messages", [])
+    current_query = get_current_query(messages)
+
+    # Search results only feed answer_node, they are not part of the visible history
+    snippets = None
+    try:
+        snippets = await asearch_result(state.get("web_ticket", ""), current_query)
+    except Exception as e:
+        log_event("web_search_error", error=str(e))
+
+    return {
+        "web": str(snippets) if snippets is not None else "",
+        "router": "answer"
+    }
+
+
+def answer_node(state: AgentState) -> AgentState:
+    response = get_model("answer").invoke(answer_messages(state))
+
+    return {
+        "messages": [AIMessage(content=response.content)]
+    }
+
+
+async def aanswer_node(state: AgentState) -> AgentState:
+    response = await get_model("answer").ainvoke(answer_messages(state))
 
     return {
         "messages": [AIMessage(content=response.content)]
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,179 @@
+import os
+import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable
+from dotenv import load_dotenv
+
+from utils.tracing import log_event
+
+try:
+    import tiktoken  # installed with langchain-openai
+except ImportError:
+    tiktoken = None
+
+load_dotenv()
+
+# Groq's Llama tokenizer is not available offline; cl100k counts are within a few
+# percent for English and code, which is all a budget needs. tiktoken downloads the BPE
+# file on first load; warm_up loads it at startup, and on serverless hosts point
+# TIKTOKEN_CACHE_DIR at a directory shipped with the deploy so no cold start fetches it
+PROMPT_ENCODING = os.getenv("PROMPT_ENCODING", "cl100k_base")
+# Total tokens the context sections of one prompt may use
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+# Cap for any single history message, so one pasted file cannot crowd out the rest
+HISTORY_MESSAGE_TOKENS = int(os.getenv("HISTORY_MESSAGE_TOKENS", "400"))
+
+FENCE_BLOCK = re.compile(r"```.*?(?:```|\Z)", re.DOTALL)
+TRUNCATED = " …[truncated]"
+
+
+# =====================================================
+# Token counting
+# =====================================================
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """tiktoken encoding loaded on first use; False when unavailable (no package / offline)"""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    _encoding = tiktoken.get_encoding(PROMPT_ENCODING) if tiktoken else False
+                except Exception as e:
+                    log_event("tokenizer_unavailable", encoding=PROMPT_ENCODING, error=str(e))
+                    _encoding = False
+    return _encoding
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    # History messages are re-counted on every turn of a thread, hence the cache
+    encoding = get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def cut_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of `text` within max_tokens, cut back to a word boundary"""
+    encoding = get_encoding()
+    if encoding:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    else:
+        cut = text[:max_tokens * 4]
+    if len(cut) < len(text) and " " in cut:
+        cut = cut[:cut.rfind(" ")]
+    return cut
+
+
+# =====================================================
+# Code-aware truncation
+# =====================================================
+def split_blocks(text: str) -> list:
+    """(is_code, text) segments: fenced code blocks and the prose between them"""
+    blocks, position = [], 0
+    for match in FENCE_BLOCK.finditer(text):
+        if match.start() > position:
+            blocks.append((False, text[position:match.start()]))
+        blocks.append((True, match.group()))
+        position = match.end()
+    if position < len(text):
+        blocks.append((False, text[position:]))
+    return blocks
+
+
+def cut_code_block(block: str, max_tokens: int) -> str:
+    """Whole leading lines of a fenced block, with the fence closed again"""
+    lines = block.rstrip("`").rstrip("\n").split("\n")
+    kept, used = [], count_tokens("```")
+    for line in lines:
+        used += count_tokens(line + "\n")
+        if used > max_tokens:
+            break
+        kept.append(line)
+    if len(kept) <= 1:
+        return ""
+    return "\n".join(kept) + f"\n# …[{len(lines) - len(kept)} more lines truncated]\n```"
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """
+    Fit `text` into max_tokens without cutting through code: fenced blocks are kept
+    whole where they fit, otherwise cut at a line boundary and re-closed (or dropped
+    when little budget is left); prose is cut at a word boundary.
+    """
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    kept, used = [], 0
+    for is_code, block in split_blocks(text):
+        cost = count_tokens(block)
+        if used + cost <= max_tokens:
+            kept.append(block)
+            used += cost
+            continue
+        remaining = max_tokens - used - count_tokens(TRUNCATED)
+        if is_code:
+            # A block that would get less than a quarter of the budget is dropped whole
+            partial = cut_code_block(block, remaining) if remaining >= max_tokens // 4 else ""
+            kept.append(partial or "\n[code block omitted]")
+        elif remaining > 0:
+            kept.append(cut_tokens(block, remaining) + TRUNCATED)
+        break
+    return "".join(kept).strip()
+
+
+# =====================================================
+# Sections and budgets
+# =====================================================
+@dataclass
+class Section:
+    """
+    One piece of prompt context. Sections are filled in priority order (lowest first),
+    each up to its own budget and whatever is left of the total; tokens a section does
+    not need are left for the ones after it. `fit(text, max_tokens)` does the cutting.
+    """
+    name: str
+    text: str | list
+    budget: int
+    priority: int = 0
+    fit: Callable = truncate
+
+
+def assemble(sections: list, total_budget: int = PROMPT_TOKEN_BUDGET) -> dict:
+    """{section name: fitted text}"""
+    fitted, remaining = {}, total_budget
+    for section in sorted(sections, key=lambda s: s.priority):
+        text = section.fit(section.text, min(section.budget, remaining))
+        fitted[section.name] = text
+        remaining -= count_tokens(text) if text else 0
+    return fitted
+
+
+def fit_history(lines: list, max_tokens: int, header: str = "") -> str:
+    """
+    Newest history lines that fit in max_tokens, oldest first in the result, so the
+    budget drops the oldest turns rather than the end of the latest one.
+    `header` (the running summary) is always placed first and counted against the budget;
+    a header longer than the whole budget is truncated to it.
+    """
+    if header and count_tokens(header) > max_tokens:
+        summary = truncate(header.rstrip("\n"), max_tokens - count_tokens("\n\n"))
+        header = summary + "\n\n" if summary else ""
+    used = count_tokens(header) if header else 0
+    kept = []
+    for line in reversed(lines):
+        line = truncate(line, HISTORY_MESSAGE_TOKENS)
+        cost = count_tokens(line)
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return header + "\n".join(reversed(kept))
@@ -15,6 +15,9 @@ class AgentState(TypedDict):
     code_debugger: str
     code_reviewer: str
     web: str
+    web_ticket: str  # speculative web search started by the router (workflow/speculation.py)
+    summary: str  # running summary of messages[:summarized_count] (workflow/summary.py)
+    summarized_count: int
 
 # =====================================================
 # Structured Models
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from utils.models import web_search
+
+load_dotenv()
+
+# Start the web search as soon as the router picks code_generation / code_reviewer,
+# so web_node finds the results ready when the judger asks for them
+SPECULATIVE_WEB_SEARCH = os.getenv("SPECULATIVE_WEB_SEARCH", "false").lower() == "true"
+SPECULATIVE_SEARCH_WORKERS = int(os.getenv("SPECULATIVE_SEARCH_WORKERS", "8"))
+# Searches nobody claimed within this many seconds are dropped (e.g. the run failed)
+SPECULATIVE_SEARCH_TTL = float(os.getenv("SPECULATIVE_SEARCH_TTL", "300"))
+
+_executor = ThreadPoolExecutor(max_workers=SPECULATIVE_SEARCH_WORKERS, thread_name_prefix="web-prefetch")
+_pending = {}
+_lock = threading.Lock()
+speculation_counts = Counter()
+
+
+def run_search(query: str):
+    return web_search().invoke({"query": query})
+
+
+def _expire_stale(now: float):
+    stale = [ticket for ticket, (_, started) in _pending.items() if now - started > SPECULATIVE_SEARCH_TTL]
+    for ticket in stale:
+        future, _ = _pending.pop(ticket)
+        future.cancel()
+        speculation_counts["expired"] += 1
+
+
+def start_search(query: str) -> str:
+    """Kick off a background search; the returned ticket goes into the graph state"""
+    ticket = str(uuid.uuid4())
+    now = time.monotonic()
+    with _lock:
+        _expire_stale(now)
+        _pending[ticket] = (_executor.submit(run_search, query), now)
+        speculation_counts["started"] += 1
+    return ticket
+
+
+def take_search(ticket: str):
+    """Claim the future for a ticket (None if there is none or it expired)"""
+    if not ticket:
+        return None
+    with _lock:
+        entry = _pending.pop(ticket, None)
+        if entry is None:
+            return None
+        speculation_counts["used"] += 1
+    return entry[0]
+
+
+def discard_search(ticket: str):
+    """The draft was sufficient: the speculative search is wasted work"""
+    if not ticket:
+        return
+    with _lock:
+        entry = _pending.pop(ticket, None)
+        if entry is None:
+            return
+        speculation_counts["wasted"] += 1
+    entry[0].cancel()
+
+
+def search_result(ticket: str, query: str):
+    """Speculative result if one was started for this turn, else a fresh search"""
+    future = take_search(ticket)
+    if future is not None:
+        return future.result()
+    return run_search(query)
+
+
+async def asearch_result(ticket: str, query: str):
+    future = take_search(ticket)
+    if future is not None:
+        return await asyncio.wrap_future(future)
+    return await web_search().ainvoke({"query": query})
+
+
+def speculation_stats() -> dict:
+    with _lock:
+        stats = dict(speculation_counts)
+        stats["pending"] = len(_pending)
+    finished = stats.get("used", 0) + stats.get("wasted", 0) + stats.get("expired", 0)
+    stats["wasted_rate"] = round((stats.get("wasted", 0) + stats.get("expired", 0)) / finished, 3) if finished else None
+    return stats
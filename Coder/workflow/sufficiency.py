@@ -0,0 +1,160 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from dotenv import load_dotenv
+
+from utils.metrics import sufficiency_decisions
+from utils.tracing import log_event
+
+load_dotenv()
+
+# Scores at or above HIGH are accepted and at or below LOW rejected without the judger;
+# only the band in between pays for a judger call
+SUFFICIENCY_HIGH = float(os.getenv("SUFFICIENCY_HIGH", "0.75"))
+SUFFICIENCY_LOW = float(os.getenv("SUFFICIENCY_LOW", "0.25"))
+# Optional JSONL file recording every decision (score, reasons, deciding path) for tuning
+SUFFICIENCY_LOG = os.getenv("SUFFICIENCY_LOG", "")
+
+
+@dataclass
+class SufficiencyCheck:
+    score: float
+    verdict: bool | None
+    reasons: list = field(default_factory=list)
+
+
+# =====================================================
+# Signals
+# =====================================================
+REFUSAL_PATTERN = re.compile(
+    r"\b(i can'?t|i cannot|i'?m unable to|i am unable to|i'?m not able to|i won'?t be able to|"
+    r"as an ai|i'?m sorry, but|unfortunately,? i)\b"
+)
+FENCE_PATTERN = re.compile(r"```([\w#+.-]*)")
+
+LANGUAGES = {
+    "python": ("python", "py", "python3"),
+    "javascript": ("javascript", "js", "jsx", "node", "nodejs"),
+    "typescript": ("typescript", "ts", "tsx"),
+    "java": ("java",),
+    "c++": ("cpp", "c++", "cc", "cxx"),
+    "c#": ("csharp", "cs", "c#"),
+    "go": ("go", "golang"),
+    "rust": ("rust", "rs"),
+    "sql": ("sql", "postgresql", "mysql", "sqlite"),
+    "bash": ("bash", "sh", "shell", "zsh"),
+    "ruby": ("ruby", "rb"),
+    "php": ("php",),
+    "kotlin": ("kotlin", "kt"),
+    "swift": ("swift",),
+    "html": ("html",),
+}
+LANGUAGE_PATTERNS = {
+    language: re.compile(r"(?<![\w#+])" + re.escape(language) + r"(?![\w#+])")
+    for language in LANGUAGES
+}
+# "go" is too common an English word to match on its own
+LANGUAGE_PATTERNS["go"] = re.compile(r"\b(golang|in go|go code|go program)\b")
+
+
+def requested_language(request: str) -> str | None:
+    lowered = request.lower()
+    for language, pattern in LANGUAGE_PATTERNS.items():
+        if pattern.search(lowered):
+            return language
+    return None
+
+
+def score_sufficiency(kind: str, request: str, result: str, finish_reason: str | None = None) -> SufficiencyCheck:
+    """
+    Heuristic sufficiency score in [0, 1] for a code_generation / code_reviewer draft.
+    verdict is True/False when the score falls outside the ambiguous band, else None.
+    """
+    reasons = []
+    text = result.strip()
+
+    # Hard failures
+    if finish_reason == "length":
+        return SufficiencyCheck(0.0, False, ["truncated"])
+    if len(text) < 50:
+        return SufficiencyCheck(0.05, False, ["too_short"])
+    if REFUSAL_PATTERN.search(text[:300].lower()):
+        return SufficiencyCheck(0.05, False, ["refusal"])
+
+    score = 0.5
+    fences = FENCE_PATTERN.findall(text)
+    if len(fences) % 2 == 1:
+        score -= 0.3
+        reasons.append("unclosed_fence")
+
+    # Opening fences are every other match; their info string is the block language
+    block_languages = {lang.lower() for lang in fences[0::2] if lang}
+    if fences:
+        score += 0.25 if kind == "code_generation" else 0.2
+        reasons.append("has_code")
+    elif kind == "code_generation":
+        score -= 0.2
+        reasons.append("no_code")
+
+    language = requested_language(request)
+    if language and block_languages:
+        if block_languages & set(LANGUAGES[language]):
+            score += 0.15
+            reasons.append("language_match")
+        else:
+            score -= 0.3
+            reasons.append("language_mismatch")
+
+    if len(text) > 400:
+        score += 0.1
+        reasons.append("substantial")
+
+    score = max(0.0, min(1.0, score))
+    if score >= SUFFICIENCY_HIGH:
+        verdict = True
+    elif score <= SUFFICIENCY_LOW:
+        verdict = False
+    else:
+        verdict = None
+    return SufficiencyCheck(score, verdict, reasons)
+
+
+# =====================================================
+# Decision recording
+# =====================================================
+decision_counts = Counter()
+_lock = threading.Lock()
+
+
+def record_decision(kind: str, path: str, sufficient: bool, check: SufficiencyCheck):
+    """
+    Count which path decided (local / judger / fallback) and, if SUFFICIENCY_LOG is set,
+    log the local score next to the final verdict so the thresholds can be tuned.
+    """
+    with _lock:
+        decision_counts[(kind, path, sufficient)] += 1
+    sufficiency_decisions.inc(kind=kind, path=path, verdict="sufficient" if sufficient else "insufficient")
+    if not SUFFICIENCY_LOG:
+        return
+    record = json.dumps({
+        "kind": kind,
+        "path": path,
+        "sufficient": sufficient,
+        "score": round(check.score, 3),
+        "reasons": check.reasons,
+        "ts": time.time(),
+    })
+    try:
+        with _lock, open(SUFFICIENCY_LOG, "a") as f:
+            f.write(record + "\n")
+    except OSError as e:
+        log_event("sufficiency_log_error", error=str(e))
+
+
+def decision_stats() -> dict:
+    with _lock:
+        return {f"{kind}:{path}:{'sufficient' if ok else 'insufficient'}": n for (kind, path, ok), n in decision_counts.items()}
@@ -0,0 +1,67 @@
+import os
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage, SystemMessage, BaseMessage
+from typing_extensions import List
+
+load_dotenv()
+
+# Messages always passed verbatim to the nodes; older ones are folded into the summary
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "6"))
+# Refresh the summary once this many turns have aged out of the recent window...
+SUMMARY_EVERY_TURNS = int(os.getenv("SUMMARY_EVERY_TURNS", "4"))
+# ...or earlier, when the aged-out messages exceed this many (estimated) tokens
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "1500"))
+# Target length of the summary, stated in the summarizer prompt
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough to decide when to summarize
+    return len(text) // 4 + 1
+
+
+def message_text(message: BaseMessage) -> str:
+    role = "User" if isinstance(message, HumanMessage) else "Assistant"
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return f"{role}: {content}"
+
+
+def pending_messages(messages: List[BaseMessage], summarized_count: int) -> List[BaseMessage]:
+    """Messages older than the recent window that are not in the summary yet"""
+    end = max(summarized_count, len(messages) - SUMMARY_KEEP_RECENT)
+    return messages[summarized_count:end]
+
+
+def should_summarize(messages: List[BaseMessage], summarized_count: int) -> bool:
+    pending = pending_messages(messages, summarized_count)
+    if not pending:
+        return False
+    if len(pending) >= SUMMARY_EVERY_TURNS * 2:
+        return True
+    return sum(estimate_tokens(message_text(m)) for m in pending) > SUMMARY_TOKEN_BUDGET
+
+
+def summary_messages(summary: str, pending: List[BaseMessage]) -> List[BaseMessage]:
+    """Incremental update: the previous summary plus the newly aged-out turns"""
+    transcript = "\n\n".join(message_text(m) for m in pending)
+    prompt = f"""
+    Current summary of the conversation:
+    {summary or "(empty)"}
+
+    New messages:
+    {transcript}
+
+    Update the summary with the new messages. Keep the user's goals, decisions, constraints,
+    languages and libraries in use, and the names of functions/classes that were written or
+    reviewed. Drop greetings and code bodies. Answer with the updated summary only, in at
+    most {SUMMARY_MAX_TOKENS * 3 // 4} words.
+    """
+    return [
+        SystemMessage(content="You maintain a running summary of a conversation with a coding assistant."),
+        HumanMessage(content=prompt)
+    ]
+
+
+def recent_messages(messages: List[BaseMessage], summarized_count: int, max_messages: int) -> List[BaseMessage]:
+    """The last `max_messages` messages that are not covered by the summary"""
+    return messages[max(summarized_count, len(messages) - max_messages):]
@@ -20,6 +20,17 @@ import { useNavigate } from 'react-router-dom';
 // Get backend URL from environment variables (Vite uses VITE_ prefix)
 const BACKEND_URL = "https://coder-kohl-eight.vercel.app";
 
+// The backend identifies the caller by the login token, not by email
+const authHeaders = () => ({ Authorization: `Bearer ${localStorage.getItem("token")}` })
+
+// Threads arrive most recently active first; fall back to the id when there is no title
+const toChats = (threads) =>
+  threads.map((thread) => ({
+    id: thread.thread_id,
+    thread_id: thread.thread_id,
+    title: thread.title || thread.thread_id,
+  }))
+
 // Enhanced Navbar Component for Chat
 const ChatNavbar = ({ onToggleSidebar, onLogout, scrollY, isScrolling }) => {
   return (
@@ -109,6 +120,9 @@ export default function Chat() {
   const [isLoadingHistory, setIsLoadingHistory] = useState(false)
   const [isSending, setIsSending] = useState(false)
   const [showLogoutToast, setShowLogoutToast] = useState(false)
+  // Cursor of the next page of threads; null once every thread is listed
+  const [threadsCursor, setThreadsCursor] = useState(null)
+  const [isLoadingThreads, setIsLoadingThreads] = useState(false)
   const messagesEndRef = useRef(null)
   const inputRef = useRef(null)
     const navigate = useNavigate();
@@ -136,20 +150,21 @@ export default function Chat() {
         const user = JSON.parse(storedUser)
         setUserProfile(user)
 
-        const response = await fetch(`${BACKEND_URL}/chat/threads?email=${user.email}`)
+        const response = await fetch(`${BACKEND_URL}/chat/threads`, { headers: authHeaders() })
+        if (response.status === 401) {
+          // Expired or missing token: sign in again
+          localStorage.removeItem("token")
+          localStorage.removeItem("user")
+          navigate("/login")
+          return
+        }
         if (!response.ok) throw new Error("Failed to fetch threads")
 
         const data = await response.json()
-        const threadIds = data.thread_ids || []
-
-        // Just use thread_id as both id and display text - reverse the order
-        const chats = threadIds.reverse().map((thread_id) => ({
-          id: thread_id,
-          thread_id,
-          title: thread_id, // Display thread_id
-        }))
+        const chats = toChats(data.threads || [])
 
         setChatHistory(chats)
+        setThreadsCursor(data.next_cursor || null)
 
         if (chats.length > 0 && !activeChat) {
           const first = chats[0]
@@ -164,12 +179,37 @@ export default function Chat() {
     fetchData()
   }, [activeChat])
 
+  // Next page of threads, appended below the ones already listed
+  const loadMoreThreads = async () => {
+    if (!threadsCursor || isLoadingThreads) return
+
+    setIsLoadingThreads(true)
+    try {
+      const response = await fetch(`${BACKEND_URL}/chat/threads?cursor=${encodeURIComponent(threadsCursor)}`, {
+        headers: authHeaders(),
+      })
+      if (!response.ok) throw new Error("Failed to fetch threads")
+
+      const data = await response.json()
+      const chats = toChats(data.threads || [])
+      setChatHistory((prev) => {
+        const known = new Set(prev.map((chat) => chat.id))
+        return [...prev, ...chats.filter((chat) => !known.has(chat.id))]
+      })
+      setThreadsCursor(data.next_cursor || null)
+    } catch (error) {
+      console.error("Error fetching threads:", error)
+    } finally {
+      setIsLoadingThreads(false)
+    }
+  }
+
  const loadChatHistory = async (threadId) => {
   if (!threadId || !userProfile?.email) return
 
   setIsLoadingHistory(true)
   try {
-    const response = await fetch(`${BACKEND_URL}/chat/history/${threadId}?email=${userProfile.email}`)
+    const response = await fetch(`${BACKEND_URL}/chat/history/${threadId}`, { headers: authHeaders() })
     if (!response.ok) throw new Error("Failed to load chat history")
 
     const data = await response.json()
@@ -307,18 +347,33 @@ export default function Chat() {
 
     try {
       const requestBody = {
-        email: userProfile.email,
         message: currentMessage,
         ...(currentThreadId && { thread_id: currentThreadId }), // Only include thread_id if it exists
       }
 
-      const response = await fetch(`${BACKEND_URL}/chat`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify(requestBody),
-      })
+      // One key per message: a retry of this send is answered from the original run
+      const idempotencyKey = crypto.randomUUID()
+      const sendOnce = () =>
+        fetch(`${BACKEND_URL}/chat`, {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            "Idempotency-Key": idempotencyKey,
+            ...authHeaders(),
+          },
+          body: JSON.stringify(requestBody),
+        })
+
+      let response
+      try {
+        response = await sendOnce()
+      } catch (networkError) {
+        // Dropped connection: safe to resend, the backend deduplicates by key
+        response = await sendOnce()
+      }
+      if ([502, 503, 504].includes(response.status)) {
+        response = await sendOnce()
+      }
 
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`)
@@ -463,6 +518,15 @@ export default function Chat() {
                     onDelete={() => deleteChat(chat.id)}
                   />
                 ))}
+                {threadsCursor && (
+                  <button
+                    onClick={loadMoreThreads}
+                    disabled={isLoadingThreads}
+                    className="w-full p-2 text-sm text-slate-600 hover:bg-slate-100 rounded-lg transition-colors disabled:opacity-50"
+                  >
+                    {isLoadingThreads ? "Loading..." : "Load more"}
+                  </button>
+                )}
               </div>
             </div>
 